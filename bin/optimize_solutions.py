@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# Replay the stored solutions and keep shorter versions of them
+#
+#   bin/optimize_solutions.py [--jobs N] [prob-001 ...]
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from optimizer import optimize_all
+from runner import list_problems
+
+parser = argparse.ArgumentParser()
+parser.add_argument('problems', nargs='*')
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+args = parser.parse_args()
+
+results = optimize_all(args.problems or list_problems(), jobs=args.jobs)
+print(f"{sum(1 for result in results if result.improved)} of {len(results)} solutions improved")
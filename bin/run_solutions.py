@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Parallel replacement for run_solutions.pl
+#
+#   bin/run_solutions.py [--script SCRIPT] [--jobs N] [--timeout SECONDS] [--resume] [--stats] [prob-001 ...]
+#   bin/run_solutions.py --portfolio [--seeds N] [--jobs N] [--timeout SECONDS] [--stats] [prob-001 ...]
+#
+# Problems are names like prob-001 or paths to .desc files, all of them when
+# none are given. --script picks the bot (default nearest_with_manips.py),
+# --portfolio runs all the bots from runner.default_portfolio on every problem
+# instead and keeps the best, the score file then names the winning strategy.
+#
+# Bots stream their moves to solutions/tmp/ as they go. --resume makes them
+# continue from there, e.g. after a timeout on a big map.
+#
+# --stats profiles every run into solutions/stats/<time>/ and prints the hot
+# spots over all problems at the end (see metrics.py).
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from metrics import hot_spots
+from runner import (SOLUTIONS_DIR, aggregate_stats, default_portfolio, list_problems, run_all, run_portfolio,
+                    write_scores)
+from scorer import save_scores
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--script', default='./bots/nearest_with_manips.py')
+parser.add_argument('problems', nargs='*')
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+parser.add_argument('--timeout', type=float, default=None)
+parser.add_argument('--portfolio', action='store_true')
+parser.add_argument('--seeds', type=int, default=3)
+parser.add_argument('--resume', action='store_true')
+parser.add_argument('--stats', action='store_true')
+args = parser.parse_args()
+
+problems = args.problems or list_problems()
+stats_dir = None
+if args.stats:
+    stats_dir = os.path.join(SOLUTIONS_DIR, 'stats', time.strftime('%Y-%m-%d-%H-%M-%S'))
+    os.makedirs(stats_dir, exist_ok=True)
+if args.portfolio:
+    results = run_portfolio(default_portfolio(args.seeds), problems, jobs=args.jobs, timeout=args.timeout,
+                            stats_dir=stats_dir)
+else:
+    results = run_all(args.script, problems, jobs=args.jobs, timeout=args.timeout, resume=args.resume,
+                      stats_dir=stats_dir)
+if stats_dir is not None:
+    print('\n'.join(hot_spots(aggregate_stats(stats_dir))))
+
+score_file = os.path.join(SOLUTIONS_DIR, time.strftime('%Y-%m-%d-%H-%M-%S') + '_score.csv')
+write_scores(results, score_file)
+
+# promote() replayed every candidate before it could replace the best, the
+# database keeps those replays and which bot made them
+bot = os.path.splitext(os.path.basename(args.script))[0]
+save_scores([result.score._replace(bot=result.strategy or bot) for result in results if result.score is not None])
+for result in results:
+    if result.status == 'Invalid':
+        print(f"{result.problem}: invalid solution from {result.strategy or bot}, {result.score.status},"
+              f" kept the old best")
+print(f"Wrote {score_file}, {sum(1 for result in results if result.improved)} improved")
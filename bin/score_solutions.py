@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+# Replay .sol files and record their scores in solutions/scores.sqlite
+#
+#   bin/score_solutions.py [--bot NAME] [--jobs N] [path.sol ...]
+#
+# Without paths every file in solutions/ and solutions/tmp/ is scored, files
+# that did not change since the last run are skipped.
+
+import argparse
+import glob
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from runner import SOLUTIONS_DIR
+from scorer import best_scores, score_files
+
+parser = argparse.ArgumentParser()
+parser.add_argument('paths', nargs='*')
+parser.add_argument('--bot', default='unknown')
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+args = parser.parse_args()
+
+paths = args.paths or sorted(glob.glob(os.path.join(SOLUTIONS_DIR, 'prob-*.sol')) +
+                             glob.glob(os.path.join(SOLUTIONS_DIR, 'tmp', 'prob-*.sol')))
+scores = score_files([(os.path.abspath(path), args.bot) for path in paths], jobs=args.jobs)
+invalid = [score for score in scores if not score.valid]
+best = best_scores()
+print(f"Scored {len(scores)} files, {len(invalid)} invalid;"
+      f" {len(best)} problems solved, {sum(steps for steps, bot in best.values())} steps in total")
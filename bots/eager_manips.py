@@ -1,121 +1,66 @@
 #!/usr/bin/env python
 
+import os
 import sys
 sys.path.append('lib/')
-import json
-import numpy as np
-import subprocess
-import random
-
-def manhattan_distance(loc_from, loc_to):
-    # print("manhattan_distance", loc_from, loc_to)
-    return abs(loc_from[0] - loc_to[0]) + abs(loc_from[1] - loc_to[1])
-
-def sort_by_distance_from(locs, loc_from):
-    locs.sort(key = lambda loc: manhattan_distance(loc_from, loc))
-
-def engine_command_raw(engine, command_data):
-    engine.stdin.write(command_data.encode())
-    result = engine.stdout.readline().decode()
-    data = json.loads(result)
-    return data
-
-def engine_command_exit(engine):
-    engine.stdin.write(b'{ "cmd": "exit" }\n')
-    # engine.stdin.write(json.dumps({"cmd", "exit"}).encode())
-    # engine.stdin.write(b"\n")
-
-def engine_command(engine, command_data):
-    engine.stdin.write(json.dumps(command_data).encode())
-    result = engine.stdout.readline().decode()
-    data = json.loads(result)
-    return data
-
-def engine_command_add_manipulator(engine, coords):
-    final_moves.append('B(' + ','.join(map(str, coords)) + ')')
-    return engine_command(engine, { "cmd": "action", "action": f"B({','.join(map(str, coords))})"})
-
-def get_path_commands(engine, target):
-    data = engine_command(engine, { 'cmd': 'get_path', 'target': target })
+from engine import Engine
+from task import load_task
+
+next_manip_pos = [
+    [1,2],
+    [1,-2],
+    [0,2],
+    [0,-2],
+    [-1,2],
+    [-1,-2],
+    [-1,1],
+    [-1,-1],
+    [-1,0],
+]
+
+def manip_action(coords):
+    return 'B(' + ','.join(map(str, coords)) + ')'
+
+def get_best_path_commands(engine):
+    # One flood fill in the engine finds the closest unwrapped cell or
+    # manipulator booster by real path length
+    data = engine.get_nearest(unwrapped=True, boosters=['B'])
     return data["path_commands"]
 
-def get_best_loc(engine, cur_loc, locs, boosters):
-    # print("get_closest loc boosters:", boosters)
-    manips = [booster[0:2] for booster in boosters if booster[2] == "B"]
-    locs = locs + manips
-    # print("locs", locs)
-    sort_by_distance_from(locs, cur_loc)
-    # print("sorted locs", locs)
-
-    locs = locs[0:50]
-    path_lengths = [ len(get_path_commands(engine, loc)) for loc in locs ]
-    # print("path lengths", path_lengths)
-    return locs[ path_lengths.index( min( path_lengths ) ) ]
-
-    # closest_loc = locs.pop(0)
-    # for loc in locs:
-    #     # print(f"Looking at distance for loc {loc} to see if it is less than {closest_loc}")
-    #     if manhattan_distance(cur_loc, loc) < manhattan_distance(cur_loc, closest_loc):
-    #         closest_loc = loc
-
-    return closest_loc
-
-def create_engine():
-    return subprocess.Popen(
-        './game_engine/engine.native',
-        stdout=subprocess.PIPE,
-        stdin=subprocess.PIPE,
-        bufsize=0)
-
-if __name__ == "__main__":
-    engine = create_engine()
-
-    problem = 'prob-001.desc'
-    if len(sys.argv) > 1: problem = sys.argv[1]
-
-    # Initialize the engine with the task json. Ignore the results
-    task_json = subprocess.check_output(
-            ["./bin/parse-task", f'./data/{problem}'],
-            universal_newlines=True)
-    engine_command_raw(engine, task_json)
-
-    data = engine_command(engine, { "cmd": "get_state" })
-    unwrapped = data["unwrapped_cells"]
-    cur_loc = data["bot_position"]
-    final_moves = []
-    next_manip_pos = [
-        [1,2],
-        [1,-2],
-        [0,2],
-        [0,-2],
-        [-1,2],
-        [-1,-2],
-        [-1,1],
-        [-1,-1],
-        [-1,0],
-    ]
-
-    while len(unwrapped) != 0:
-        next_loc = get_best_loc(engine, cur_loc, unwrapped, data["boosters"])
-        path_commands = get_path_commands(engine, next_loc)
-        for move in path_commands:
-            final_moves.append(move)
-            data = engine_command(engine, { "cmd": "action", "action": move})
+def solve(engine, debug=False):
+    # A resumed run may have attached some already
+    manip_pos = [list(coords) for coords in next_manip_pos
+                 if list(coords) not in engine.workers[0]["manipulators"]]
+
+    while len(engine.unwrapped) != 0:
+        with engine.phase('target'):
+            path_commands = get_best_path_commands(engine)
+        if len(path_commands) == 0:
+            print("####### ERROR: nothing reachable left ######", file=sys.stderr)
+            break
+        while len(path_commands) > 0:
+            # Stop after picking something up so we can attach manipulators right away
+            data = engine.do_moves(path_commands, stop_on_pickup=True)
+            path_commands = path_commands[data["executed"]:]
             if data["status"] == 'error: Invalid state':
-                print("####### ERROR: invalid state ######")
-                exit()
-            if 'B' in data["inventory"] and len(next_manip_pos) > 0:
-                # attach manipulator, ignore result
-                coords = next_manip_pos.pop(0)
-                engine_command_add_manipulator(engine, coords)
+                print("####### ERROR: invalid state ######", file=sys.stderr)
+                sys.exit(1)
+            if data["status"] == 'WIN':
+                break
+            if 'B' in engine.inventory and len(manip_pos) > 0:
+                engine.action(manip_action(manip_pos.pop(0)))
 
-        # update values now
-        unwrapped = data["unwrapped_cells"]
-        print(len(unwrapped), file=sys.stderr)
-        print(data["state_string"], file=sys.stderr)
-        cur_loc = data["workers"][0]["position"]
+        print(len(engine.unwrapped), file=sys.stderr)
+        if debug:
+            print(engine.get_state_string()["state_string"], file=sys.stderr)
 
-    print(''.join(final_moves))
-    engine_command_exit(engine)
+    return engine.solution()
 
+if __name__ == "__main__":
+    problems = sys.argv[1:] or ['prob-001.desc']
 
+    # One engine process is reused for every problem given
+    with Engine() as engine:
+        for problem in problems:
+            engine.load(load_task(problem))
+            print(solve(engine, debug=os.environ.get("DEBUG")))
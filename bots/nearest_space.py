@@ -2,20 +2,12 @@
 
 import sys
 sys.path.append('lib/')
-import json
-import numpy as np
-import subprocess
-import random
+from engine import Engine
+from task import load_task
 
 def get_closest_loc(cur_loc, locs):
-    closest_loc = locs.pop(0)
-
-    for loc in locs:
-        if abs(cur_loc[0] - loc[0]) + abs(cur_loc[1] - loc[1]) < abs(cur_loc[0] - closest_loc[0]) + abs(cur_loc[1] - closest_loc[1]):
-            closest_loc = loc
-
-
-    return closest_loc
+    # Linear scan, the bots ask engine.nearest_unwrapped() instead
+    return min(locs, key=lambda loc: abs(cur_loc[0] - loc[0]) + abs(cur_loc[1] - loc[1]))
 
 mv_cmds = {
     'pos_y': 'W',
@@ -39,69 +31,21 @@ def get_next_move(cur_loc, next_loc):
     return move
 
 if __name__ == "__main__":
-    engine = subprocess.Popen(
-        './game_engine/engine.native',
-        stdout=subprocess.PIPE,
-        stdin=subprocess.PIPE,
-        bufsize=0)
-
     problem = 'prob-001.desc'
     if len(sys.argv) > 1: problem = sys.argv[1]
-    task_json = subprocess.check_output(["./bin/parse-task", f'./data/{problem}'], universal_newlines=True)
-
-    engine.stdin.write(task_json.encode())
-    engine.stdin.write(b'\n')
-    result = engine.stdout.readline()
-#    print(result.decode())
-
-    engine.stdin.write(b'{ "cmd": "get_state" }\n')
-    result = engine.stdout.readline()
-#    print(result.decode())
-
-    data = json.loads(result.decode())
-#    map_list = data["map"]
-    unwrapped = data["unwrapped_cells"]
-    old_uw_cnt = len(unwrapped)
-    new_uw_cnt = 0
-    dirs = ['W', 'S', 'D', 'A']
-    cur_loc = data["bot_position"]
-    status = data["status"]
-    final_moves = []
-
-    #np_map = np.array(map_list)
-    #np.set_printoptions(threshold=sys.maxsize, linewidth=1000)
-    #print("Shape: " + str(np_map.shape))
-    #print(np_map)
-    #print("\n\nunwrapped:")
-    #print(unwrapped)
 
-    cnt = 0
-    stop_rnd_cnt = 10
-    use_longest = True
-    while len(unwrapped) != 0:
-        next_loc = get_closest_loc(cur_loc, unwrapped)
-        #print('{ "cmd": "get_path", "target": [' + str(next_loc[0]) + ',' + str(next_loc[1]) + '] }\n')
-        engine.stdin.write(('{ "cmd": "get_path", "target": [' + str(next_loc[0]) + ',' + str(next_loc[1]) + '] }\n').encode())
-        result = engine.stdout.readline()
-        data = json.loads(result.decode())
-    #    print(data)
-        for move in data["path_commands"]:
-            final_moves.append(move)
-            engine.stdin.write(('{ "cmd": "action", "action": "' + str(move) + '" }\n').encode())
-            result = engine.stdout.readline()
-            data = json.loads(result.decode())
-            if data["status"] == 'error: Invalid state' : print("####### ERROR: invalid state ######")
-            #print(data)
+    engine = Engine()
+    engine.load(load_task(problem))
 
-        #print(data)
-        # update values now
-        unwrapped = data["unwrapped_cells"]
-        print(len(unwrapped), file=sys.stderr)
-        cur_loc = data["workers"][0]["position"]
-#        print("\n\n")
+    while len(engine.unwrapped) != 0:
+        next_loc = engine.nearest_unwrapped()[0][1]
+        data = engine.do_moves(engine.get_path(next_loc))
+        if data["status"] == 'error: Invalid state':
+            print("####### ERROR: invalid state ######", file=sys.stderr)
+            sys.exit(1)
 
-#    print("\n")
-    engine.stdin.write(b'{ "cmd": "exit" }\n')
+        print(len(engine.unwrapped), file=sys.stderr)
 
-    print(''.join(final_moves))
+    engine.close()
 
+    print(engine.solution())
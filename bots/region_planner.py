@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Multi worker bot: collect the clone boosters, clone on a spawn point, then
+# split the unwrapped area into one connected region per worker. Each worker
+# greedily wraps the closest cell of its own region, a worker that runs out
+# takes half of the biggest region left.
+
+import os
+import sys
+from collections import deque
+sys.path.append('lib/')
+import numpy as np
+from engine import Engine
+from regions import balanced_flood, bfs_path, partition
+from solution import path_to_actions
+from task import load_grid, load_task, walkable
+
+next_manip_pos = [
+    [1,2],
+    [1,-2],
+    [0,2],
+    [0,-2],
+    [-1,2],
+    [-1,-2],
+    [-1,1],
+    [-1,-1],
+    [-1,0],
+]
+
+# Below this many cells left in the biggest region it is not worth splitting
+# it, idle workers help out on any unwrapped cell instead
+REBALANCE_MIN = 16
+
+def manip_action(coords):
+    return 'B(' + ','.join(map(str, coords)) + ')'
+
+def go(engine, path_commands):
+    # Only used while there is a single worker, so do_moves is fine
+    while len(path_commands) > 0:
+        data = engine.do_moves(path_commands, stop_on_pickup=True)
+        path_commands = path_commands[data["executed"]:]
+        if data["status"].startswith("error") or data["status"] == 'WIN':
+            return
+
+def spawn_clones(engine):
+    # Pick up every clone booster, then clone them all on the closest spawn point
+    while any(booster[2] == 'C' for booster in engine.boosters):
+        path_commands = engine.get_nearest(boosters=['C'])["path_commands"]
+        if len(path_commands) == 0:
+            break
+        go(engine, path_commands)
+    if 'C' not in engine.inventory:
+        return
+    go(engine, engine.get_nearest(boosters=['X'])["path_commands"])
+    while 'C' in engine.inventory and engine.status == 'OK':
+        engine.tick(['C'])
+
+class Planner:
+    def __init__(self, engine, grid):
+        self.engine = engine
+        self.walk = walkable(np.asarray(grid))
+        workers = len(engine.workers)
+
+        # Start from the current state of the map, not the task
+        current = np.zeros(self.walk.shape, dtype=bool)
+        for cell in engine.unwrapped:
+            current[cell] = True
+        self.owner = partition(self.walk, current, workers)
+        self.remaining = [set() for worker in range(workers)]
+        for cell in engine.unwrapped:
+            if self.owner[cell] >= 0:
+                self.remaining[self.owner[cell]].add(cell)
+
+        self.plans = [deque() for worker in range(workers)]
+        self.targets = [None] * workers
+        self.manip_pos = [[list(coords) for coords in next_manip_pos] for worker in range(workers)]
+
+    def position(self, worker):
+        return tuple(self.engine.workers[worker]["position"])
+
+    def rebalance(self, worker):
+        # Take over the far half of the biggest region that is left
+        other = max(range(len(self.remaining)), key=lambda i: len(self.remaining[i]))
+        if len(self.remaining[other]) < REBALANCE_MIN:
+            return
+        targets = np.zeros(self.walk.shape, dtype=bool)
+        for cell in self.remaining[other]:
+            targets[cell] = True
+        split = balanced_flood(self.walk, targets, [self.position(other), self.position(worker)])
+        moved = set(cell for cell in self.remaining[other] if split[cell] == 1)
+        self.remaining[other] -= moved
+        self.remaining[worker] = moved
+        for cell in moved:
+            self.owner[cell] = worker
+
+    def plan(self, worker):
+        if len(self.remaining[worker]) == 0:
+            self.rebalance(worker)
+        targets = self.remaining[worker] or self.engine.unwrapped
+        path = bfs_path(self.walk, self.position(worker), lambda cell: cell in targets)
+        if path is None:
+            self.targets[worker] = None
+            return deque()
+        self.targets[worker] = path[-1]
+        return deque(path_to_actions(path))
+
+    def next_action(self, worker, attaching):
+        if not attaching and 'B' in self.engine.inventory and len(self.manip_pos[worker]) > 0:
+            return manip_action(self.manip_pos[worker].pop(0))
+        if len(self.plans[worker]) == 0 or self.targets[worker] not in self.engine.unwrapped:
+            self.plans[worker] = self.plan(worker)
+        if len(self.plans[worker]) == 0:
+            return None
+        return self.plans[worker].popleft()
+
+    def step(self):
+        # The inventory is shared, so only one worker attaches per tick
+        actions = []
+        for worker in range(len(self.plans)):
+            attaching = any(action and action.startswith('B') for action in actions)
+            actions.append(self.next_action(worker, attaching))
+        if all(action is None for action in actions):
+            return False
+        data = self.engine.tick(actions)
+        if data["status"].startswith("error"):
+            print("####### ERROR: " + data["status"] + " ######", file=sys.stderr)
+            sys.exit(1)
+        for cell in data["wrapped_cells"]:
+            cell = tuple(cell)
+            if self.owner[cell] >= 0:
+                self.remaining[self.owner[cell]].discard(cell)
+        return True
+
+def solve(engine, grid, debug=False):
+    spawn_clones(engine)
+    planner = Planner(engine, grid)
+    while len(engine.unwrapped) != 0:
+        if not planner.step():
+            print("####### ERROR: nothing reachable left ######", file=sys.stderr)
+            break
+        if debug:
+            print(len(engine.unwrapped), [len(cells) for cells in planner.remaining], file=sys.stderr)
+    return engine.solution()
+
+if __name__ == "__main__":
+    problems = sys.argv[1:] or ['prob-221.desc']
+
+    with Engine() as engine:
+        for problem in problems:
+            engine.load(load_task(problem))
+            print(solve(engine, load_grid(problem), debug=os.environ.get("DEBUG")))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Coverage bot: decompose the free space into boustrophedon cells, visit the
+# cells in a short tour and sweep each one in vertical lanes as wide as the
+# manipulator arm. Whatever a lane misses (arms blocked by obstacles, ragged
+# cell edges) is picked up greedily before moving on to the next lane.
+#
+# This does best on open maps. On maps full of small obstacles the cells get
+# small and eager_manips.py usually wins.
+
+import os
+import sys
+sys.path.append('lib/')
+import numpy as np
+from coverage import cell_center, decompose, fill_small_holes, tour
+from engine import Engine
+from task import load_grid, load_task, walkable
+
+# The bot faces up while sweeping, so the arm is the row in front of it
+# (dy = 1) and every attach makes it one cell wider, alternating sides
+next_manip_pos = [
+    [2,1],
+    [-2,1],
+    [3,1],
+    [-3,1],
+    [4,1],
+    [-4,1],
+    [5,1],
+    [-5,1],
+]
+
+# Obstacles up to this many cells do not split the sweep into more cells
+HOLE_SIZE = 64
+
+def manip_action(coords):
+    return 'B(' + ','.join(map(str, coords)) + ')'
+
+class Sweeper:
+    def __init__(self, engine, grid):
+        self.engine = engine
+        self.walk = walkable(np.asarray(grid))
+        self.manip_pos = [list(coords) for coords in next_manip_pos]
+
+    def attach(self):
+        while 'B' in self.engine.inventory and len(self.manip_pos) > 0:
+            self.engine.action(manip_action(self.manip_pos.pop(0)))
+
+    def run(self, path_commands):
+        while len(path_commands) > 0:
+            data = self.engine.do_moves(path_commands, stop_on_pickup=True)
+            path_commands = path_commands[data["executed"]:]
+            if data["status"] == 'WIN':
+                return
+            if data["status"].startswith("error"):
+                raise RuntimeError(data["status"])
+            self.attach()
+
+    def go(self, target):
+        if tuple(self.engine.position) != tuple(target):
+            self.run(self.engine.get_path(target))
+
+    def arm_span(self):
+        # Columns the arm covers relative to the bot, the contiguous run of
+        # manipulators in the row ahead that includes the bot's own column
+        xs = set(dx for dx, dy in self.engine.workers[0]["manipulators"] if dy == 1)
+        lo = hi = 0
+        while lo - 1 in xs:
+            lo -= 1
+        while hi + 1 in xs:
+            hi += 1
+        return lo, hi
+
+    def collect_manipulators(self):
+        while any(booster[2] == 'B' for booster in self.engine.boosters) and len(self.manip_pos) > 0:
+            path_commands = self.engine.get_nearest(boosters=['B'])["path_commands"]
+            if len(path_commands) == 0:
+                break
+            self.run(path_commands)
+
+    def lane_work(self, columns, x0, x1):
+        unwrapped = self.engine.unwrapped
+        return [(x, y) for x in range(x0, x1 + 1) if x in columns
+                for y in range(columns[x][0], columns[x][1] + 1) if (x, y) in unwrapped]
+
+    def finish_lane(self, columns, x0, x1):
+        # Cells the lane missed are close by now, much cheaper to get than
+        # in the clean up at the end
+        while self.engine.status == 'OK':
+            left = self.lane_work(columns, x0, x1)
+            if len(left) == 0:
+                return
+            path_commands = self.engine.get_nearest(targets=left)["path_commands"]
+            if len(path_commands) == 0:
+                return
+            self.run(path_commands)
+
+    def sweep_cell(self, cell):
+        columns = { x: (y0, y1) for x, y0, y1 in cell }
+        first, last = cell[0][0], cell[-1][0]
+        x = self.engine.position[0]
+        step = 1 if abs(x - first) <= abs(x - last) else -1
+        c = first if step == 1 else last
+        while first <= c <= last:
+            lo, hi = self.arm_span()
+            width = hi - lo + 1
+            if step == 1:
+                x0, x1, lane = c, c + width - 1, c - lo
+            else:
+                x0, x1, lane = c - width + 1, c, c - hi
+            lane = min(max(lane, first), last)
+            if len(self.lane_work(columns, x0, x1)) > 0:
+                # Small obstacles inside the lane were filled in for the
+                # decomposition, only walk to cells we can stand on
+                y0, y1 = columns[lane]
+                ys = [y for y in range(y0, y1 + 1) if self.walk[lane, y]]
+                if len(ys) > 0:
+                    y = self.engine.position[1]
+                    start, end = (ys[0], ys[-1]) if abs(y - ys[0]) <= abs(y - ys[-1]) else (ys[-1], ys[0])
+                    self.go((lane, start))
+                    self.go((lane, end))
+                self.finish_lane(columns, x0, x1)
+                if self.engine.status == 'WIN':
+                    return
+            c += step * width
+
+    def clean_up(self):
+        while len(self.engine.unwrapped) != 0:
+            path_commands = self.engine.get_nearest(unwrapped=True)["path_commands"]
+            if len(path_commands) == 0:
+                print("####### ERROR: nothing reachable left ######", file=sys.stderr)
+                break
+            self.run(path_commands)
+
+    def solve(self, debug=False):
+        # Face up, the arm then sweeps sideways while we move along a column
+        self.engine.action('Q')
+        self.collect_manipulators()
+        with self.engine.phase('plan'):
+            cells = decompose(fill_small_holes(self.walk, HOLE_SIZE))
+            order = tour([cell_center(cell) for cell in cells], self.engine.position)
+        for i in order:
+            if self.engine.status == 'WIN':
+                break
+            with self.engine.phase('sweep'):
+                self.sweep_cell(cells[i])
+            if debug:
+                print(len(self.engine.unwrapped), file=sys.stderr)
+        with self.engine.phase('clean_up'):
+            self.clean_up()
+        return self.engine.solution()
+
+if __name__ == "__main__":
+    problems = sys.argv[1:] or ['prob-001.desc']
+
+    with Engine() as engine:
+        for problem in problems:
+            engine.load(load_task(problem))
+            print(Sweeper(engine, load_grid(problem)).solve(debug=os.environ.get("DEBUG")))
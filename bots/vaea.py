@@ -1,23 +1,22 @@
 #!/usr/bin/env python3
-import subprocess
 import sys
-import json
+sys.path.append('lib/')
+import os
 import random
+from engine import Engine
+from target_index import TargetIndex
+from task import load_task
 
-engine = subprocess.Popen(
-    './game_engine/engine.native',
-    stdout=subprocess.PIPE,
-    stdin=subprocess.PIPE,
-    bufsize=0)
+# The portfolio runner tries several seeds, VAEA_SEED makes a run repeatable
+random.seed(int(os.environ.get('VAEA_SEED', 42)))
+
+# Actions only report what changed, we keep our own map up to date from them
+engine = Engine(framing='json')
 
 maxmoves = 100000
 prob = sys.argv[1]
-task_json = subprocess.check_output(["./bin/parse-task", "./data/" + prob + ".desc"], universal_newlines=True)
 print ("Loading game " + prob)
-engine.stdin.write(task_json.encode())
-engine.stdin.write(b'\n')
-result = engine.stdout.readline()
-print(result.decode())
+engine.load(load_task(prob))
 
 manipulators = {
     "D": [[1, 0], [1, 1], [1, -1]],
@@ -102,22 +101,12 @@ def move(pos, dir):
         return queued_moves.pop(0)
     queued_moves.clear()
     # lets look for somewhere to go
-    nearest = unwrapped_cells[0]
-    nearest_diff = abs(pos[0] - nearest[0]) + abs(pos[1] - nearest[1])
-    for i in unwrapped_cells:
-        #print("Comparing " + str(pos) + " with " + str(i))
-        diff = abs(pos[0] - i[0]) + abs(pos[1] - i[1])
-        if diff < nearest_diff:
-            nearest = i
-            nearest_diff = diff
-
-    engine.stdin.write(
-        ('{ "cmd": "get_path", "target": [' + str(nearest[0]) + ',' + str(nearest[1]) + '] }\n').encode())
-    res = engine.stdout.readline()
-    d = json.loads(res.decode())
+    nearest_diff, nearest = unwrapped_cells.nearest(pos)[0]
+
+    path_commands = engine.get_path(nearest)
     queued_pt = nearest
-    print("Nearest: " + str(nearest) + " - " + str(nearest_diff) + " Distance: " + str(len(d["path_commands"])))
-    for m in d["path_commands"][0:random.randrange(15) + 1]:
+    print("Nearest: " + str(nearest) + " - " + str(nearest_diff) + " Distance: " + str(len(path_commands)))
+    for m in path_commands[0:random.randrange(15) + 1]:
         queued_moves.append(m)
 
     #print("Queued up: " + str(queued_moves))
@@ -132,7 +121,6 @@ def move_random(pos):
     print("Possible Moves: " + str(possible))
     choice_index = random.randrange(len(possible))
     m = possible[choice_index]
-    moves.append(m)
     pt = [pos[0] + dir_pos[m][0], pos[1] + dir_pos[m][1]]
     print("Moving to " + str(pt))
     print("Move: " + possible[choice_index])
@@ -168,8 +156,7 @@ direction = 'D'
 state_string = ''
 current = [0,0]
 mapList = []
-unwrapped_cells = []
-moves = []
+unwrapped_cells = TargetIndex()
 orientation = '>'
 inventory = []
 boosters = []
@@ -178,13 +165,25 @@ orientation_map = {">": 'D', "<": 'A', "^": 'W', "v": "S"}
 def unpack_state(data):
     global mapList, unwrapped_cells, state_string, current, orientation, boosters, inventory
     mapList = data["map"]
-    unwrapped_cells = data["unwrapped_cells"]
+    unwrapped_cells = TargetIndex(data["unwrapped_cells"])
     #state_string = data["state_string"]
     current = data["bot_position"]
     orientation = data["workers"][0]["orientation"]
     boosters = data["boosters"]
     inventory = data["inventory"]
 
+def apply_delta(data):
+    global current, orientation, inventory
+    for x, y in data["wrapped_cells"]:
+        mapList[x][y] = "+"
+        unwrapped_cells.discard((x, y))
+    for booster in data["boosters_removed"]:
+        if booster in boosters:
+            boosters.remove(booster)
+    current = data["bot_position"]
+    orientation = data["workers"][0]["orientation"]
+    inventory = data["inventory"]
+
 next_manip_pos = [
     [1,2],
     [1,-2],
@@ -196,44 +195,38 @@ next_manip_pos = [
     [-1,-1],
     [-1,0],
 ]
-engine.stdin.write(b'{ "cmd": "get_state" }\n')
-result = engine.stdout.readline()
-print(result.decode())
-data = json.loads(result.decode())
+data = engine.get_state()
 unpack_state(data)
 #print(data['state_string'])
 
 print("there are " + str(len(unwrapped_cells)) + " tiles to paint\n")
-while len(moves) < maxmoves:
+while engine.move_count < maxmoves:
 
     if 'B' in inventory and len(next_manip_pos) > 0:
         coords = next_manip_pos.pop(0)
-        moves.append('B(' + ','.join(map(str, coords)) + ')')
-        engine.stdin.write(('{ "cmd": "action", "action": "B(' + ','.join(map(str, coords)) + ')" }\n').encode())
-        engine.stdout.readline()
+        apply_delta(engine.action('B(' + ','.join(map(str, coords)) + ')'))
 
     rnd += 1
-    print("\nMove " + str(len(moves) + 1) + ": " + str(len(unwrapped_cells)) + " left")
+    print("\nMove " + str(engine.move_count + 1) + ": " + str(len(unwrapped_cells)) + " left")
     print("Current: " + str(current) + " Facing " + orientation_map[orientation])
 
     action = move(current, orientation_map[orientation])
-    moves.append(action)
     print("Sending Move: " + action)
-    engine.stdin.write(('{ "cmd": "action", "action": "' + str(action) + '" }\n').encode())
-
-    result = engine.stdout.readline()
-    data = json.loads(result.decode())
+    data = engine.action(action)
     #print(data['state_string'])
-    unpack_state(data)
+    apply_delta(data)
 
+    if data['status'].startswith('error'):
+        print(data['status'], file=sys.stderr)
+        sys.exit(1)
     if data['status'] != 'OK':
         print(data['status'])
         break
 
 
 print("\n")
-print("".join([str(x) for x in moves]))
-engine.stdin.write(b'{ "cmd": "exit" }\n')
+print(engine.solution())
+engine.close()
 
 
 
@@ -1,3 +1,77 @@
+(* ========================================================================== *
+ * Binary min-heap keyed by an integer priority
+ * ========================================================================== *)
+
+module Heap :
+sig
+  type 'a t
+
+  val create : unit -> 'a t
+  val is_empty : 'a t -> bool
+
+  (** [push heap priority value] adds [value] to [heap]. *)
+  val push : 'a t -> int -> 'a -> unit
+
+  (** [pop heap] removes and returns the entry with the lowest priority. *)
+  val pop : 'a t -> (int * 'a) option
+end = struct
+  type 'a t =
+    {
+      mutable data : (int * 'a) array;
+      mutable size : int;
+    }
+
+  let create () = { data = [||]; size = 0 }
+
+  let is_empty heap = heap.size = 0
+
+  let swap heap i j =
+    let tmp = heap.data.(i) in
+    heap.data.(i) <- heap.data.(j);
+    heap.data.(j) <- tmp
+
+  let priority heap i = fst heap.data.(i)
+
+  let push heap priority_ value =
+    if heap.size = Array.length heap.data then begin
+      let data = Array.make (max 16 (2 * heap.size)) (priority_, value) in
+      Array.blit heap.data 0 data 0 heap.size;
+      heap.data <- data
+    end;
+    heap.data.(heap.size) <- (priority_, value);
+    let i = ref heap.size in
+    heap.size <- heap.size + 1;
+    while !i > 0 && priority heap ((!i - 1) / 2) > priority heap !i do
+      swap heap !i ((!i - 1) / 2);
+      i := (!i - 1) / 2
+    done
+
+  let pop heap =
+    if heap.size = 0 then None
+    else begin
+      let top = heap.data.(0) in
+      heap.size <- heap.size - 1;
+      heap.data.(0) <- heap.data.(heap.size);
+      let i = ref 0 in
+      let sifting = ref true in
+      while !sifting do
+        let left = 2 * !i + 1 in
+        let right = left + 1 in
+        let smallest = ref !i in
+        if left < heap.size && priority heap left < priority heap !smallest then
+          smallest := left;
+        if right < heap.size && priority heap right < priority heap !smallest then
+          smallest := right;
+        if !smallest = !i then sifting := false
+        else begin
+          swap heap !i !smallest;
+          i := !smallest
+        end
+      done;
+      Some top
+    end
+end
+
 (* ========================================================================== *
  * General implementation of A-star algorithm
  * ========================================================================== *)
@@ -14,6 +88,15 @@ sig
   (** [search problem start] returns a path (a list of states) from [start] to
       [problem.goal]. The path minimizes [problem.cost]. *)
   val search : 'a t -> 'a -> 'a list
+
+  (** [search_grid ~width ~height ~passable start goal] is [search]
+      specialised to a 4-connected grid with unit steps and a Manhattan
+      heuristic. [passable] holds one byte per cell at [x * height + y], any
+      non-zero byte can be walked on. The path is returned from [start] to
+      [goal]. *)
+  val search_grid :
+    width:int -> height:int -> passable:Bytes.t ->
+    int * int -> int * int -> (int * int) list
 end = struct
   type 'a t =
     {
@@ -39,51 +122,129 @@ end = struct
     let total_cost = cost_from_start + problem.cost state problem.goal in
     { cost_from_start; total_cost; tail; head = state }
 
-  (** [better p q] returns [true] if path [p] is better than path [q]. *)
-  let better p q = p.total_cost < q.total_cost
-
-  (** [pickup_eq_path p l] returns [Some (q, l')] where [q] is the path that
-      indicates the same position as [p] and [l] is a list excluding [q]. *)
-  let pickup_eq_path p l =
-    match List.partition (fun q -> p.head = q.head) l with
-    | [], _ -> None
-    | [q], l' -> Some (q, l')
-    | _ -> failwith "duplicated paths in open/close list"
-
-  (** [trace_next_states problem open_list close_list path] traces the next
-      states of [path.head].
-      @return [(open_list', close_list')] where [open_list'] and [close_list']
-      are respectively an open list and a close list after all of the next
-      states are traced. *)
-  let trace_next_states problem ol0 cl0 path0 =
-    let trace_state (ol, cl) state =
+  (** [trace_next_states problem open_list best closed path] pushes every
+      next state of [path.head] that improves on the best known cost to that
+      state onto [open_list]. Stale entries are left in the heap and skipped
+      when they are popped. *)
+  let trace_next_states problem ol best closed path0 =
+    let trace_state state =
       let path = create_path ~from:path0 problem state in
-      match pickup_eq_path path ol with
-      | Some (q, ol') -> if better path q then (path :: ol', cl) else (ol, cl)
-      | None ->
-        match pickup_eq_path path cl with
-        | Some (q, cl') -> if better path q then (path :: ol, cl') else (ol, cl)
-        | None -> (path :: ol, cl)
+      let improves =
+        try path.cost_from_start < Hashtbl.find best state
+        with Not_found -> true
+      in
+      if improves then begin
+        Hashtbl.replace best state path.cost_from_start;
+        Hashtbl.remove closed state;
+        Heap.push ol path.total_cost path
+      end
     in
-    List.fold_left trace_state (ol0, cl0) (problem.get_next_states path0.head)
-
-  (** [pickup_best_path l] returns [Some (p, l')] where [p] is the path that
-      has the least cost in [l] and [l'] is an open list without [p]. *)
-  let pickup_best_path = function
-    | [] -> None
-    | h :: t ->
-      let aux (y, l) x = if better y x then (y, x :: l) else (x, y :: l) in
-      Some (List.fold_left aux (h, []) t)
+    List.iter trace_state (problem.get_next_states path0.head)
 
   let search problem start =
-    let rec aux (ol, cl) =
-      match pickup_best_path ol with
+    let ol = Heap.create () in
+    let best = Hashtbl.create 1024 in
+    let closed = Hashtbl.create 1024 in
+    let start_path = create_path problem start in
+    Hashtbl.replace best start 0;
+    Heap.push ol start_path.total_cost start_path;
+    let rec aux () =
+      match Heap.pop ol with
       | None -> None (* No path reaches to [problem.goal] *)
-      | Some (p, ol') ->
+      | Some (_, p) ->
         if p.head = problem.goal then Some p (* reached to the goal *)
-        else aux (trace_next_states problem ol' (p :: cl) p)
+        else if Hashtbl.mem closed p.head then aux ()
+        else begin
+          Hashtbl.replace closed p.head ();
+          trace_next_states problem ol best closed p;
+          aux ()
+        end
     in
-    match aux ([create_path problem start], []) with
+    match aux () with
     | None -> raise Not_found
     | Some p -> p.head :: p.tail
+
+  (* Scratch arrays shared between grid searches. An entry is only valid when
+     its stamp matches the current generation, so a new search does not have
+     to clear anything. *)
+  type scratch =
+    {
+      size : int;
+      mutable generation : int;
+      seen : int array;
+      closed : int array;
+      distance : int array;
+      parent : int array;
+    }
+
+  let scratch = ref None
+
+  let get_scratch size =
+    let s = match !scratch with
+      | Some s when s.size = size -> s
+      | _ ->
+        let s = {
+          size = size;
+          generation = 0;
+          seen = Array.make size 0;
+          closed = Array.make size 0;
+          distance = Array.make size 0;
+          parent = Array.make size 0;
+        } in
+        scratch := Some s;
+        s
+    in
+    s.generation <- s.generation + 1;
+    s
+
+  let search_grid ~width ~height ~passable (start_x, start_y) (goal_x, goal_y) =
+    let inside x y = x >= 0 && y >= 0 && x < width && y < height in
+    if not (inside start_x start_y) || not (inside goal_x goal_y) then
+      raise Not_found;
+    let s = get_scratch (width * height) in
+    let gen = s.generation in
+    let index x y = x * height + y in
+    let heuristic x y = abs (x - goal_x) + abs (y - goal_y) in
+    let start = index start_x start_y in
+    let goal = index goal_x goal_y in
+    let ol = Heap.create () in
+    s.seen.(start) <- gen;
+    s.distance.(start) <- 0;
+    s.parent.(start) <- start;
+    Heap.push ol (heuristic start_x start_y) start;
+    let visit i x y =
+      if inside x y && Bytes.get passable (index x y) <> '\000' then begin
+        let j = index x y in
+        let cost = s.distance.(i) + 1 in
+        if s.seen.(j) <> gen || cost < s.distance.(j) then begin
+          s.seen.(j) <- gen;
+          s.distance.(j) <- cost;
+          s.parent.(j) <- i;
+          Heap.push ol (cost + heuristic x y) j
+        end
+      end
+    in
+    let rec aux () =
+      match Heap.pop ol with
+      | None -> false (* No path reaches to [goal] *)
+      | Some (_, i) ->
+        if i = goal then true
+        else if s.closed.(i) = gen then aux ()
+        else begin
+          s.closed.(i) <- gen;
+          let x = i / height in
+          let y = i mod height in
+          visit i (x - 1) y;
+          visit i (x + 1) y;
+          visit i x (y - 1);
+          visit i x (y + 1);
+          aux ()
+        end
+    in
+    if not (aux ()) then raise Not_found;
+    let rec trace i path =
+      let path = (i / height, i mod height) :: path in
+      if i = start then path else trace s.parent.(i) path
+    in
+    trace goal []
 end
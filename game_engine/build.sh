@@ -1,4 +1,4 @@
 #!/bin/sh
 
-ocamlbuild -r -use-ocamlfind -pkgs yojson,dum,str engine.native
+ocamlbuild -r -use-ocamlfind -pkgs yojson,dum,str,unix,bigarray engine.native
 
@@ -3,8 +3,8 @@
 (
 
   ../bin/parse-task ../data/prob-002.desc;
-  echo '{"cmd": "print_state"}';
-  echo '{"cmd": "do_moves", "moves": "FBLR"}'
+  echo '{"cmd": "get_state"}';
+  echo '{"cmd": "do_moves", "moves": "WWDDSQE"}';
   # echo '{"cmd": "get_state"}';
   echo '{"cmd": "exit"}';
 
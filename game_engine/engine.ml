@@ -156,8 +156,15 @@ type game_state = {
   bot_position: location;
   inventory: booster list;
   boosters: booster_loc list;
-  action_string: string;
+  action_log: (int * string) list; (* every (worker, action), most recent first *)
+  action_count: int; (* length of action_log *)
   workers: worker list;
+  beacons: location list; (* installed teleport beacons *)
+  traversable: Bytes.t; (* one byte per cell at x * height + y, never changes *)
+  wrapped_log: location list; (* every cell we wrapped, most recent first *)
+  wrapped_total: int; (* length of wrapped_log *)
+  unwrapped_total: int; (* number of Unwrapped cells left in world *)
+  region_unwrapped: int World.t; (* Unwrapped cells per region, see region_of *)
 }
 
 let inventory_to_json inventory =
@@ -222,20 +229,16 @@ let prob_obstacles prob_json =
       obstacle |> convert_each location_from_json
   )
 
-let initialize_state command_stream =
-  let prob_json = Stream.next command_stream in
-
-  let game_map = prob_game_map prob_json in
-  let boosters = prob_boosters prob_json in
-  let start_loc = prob_start_loc prob_json in
-  let obstacles = prob_obstacles prob_json in
-
-  let x_coords = List.map (fun (x,y) -> x) game_map in
-  let width = List.fold_left max (List.hd x_coords) (List.tl x_coords) in
-
-  let y_coords = List.map (fun (x,y) -> y) game_map in
-  let height = List.fold_left max (List.hd y_coords) (List.tl y_coords) in
+let traversable_grid world width height =
+  let grid = Bytes.make (width * height) '\000' in
+  World.iter (fun (x, y) cell ->
+    if x >= 0 && y >= 0 && x < width && y < height
+      && (cell = Unwrapped || cell = Wrapped) then
+      Bytes.set grid (x * height + y) '\001'
+  ) world;
+  grid
 
+let world_from_polygons game_map obstacles width height =
   let world = ref (World.empty) in
 
   for y = height - 1 downto 0 do
@@ -250,21 +253,96 @@ let initialize_state command_stream =
 				world := World.add (x,y) Unwrapped !world
     done
   done;
+  !world
+
+(* Cells already rasterized by lib/task.py, one character per cell at
+   x * height + y, which saves testing every cell against every polygon *)
+let world_from_grid_string width height grid =
+  if String.length grid <> width * height then
+    raise (Error "Invalid grid size");
+  let world = ref World.empty in
+  for x = 0 to width - 1 do
+    for y = 0 to height - 1 do
+      world := World.add (x,y) (cell_from_string (String.make 1 grid.[x * height + y])) !world
+    done
+  done;
+  !world
+
+(* Unwrapped cells are counted per square region of region_size cells, so
+   the win check is O(1) and spatial queries only look at regions that still
+   have work left. Regions without unwrapped cells are not in the map. *)
+let region_size = 8
+
+let region_of (x, y) = (x / region_size, y / region_size)
+
+let count_unwrapped world =
+  World.fold (fun location cell (total, regions) ->
+    if cell = Unwrapped then
+      let region = region_of location in
+      let n = try World.find region regions with Not_found -> 0 in
+      (total + 1, World.add region (n + 1) regions)
+    else
+      (total, regions)
+  ) world (0, World.empty)
+
+let region_remove_unwrapped regions location =
+  let region = region_of location in
+  match World.find region regions with
+    | 1 -> World.remove region regions
+    | n -> World.add region (n - 1) regions
+
+let unwrapped_in_region world (rx, ry) =
+  let cells = ref [] in
+  for x = rx * region_size + region_size - 1 downto rx * region_size do
+    for y = ry * region_size + region_size - 1 downto ry * region_size do
+      if (try World.find (x,y) world = Unwrapped with Not_found -> false) then
+        cells := (x,y) :: !cells
+    done
+  done;
+  !cells
+
+let state_of_task prob_json =
+  let game_map = prob_game_map prob_json in
+  let boosters = prob_boosters prob_json in
+  let start_loc = prob_start_loc prob_json in
+  let obstacles = prob_obstacles prob_json in
+
+  let x_coords = List.map (fun (x,y) -> x) game_map in
+  let width = List.fold_left max (List.hd x_coords) (List.tl x_coords) in
+
+  let y_coords = List.map (fun (x,y) -> y) game_map in
+  let height = List.fold_left max (List.hd y_coords) (List.tl y_coords) in
+
+  let world = match prob_json |> member "grid" with
+    | `String grid -> world_from_grid_string width height grid
+    | _ -> world_from_polygons game_map obstacles width height
+  in
+  let (unwrapped_total, region_unwrapped) = count_unwrapped world in
 
   let game_state = {
     status = "OK";
-    world = !world;
+    world = world;
     world_width = width;
     world_height = height;
     bot_position = start_loc;
     boosters = boosters;
     inventory = [];
-    action_string = "";
+    action_log = [];
+    action_count = 0;
     workers = [ initial_worker start_loc ];
+    beacons = [];
+    traversable = traversable_grid world width height;
+    wrapped_log = [];
+    wrapped_total = 0;
+    unwrapped_total = unwrapped_total;
+    region_unwrapped = region_unwrapped;
   } in
 
   game_state
 
+let initialize_state command_stream =
+  state_of_task (Stream.next command_stream)
+
 let print_map world width height =
 	for y = height - 1 downto 0 do
 		for x = 0 to width - 1 do
@@ -273,22 +351,32 @@ let print_map world width height =
 		printf "\n"
 	done
 
-let game_state_to_string state =
-  let s = ref "" in
-  let worker = List.hd state.workers in
-  let bot_position = worker.position in
-	for y = state.world_height - 1 downto 0 do
-		for x = 0 to state.world_width - 1 do
-      if bot_position = (x,y) then
-        s := !s ^ (orientation_to_string worker.orientation)
-      else if is_booster_at state.boosters (x,y) then
-        s := !s ^ (booster_to_string (booster_at state.boosters (x,y)))
-      else
-        s := !s ^ (sprintf "%s" (cell_to_string (World.find (x,y) state.world)))
-		done;
-    s := !s ^ (sprintf "\n")
+(* The map as text, top row first, for the cells x0..x1, y0..y1 (inclusive,
+   clipped to the map). Workers are drawn over boosters over cells, the
+   first in their list wins. *)
+let clip_viewport state (x0, y0, x1, y1) =
+  (max x0 0, max y0 0, min x1 (state.world_width - 1), min y1 (state.world_height - 1))
+
+let render_state state viewport =
+  let (x0, y0, x1, y1) = clip_viewport state viewport in
+  let overlay = Hashtbl.create 64 in
+  List.iter (fun (x, y, booster) -> Hashtbl.replace overlay (x, y) (booster_to_string booster))
+    (List.rev state.boosters);
+  List.iter (fun worker -> Hashtbl.replace overlay worker.position (orientation_to_string worker.orientation))
+    (List.rev state.workers);
+  let buffer = Buffer.create ((max 0 (x1 - x0 + 2)) * (max 0 (y1 - y0 + 1))) in
+  for y = y1 downto y0 do
+    for x = x0 to x1 do
+      Buffer.add_string buffer (
+        try Hashtbl.find overlay (x, y)
+        with Not_found -> cell_to_string (World.find (x, y) state.world))
+    done;
+    Buffer.add_char buffer '\n'
   done;
-  !s
+  Buffer.contents buffer
+
+let game_state_to_string state =
+  render_state state (0, 0, state.world_width - 1, state.world_height - 1)
 
 let game_state_map_to_json state =
   let s = ref [] in
@@ -314,46 +402,261 @@ let world_from_json width height json =
 let print_game_state state =
   printf "%s" (game_state_to_string state)
 
-let unwrapped_cells world =
-  let unwrapped = World.filter (fun k v -> v == Unwrapped) world in
-  List.map fst (World.bindings unwrapped)
+let unwrapped_cells state =
+  World.fold (fun region _ cells ->
+    List.rev_append (unwrapped_in_region state.world region) cells
+  ) state.region_unwrapped []
+  |> List.sort compare
+
+(* Unwrapped cells within Manhattan distance [radius] of [center]. Regions
+   that are entirely out of range are skipped without looking at the cells. *)
+let unwrapped_within state (cx, cy) radius =
+  let distance_to_range c low = max 0 (max (low - c) (c - (low + region_size - 1))) in
+  World.fold (fun (rx, ry) _ cells ->
+    let dx = distance_to_range cx (rx * region_size) in
+    let dy = distance_to_range cy (ry * region_size) in
+    if dx + dy > radius then cells
+    else
+      List.filter (fun (x, y) -> abs (x - cx) + abs (y - cy) <= radius)
+        (unwrapped_in_region state.world (rx, ry))
+      |> List.rev_append cells
+  ) state.region_unwrapped []
+  |> List.sort compare
+
+(* Split a solution style move string like "WDB(1,2)QF" into actions *)
+let split_moves moves =
+  let actions = ref [] in
+  let i = ref 0 in
+  let n = String.length moves in
+  while !i < n do
+    if !i + 1 < n && moves.[!i + 1] = '(' then begin
+      let close =
+        try String.index_from moves !i ')'
+        with Not_found -> raise (Error ("Unterminated action: " ^ (String.sub moves !i (n - !i))))
+      in
+      actions := (String.sub moves !i (close - !i + 1)) :: !actions;
+      i := close + 1
+    end else begin
+      actions := (String.make 1 moves.[!i]) :: !actions;
+      i := !i + 1
+    end
+  done;
+  List.rev !actions
+
+(* The solution so far, one string per worker. Only built on request
+   ("get_actions"), responses just carry action_count. *)
+let action_strings state =
+  let buffers = Array.init (List.length state.workers) (fun _ -> Buffer.create 1024) in
+  List.iter (fun (worker_num, action) ->
+    if worker_num < Array.length buffers then
+      Buffer.add_string buffers.(worker_num) action
+  ) (List.rev state.action_log);
+  Array.to_list (Array.map Buffer.contents buffers)
+
+let action_log_of_strings action_strings =
+  let log = ref [] in
+  List.iteri (fun worker_num action_string ->
+    List.iter (fun action -> log := (worker_num, action) :: !log) (split_moves action_string)
+  ) action_strings;
+  !log
+
+(* Everything but the map, which binary framing sends as a grid of bytes *)
+let state_fields state = [
+  "status", `String state.status;
+  "bot_position", location_to_json (List.hd state.workers).position;
+  "map_width", `Int state.world_width;
+  "map_height", `Int state.world_height;
+  "inventory", inventory_to_json state.inventory;
+  "boosters", `List ( List.map booster_loc_to_json state.boosters );
+  "action_count", `Int state.action_count;
+  "workers", `List ( List.map worker_to_json state.workers );
+  "beacons", `List ( List.map location_to_json state.beacons );
+]
 
 let state_to_json state =
-  `Assoc [
-    "status", `String state.status;
-    "state_string", `String (game_state_to_string state);
-    "bot_position", location_to_json (List.hd state.workers).position;
-    "map", game_state_map_to_json state;
-    "map_width", `Int state.world_width;
-    "map_height", `Int state.world_height;
-    "inventory", inventory_to_json state.inventory;
-    "boosters", `List ( List.map booster_loc_to_json state.boosters );
-    "action_string", `String state.action_string;
-    "workers", `List ( List.map worker_to_json state.workers );
-    "unwrapped_cells", `List ( List.map location_to_json (unwrapped_cells state.world) );
-  ]
+  `Assoc (
+    ("map", game_state_map_to_json state)
+    :: ("unwrapped_cells", `List ( List.map location_to_json (unwrapped_cells state) ))
+    :: state_fields state
+  )
+
+(* Cell codes as in lib/task.py *)
+let cell_code = function
+  | Wall -> 0
+  | Obstacle -> 1
+  | Unwrapped -> 2
+  | Wrapped -> 3
+
+(* One byte per cell at x * height + y, like the traversable grid *)
+let grid_bytes state =
+  let width = state.world_width and height = state.world_height in
+  let grid = Bytes.make (width * height) (Char.chr (cell_code Wall)) in
+  World.iter (fun (x, y) cell ->
+    if x >= 0 && x < width && y >= 0 && y < height then
+      Bytes.set grid (x * height + y) (Char.chr (cell_code cell))
+  ) state.world;
+  grid
 
 let load_game_state json =
   (* eprintf "Loading game state!\n%!"; *)
   let world_width = json |> member "map_width" |> to_int in
   let world_height = json |> member "map_height" |> to_int in
+  let world = json |> member "map" |> world_from_json world_width world_height in
+  let (unwrapped_total, region_unwrapped) = count_unwrapped world in
+  (* get_state only reports action_count, the moves of a state that has any
+     have to come along as action_string (see get_actions) or the solution
+     would silently lose them *)
+  let action_log = match json |> member "action_string" with
+    | `String action_string -> action_log_of_strings (String.split_on_char '#' action_string)
+    | _ -> []
+  in
+  (match json |> member "action_count" with
+    | `Int n when n > 0 && action_log = [] -> raise (Error "Missing action_string")
+    | `Int n when n <> List.length action_log -> raise (Error "action_string does not match action_count")
+    | _ -> ());
   {
     status = json |> member "status" |> to_string;
-    world = json |> member "map" |> world_from_json world_width world_height;
+    world = world;
     world_width = world_width;
     world_height = world_height;
     bot_position = json |> member "bot_position" |> location_from_json;
     boosters = json |> member "boosters" |> boosters_from_json;
     inventory = json |> member "inventory" |> inventory_from_json;
-    action_string = json |> member "action_string" |> to_string;
+    action_log = action_log;
+    action_count = List.length action_log;
     workers = json |> member "workers" |> workers_from_json;
+    beacons = (match json |> member "beacons" with
+      | `Null -> []
+      | beacons -> beacons |> convert_each location_from_json);
+    traversable = traversable_grid world world_width world_height;
+    wrapped_log = [];
+    wrapped_total = 0;
+    unwrapped_total = unwrapped_total;
+    region_unwrapped = region_unwrapped;
   }
 
 
+(* Opt-in profiling, see the "stats" command. Serialization covers building
+   the state JSON as well as writing any response. Times are CPU seconds. *)
+type command_stats = {
+  mutable count: int;
+  mutable seconds: float;
+  mutable serialize_seconds: float;
+  mutable bytes: int;
+}
+
+let stats_enabled = ref false
+let command_stats = Hashtbl.create 16
+let serialize_seconds = ref 0.0
+
+let serializing f =
+  let start = Sys.time () in
+  let result = f () in
+  serialize_seconds := !serialize_seconds +. (Sys.time () -. start);
+  result
+
+(* Response framing negotiated with the "set_framing" command. Requests are
+   always JSON lines. A binary response is a frame of a big endian u32
+   length and that many bytes of JSON, then a u32 length and the map as one
+   byte per cell (see grid_bytes), empty unless the response is a full state.
+   Full states then leave out map and unwrapped_cells. *)
+type framing = Json_lines | Binary
+
+let framing = ref Json_lines
+
+let framing_of_string = function
+  | "json" -> Json_lines
+  | "binary" -> Binary
+  | _ as s -> raise (Error ("Invalid framing: " ^ s))
+
+let framing_to_string = function
+  | Json_lines -> "json"
+  | Binary -> "binary"
+
+let output_u32 oc n =
+  output_byte oc ((n lsr 24) land 255);
+  output_byte oc ((n lsr 16) land 255);
+  output_byte oc ((n lsr 8) land 255);
+  output_byte oc (n land 255)
+
+let output_frame json grid =
+  let header = Yojson.Basic.to_string json in
+  output_u32 stdout (String.length header);
+  output_string stdout header;
+  output_u32 stdout (Bytes.length grid);
+  output_bytes stdout grid
+
+let print_json json =
+  serializing (fun () ->
+    match !framing with
+    | Json_lines ->
+      Yojson.Basic.to_channel stdout json;
+      printf "\n"
+    | Binary -> output_frame json Bytes.empty)
+
+let with_stats cmd f =
+  if not !stats_enabled then f ()
+  else begin
+    let start = Sys.time () in
+    let serialize_start = !serialize_seconds in
+    let bytes_start = pos_out stdout in
+    let record () =
+      let entry =
+        try Hashtbl.find command_stats cmd
+        with Not_found ->
+          let entry = { count = 0; seconds = 0.0; serialize_seconds = 0.0; bytes = 0 } in
+          Hashtbl.add command_stats cmd entry;
+          entry
+      in
+      entry.count <- entry.count + 1;
+      entry.seconds <- entry.seconds +. (Sys.time () -. start);
+      entry.serialize_seconds <- entry.serialize_seconds +. (!serialize_seconds -. serialize_start);
+      entry.bytes <- entry.bytes + (pos_out stdout - bytes_start)
+    in
+    (try f () with e -> record (); raise e);
+    record ()
+  end
+
+let print_stats_cmd json =
+  (match json |> member "enable" |> to_bool_option with
+   | Some enable -> stats_enabled := enable
+   | None -> ());
+  let commands = Hashtbl.fold (fun cmd entry commands ->
+    (cmd, `Assoc [
+      "count", `Int entry.count;
+      "seconds", `Float entry.seconds;
+      "serialize_seconds", `Float entry.serialize_seconds;
+      "bytes", `Int entry.bytes;
+    ]) :: commands
+  ) command_stats [] in
+  if json |> member "reset" |> to_bool_option = Some true then
+    Hashtbl.reset command_stats;
+  print_json (`Assoc [
+    "status", `String "OK";
+    "enabled", `Bool !stats_enabled;
+    "commands", `Assoc (List.sort compare commands);
+  ])
+
 let print_game_state_json state =
-  Yojson.Basic.to_channel stdout (state_to_json state);
-  printf "\n";
-  flush stdout
+  (match !framing with
+   | Json_lines -> print_json (serializing (fun () -> state_to_json state))
+   | Binary ->
+     serializing (fun () -> output_frame (`Assoc (state_fields state)) (grid_bytes state)))
+
+(* Response mode negotiated with the "set_mode" command. In "delta" mode
+   actions only report what changed instead of the whole state. *)
+type response_mode = Full | Delta
+
+let response_mode = ref Full
+
+let response_mode_of_string = function
+  | "full" -> Full
+  | "delta" -> Delta
+  | _ as s -> raise (Error ("Invalid mode: " ^ s))
+
+let response_mode_to_string = function
+  | Full -> "full"
+  | Delta -> "delta"
 
 let set_elem lst index new_value =
   List.mapi (fun index' el -> if index = index' then new_value else el) lst
@@ -435,9 +738,46 @@ let perform_action_fast_wheels game_state worker_num =
   let workers = set_elem game_state.workers worker_num worker in
   { game_state with workers = workers }
 
-let record_action game_state action =
-  let action_string = game_state.action_string in
-  { game_state with action_string = action_string ^ action }
+(* Take one [booster] out of the inventory, it has to be there *)
+let use_booster game_state booster =
+  let rec remove = function
+    | [] -> raise (Error "Invalid state")
+    | b :: rest when b = booster -> rest
+    | b :: rest -> b :: remove rest
+  in
+  { game_state with inventory = remove game_state.inventory }
+
+(* Spawn a new worker on a spawn point (X). It starts acting on the next tick. *)
+let perform_action_clone game_state worker_num =
+  let worker = List.nth game_state.workers worker_num in
+  let (x, y) = worker.position in
+  if not (List.exists (fun (a, b, booster) -> a = x && b = y && booster = X) game_state.boosters) then
+    raise (Error "Invalid state");
+  let game_state = use_booster game_state C in
+  { game_state with
+    workers = game_state.workers @ [ initial_worker worker.position ];
+  }
+
+let perform_action_install_beacon game_state worker_num =
+  let worker = List.nth game_state.workers worker_num in
+  if List.mem worker.position game_state.beacons then
+    raise (Error "Invalid state");
+  let game_state = use_booster game_state R in
+  { game_state with beacons = worker.position :: game_state.beacons }
+
+let perform_action_teleport game_state worker_num x y =
+  if not (List.mem (x,y) game_state.beacons) then
+    raise (Error "Invalid state");
+  let worker = List.nth game_state.workers worker_num in
+  let worker = { worker with position = (x,y) } in
+  let workers = set_elem game_state.workers worker_num worker in
+  { game_state with workers = workers }
+
+let record_action game_state worker_num action =
+  { game_state with
+    action_log = (worker_num, action) :: game_state.action_log;
+    action_count = game_state.action_count + 1;
+  }
 
 let covered_cells (x1, y1) (x2, y2) =
   let points = ref [] in
@@ -543,16 +883,6 @@ let is_transparent world (x, y) =
     | Wrapped -> true
   with Not_found -> true
 
-let is_traversable world (x, y) =
-  try
-    let cell = World.find (x, y) world in
-    match cell with
-    | Obstacle -> false
-    | Wall -> false
-    | Unwrapped -> true
-    | Wrapped -> true
-  with Not_found -> false
-
 let is_visible world (x1, y1) (x2, y2) =
   let cells = covered_cells (x1, y1) (x2, y2) in
   List.for_all (is_transparent world) cells
@@ -561,24 +891,106 @@ let manipulator_positions worker =
   let (x,y) = worker.position in
   List.map (fun (i,j) -> (x+i, y+j)) worker.manipulators
 
-let visible_manipulator_positions world worker =
-  List.filter (is_visible world worker.position) (manipulator_positions worker)
+(* Rays only depend on the manipulator offset, so the cells they cross are
+   computed once per offset. For a whole arm (a worker's manipulators list)
+   the cells of all its rays are numbered and every manipulator gets a
+   bitmask of the cells its ray crosses. Visibility is then one lookup per
+   cell in the traversable grid plus one mask test per manipulator, instead
+   of a World.find for every cell of every ray. *)
+type arm = {
+  arm_cells: location array; (* relative to the worker *)
+  arm_offsets: location array;
+  arm_masks: int array; (* bits into arm_cells, one per manipulator *)
+}
 
-(* Only wrap unwrapped locations, ignore the rest *)
-let update_location_wrapped world location =
-  try
-    if World.find location world = Unwrapped then
-      World.add location Wrapped world
-    else
-      world
-  with Not_found -> world (* Don't worry about the edge of the world *)
+let ray_cache = Hashtbl.create 64
+let arm_cache = Hashtbl.create 64
+
+let ray_offsets offset =
+  try Hashtbl.find ray_cache offset
+  with Not_found ->
+    let cells = covered_cells (0, 0) offset in
+    Hashtbl.add ray_cache offset cells;
+    cells
+
+(* None when the rays cross more cells than fit in an int *)
+let arm_of_manipulators manipulators =
+  try Hashtbl.find arm_cache manipulators
+  with Not_found ->
+    let index = Hashtbl.create 32 in
+    let cells = ref [] in
+    let cell_bit cell =
+      try Hashtbl.find index cell
+      with Not_found ->
+        let bit = Hashtbl.length index in
+        Hashtbl.add index cell bit;
+        cells := cell :: !cells;
+        bit
+    in
+    let masks = List.map (fun offset ->
+      List.fold_left (fun mask cell ->
+        mask lor (1 lsl (cell_bit cell))
+      ) 0 (ray_offsets offset)
+    ) manipulators in
+    let arm =
+      if Hashtbl.length index > Sys.int_size - 1 then None
+      else Some {
+        arm_cells = Array.of_list (List.rev !cells);
+        arm_offsets = Array.of_list manipulators;
+        arm_masks = Array.of_list masks;
+      }
+    in
+    Hashtbl.add arm_cache manipulators arm;
+    arm
+
+(* Same answer as not (is_transparent world location); cells outside the
+   map are transparent there too *)
+let is_opaque game_state (x, y) =
+  x >= 0 && y >= 0 && x < game_state.world_width && y < game_state.world_height
+  && Bytes.get game_state.traversable (x * game_state.world_height + y) = '\000'
+
+let visible_manipulator_positions game_state worker =
+  let (x, y) = worker.position in
+  match arm_of_manipulators worker.manipulators with
+  | None ->
+    List.filter (is_visible game_state.world worker.position) (manipulator_positions worker)
+  | Some arm ->
+    let opaque = ref 0 in
+    Array.iteri (fun bit (i, j) ->
+      if is_opaque game_state (x + i, y + j) then opaque := !opaque lor (1 lsl bit)
+    ) arm.arm_cells;
+    let visible = ref [] in
+    for k = Array.length arm.arm_offsets - 1 downto 0 do
+      if arm.arm_masks.(k) land !opaque = 0 then begin
+        let (i, j) = arm.arm_offsets.(k) in
+        visible := (x + i, y + j) :: !visible
+      end
+    done;
+    !visible
+
+(* Only wrap unwrapped locations, ignore the rest. Each wrapped cell is
+   also pushed on the (persistent, shared between states) wrapped_log *)
+let update_location_wrapped game_state location =
+  let cell =
+    try World.find location game_state.world
+    with Not_found -> Wall (* Don't worry about the edge of the world *)
+  in
+  if cell = Unwrapped then
+    { game_state with
+      world = World.add location Wrapped game_state.world;
+      wrapped_log = location :: game_state.wrapped_log;
+      wrapped_total = game_state.wrapped_total + 1;
+      unwrapped_total = game_state.unwrapped_total - 1;
+      region_unwrapped = region_remove_unwrapped game_state.region_unwrapped location;
+    }
+  else
+    game_state
 
 let update_wrapped_state_worker game_state worker =
-  let updated_world = List.fold_left
+  List.fold_left
     update_location_wrapped
-    game_state.world
-    (visible_manipulator_positions game_state.world worker) in
-  { game_state with world = updated_world }
+    game_state
+    (visible_manipulator_positions game_state worker)
 
 let update_wrapped_state game_state =
   List.fold_left update_wrapped_state_worker game_state game_state.workers
@@ -591,32 +1003,66 @@ let pick_up_boosters game_state worker_num =
     (fun (a, b, booster) -> a == x && b == y && booster != X)
     game_state.boosters in
   let found_booster_locs = List.map (fun (a, b, booster) -> a,b) found_boosters in
-  let world = List.fold_left (fun world loc -> World.add loc Wrapped world) game_state.world found_booster_locs in
+  let game_state = List.fold_left update_location_wrapped game_state found_booster_locs in
   { game_state with
-    world = world;
     boosters = unfound_boosters;
     inventory = game_state.inventory @ (List.map (fun (a, b, booster) -> booster) found_boosters);
   }
 
   (***************************)
 
-let get_next_states world (i, j) =
-  [(i-1, j); (i+1, j); (i, j-1); (i, j+1)]
-  |> List.filter (is_traversable world)
-
 (** Solve a given maze. *)
-let astar_path world start goal =
+let astar_path game_state start goal =
   (* let (start_x, start_y) = start in *)
   (* let (goal_x, goal_y) = goal in *)
   (* eprintf "Mapping path from (%d,%d) -> (%d,%d)\n%!" start_x start_y goal_x goal_y; *)
   let open Astar in
-  let cost (i, j) (k, l) = abs (i-k) + abs (j-l) in (* Manhattan distance *)
-  let problem = {
-    Astar.cost = cost;
-    Astar.goal = goal;
-    Astar.get_next_states = get_next_states world;
-  } in
-  List.rev (Astar.search problem start)
+  Astar.search_grid
+    ~width:game_state.world_width
+    ~height:game_state.world_height
+    ~passable:game_state.traversable
+    start goal
+
+(* Breadth first flood fill from [start] over the traversable grid. Returns
+   the first location accepted by [is_target] together with the path to it,
+   so the target is the closest one by real path length. *)
+let nearest_path game_state start is_target =
+  let width = game_state.world_width in
+  let height = game_state.world_height in
+  let index (x, y) = x * height + y in
+  let location i = (i / height, i mod height) in
+  let inside (x, y) = x >= 0 && y >= 0 && x < width && y < height in
+  let parent = Array.make (width * height) (-1) in
+  let queue = Queue.create () in
+  let rec trace i path =
+    let path = (location i) :: path in
+    if parent.(i) = i then path else trace parent.(i) path
+  in
+  let rec search () =
+    if Queue.is_empty queue then None
+    else
+      let i = Queue.pop queue in
+      if is_target (location i) then Some (location i, trace i [])
+      else begin
+        let (x, y) = location i in
+        List.iter (fun next ->
+          if inside next then begin
+            let j = index next in
+            if parent.(j) < 0 && Bytes.get game_state.traversable j <> '\000' then begin
+              parent.(j) <- i;
+              Queue.push j queue
+            end
+          end
+        ) [(x-1, y); (x+1, y); (x, y-1); (x, y+1)];
+        search ()
+      end
+  in
+  if not (inside start) then None
+  else begin
+    parent.(index start) <- index start;
+    Queue.push (index start) queue;
+    search ()
+  end
 
 let relative_action (x1, y1) (x2, y2) =
   (* eprintf "Relative action from (%d,%d) -> (%d,%d)\n%!" x1 y1 x2 y2; *)
@@ -646,23 +1092,26 @@ let validate_location game_state worker_num =
   with _ -> raise (Error "Invalid state")
 
 let check_for_win game_state =
-  if List.length (unwrapped_cells game_state.world) = 0 then
+  if game_state.unwrapped_total = 0 then
     { game_state with status = "WIN" }
   else
     { game_state with status = "OK" }
 
+(* Actions with coordinates: B(x,y) attaches a manipulator, T(x,y) teleports *)
 let extract_manipulator_action action =
-  if Str.string_match (Str.regexp "B(\\([-0-9]+\\),\\([-0-9]+\\))") action 0 then
-    let x = int_of_string (Str.matched_group 1 action) in
-    let y = int_of_string (Str.matched_group 2 action) in
-    ("B", x, y)
+  if Str.string_match (Str.regexp "\\([BT]\\)(\\([-0-9]+\\),\\([-0-9]+\\))") action 0 then
+    let name = Str.matched_group 1 action in
+    let x = int_of_string (Str.matched_group 2 action) in
+    let y = int_of_string (Str.matched_group 3 action) in
+    (name, x, y)
   else
     (action, 0, 0)
 
-let perform_action cmd_json game_state worker_num =
-    let action = cmd_json |> member "action" |> to_string in
-    let action, x, y = extract_manipulator_action action in
-    let game_state = (match action with
+let perform_action_string action game_state worker_num =
+    if worker_num < 0 || worker_num >= List.length game_state.workers then
+      raise (Error "Invalid worker");
+    let name, x, y = extract_manipulator_action action in
+    let game_state = (match name with
       | "W" -> perform_action_move_up game_state worker_num
       | "S" -> perform_action_move_down game_state worker_num
       | "A" -> perform_action_move_left game_state worker_num
@@ -672,28 +1121,547 @@ let perform_action cmd_json game_state worker_num =
       | "Q" -> perform_action_turn_counterclockwise game_state worker_num
       | "B" -> perform_action_attach_manipulator game_state worker_num x y
       | "F" -> perform_action_fast_wheels game_state worker_num
+      | "C" -> perform_action_clone game_state worker_num
+      | "R" -> perform_action_install_beacon game_state worker_num
+      | "T" -> perform_action_teleport game_state worker_num x y
       | _ -> raise (FatalError ("Unknown or unimplemented action: " ^ action))
     ) in
     let game_state = update_wrapped_state game_state in
     let game_state = pick_up_boosters game_state worker_num in
     let game_state = validate_location game_state worker_num in
-    let game_state = record_action game_state action in
+    let game_state = record_action game_state worker_num action in
     let game_state = check_for_win game_state in
     game_state
 
+(* Commands act on worker 0 unless they name another one *)
+let worker_of_json json =
+  match json |> member "worker" |> to_int_option with
+    | Some worker_num -> worker_num
+    | None -> 0
+
+let worker_position game_state worker_num =
+  try (List.nth game_state.workers worker_num).position
+  with _ -> raise (Error "Invalid worker")
+
+let perform_action cmd_json game_state =
+  let action = cmd_json |> member "action" |> to_string in
+  perform_action_string action game_state (worker_of_json cmd_json)
+
+(* One time step: every worker that exists at the start of the tick takes
+   one action, in worker order. Workers without an action (missing or null)
+   wait with Z. Workers cloned during the tick only join on the next one. *)
+let perform_tick cmd_json game_state =
+  let actions = cmd_json |> member "actions" |> to_list in
+  let workers = List.length game_state.workers in
+  if List.length actions > workers then
+    raise (Error "Too many actions");
+  let rec aux game_state worker_num =
+    if worker_num >= workers then game_state
+    else
+      let action = match List.nth_opt actions worker_num with
+        | Some (`String action) when action <> "" -> action
+        | _ -> "Z"
+      in
+      aux (perform_action_string action game_state worker_num) (worker_num + 1)
+  in
+  aux game_state 0
+
+let split_list n l =
+  let rec aux n l taken =
+    if n <= 0 then (List.rev taken, l)
+    else match l with
+      | [] -> (List.rev taken, [])
+      | x :: rest -> aux (n - 1) rest (x :: taken)
+  in
+  aux n l []
+
+(* Cells wrapped in [a] but not in [b], and the other way round. Both
+   wrapped_logs share the history they have in common, so we only walk back
+   to where they meet. *)
+let wrapped_log_diff a b =
+  let (extra_a, log_a) = split_list (a.wrapped_total - b.wrapped_total) a.wrapped_log in
+  let (extra_b, log_b) = split_list (b.wrapped_total - a.wrapped_total) b.wrapped_log in
+  let rec walk log_a log_b only_a only_b =
+    if log_a == log_b then (only_a, only_b)
+    else match log_a, log_b with
+      | x :: rest_a, y :: rest_b -> walk rest_a rest_b (x :: only_a) (y :: only_b)
+      | _ -> (List.rev_append log_a only_a, List.rev_append log_b only_b)
+  in
+  let (only_a, only_b) = walk log_a log_b extra_a extra_b in
+  (List.sort_uniq compare only_a, List.sort_uniq compare only_b)
+
+let newly_wrapped_cells before after =
+  fst (wrapped_log_diff after before)
+
+(* The cell grid kept in a memory mapped file (e.g. under /dev/shm) for
+   other processes to read, see the "share_grid" command. Layout, integers
+   are little endian u32:
+
+     0   "VAEAGRID"
+     8   width
+     12  height
+     16  generation, odd while the engine is writing
+     20  action_count
+     32  one byte per cell at x * height + y, cell codes as in grid_bytes
+
+   Responses are only flushed at the top of the main loop, after the grid is
+   synced, so a client that got a response sees the grid it describes. *)
+let shared_grid_header = 32
+let shared_grid_magic = "VAEAGRID"
+
+type shared_grid = {
+  shared_path: string;
+  shared_cells: (char, Bigarray.int8_unsigned_elt, Bigarray.c_layout) Bigarray.Array1.t;
+  mutable synced: game_state;
+  mutable generation: int;
+}
+
+let shared_grid = ref None
+
+let set_shared_u32 cells offset n =
+  for i = 0 to 3 do
+    Bigarray.Array1.set cells (offset + i) (Char.chr ((n lsr (8 * i)) land 255))
+  done
+
+let map_shared_grid path size =
+  let fail e = raise (Error ("Cannot share grid: " ^ Unix.error_message e)) in
+  let fd =
+    try Unix.openfile path [Unix.O_RDWR; Unix.O_CREAT] 0o600
+    with Unix.Unix_error (e, _, _) -> fail e
+  in
+  try
+    Unix.ftruncate fd size;
+    let cells = Bigarray.array1_of_genarray (Unix.map_file fd Bigarray.char Bigarray.c_layout true [| size |]) in
+    Unix.close fd;
+    cells
+  with Unix.Unix_error (e, _, _) -> Unix.close fd; fail e
+
+(* Bracket every change with an odd generation, readers retry when they see
+   one or when it changed while they were reading *)
+let write_shared_grid grid state f =
+  set_shared_u32 grid.shared_cells 16 (grid.generation + 1);
+  f ();
+  grid.generation <- grid.generation + 2;
+  set_shared_u32 grid.shared_cells 20 state.action_count;
+  set_shared_u32 grid.shared_cells 16 grid.generation;
+  grid.synced <- state
+
+let share_grid path state =
+  let size = shared_grid_header + state.world_width * state.world_height in
+  let cells = map_shared_grid path size in
+  let grid = { shared_path = path; shared_cells = cells; synced = state; generation = 0 } in
+  String.iteri (fun i c -> Bigarray.Array1.set cells i c) shared_grid_magic;
+  set_shared_u32 cells 8 state.world_width;
+  set_shared_u32 cells 12 state.world_height;
+  write_shared_grid grid state (fun () ->
+    Bytes.iteri (fun i c -> Bigarray.Array1.set cells (shared_grid_header + i) c) (grid_bytes state));
+  shared_grid := Some grid
+
+let set_shared_cells grid state cells cell =
+  let height = state.world_height in
+  List.iter (fun (x, y) ->
+    if x >= 0 && x < state.world_width && y >= 0 && y < height then
+      Bigarray.Array1.set grid.shared_cells (shared_grid_header + x * height + y) (Char.chr (cell_code cell))
+  ) cells
+
+(* Only the cells that changed since the last sync, found the same way
+   restore finds them *)
+let sync_shared_grid state =
+  match !shared_grid with
+  | None -> ()
+  | Some grid ->
+    if state.world != grid.synced.world || state.action_count <> grid.synced.action_count then begin
+      let (wrapped, reverted) = wrapped_log_diff state grid.synced in
+      write_shared_grid grid state (fun () ->
+        set_shared_cells grid state reverted Unwrapped;
+        set_shared_cells grid state wrapped Wrapped)
+    end
+
+(* After loading a new map or state the logs have nothing in common, start
+   over (the size may have changed too) *)
+let reload_shared_grid state =
+  match !shared_grid with
+  | None -> ()
+  | Some grid -> share_grid grid.shared_path state
+
+let share_grid_cmd json game_state =
+  (match json |> member "path" with
+   | `Null -> shared_grid := None
+   | path -> share_grid (to_string path) game_state);
+  print_json (`Assoc [
+    "status", `String "OK";
+    "path", (match !shared_grid with Some grid -> `String grid.shared_path | None -> `Null);
+    "offset", `Int shared_grid_header;
+    "map_width", `Int game_state.world_width;
+    "map_height", `Int game_state.world_height;
+  ])
+
+let removed_boosters before after =
+  List.filter (fun booster -> not (List.mem booster after.boosters)) before.boosters
+
+let state_delta_fields before after wrapped_cells =
+  [
+    "status", `String after.status;
+    "bot_position", location_to_json (List.hd after.workers).position;
+    "wrapped_cells", `List ( List.map location_to_json wrapped_cells );
+    "workers", `List ( List.map worker_to_json after.workers );
+    "inventory", inventory_to_json after.inventory;
+    "boosters_removed", `List ( List.map booster_loc_to_json (removed_boosters before after) );
+  ]
+
+let state_delta_to_json before after =
+  `Assoc (state_delta_fields before after (newly_wrapped_cells before after))
+
+let print_action_result before after =
+  match !response_mode with
+  | Full -> print_game_state_json after
+  | Delta ->
+    print_json (serializing (fun () -> state_delta_to_json before after))
+
 let print_path_cmd json game_state =
   let target = json |> member "target" |> location_from_json in
-  let bot_position = (List.hd game_state.workers).position in
-  let path = astar_path game_state.world bot_position target in
+  let bot_position = worker_position game_state (worker_of_json json) in
+  let path = astar_path game_state bot_position target in
   let actions = path_to_actions path in
   let result_json = `Assoc [
     "path_commands", `List ( List.map (fun s -> `String s) actions );
     "path", `List ( List.map (fun s -> location_to_json s) path);
   ] in
-  Yojson.Basic.to_channel stdout result_json;
-  printf "\n";
+  print_json result_json;
+  flush stdout
+
+(* Find the closest cell by path length that matches any of the requested
+   target classes: "unwrapped" cells, boosters of the given "boosters" types
+   (all pick-up-able ones when the list is empty) and explicit "targets". *)
+let print_nearest_cmd json game_state =
+  let want_unwrapped = match json |> member "unwrapped" |> to_bool_option with
+    | Some b -> b
+    | None -> false
+  in
+  let booster_types = match json |> member "boosters" with
+    | `Null -> None
+    | types -> Some (types |> convert_each booster_from_json)
+  in
+  let targets = Hashtbl.create 64 in
+  (match json |> member "targets" with
+    | `Null -> ()
+    | locations ->
+      List.iter (fun loc -> Hashtbl.replace targets loc ())
+        (locations |> convert_each location_from_json));
+  (match booster_types with
+    | None -> ()
+    | Some types ->
+      List.iter (fun (x, y, booster) ->
+        if (types = [] && booster != X) || List.mem booster types then
+          Hashtbl.replace targets (x, y) ()
+      ) game_state.boosters);
+  let is_target location =
+    Hashtbl.mem targets location
+    || (want_unwrapped
+        && (try World.find location game_state.world = Unwrapped with Not_found -> false))
+  in
+  let bot_position = worker_position game_state (worker_of_json json) in
+  let result_json = match nearest_path game_state bot_position is_target with
+    | None -> `Assoc [
+        "target", `Null;
+        "path_commands", `List [];
+        "path", `List [];
+      ]
+    | Some (target, path) -> `Assoc [
+        "target", location_to_json target;
+        "path_commands", `List ( List.map (fun s -> `String s) (path_to_actions path) );
+        "path", `List ( List.map (fun s -> location_to_json s) path);
+      ]
+  in
+  print_json result_json;
   flush stdout
 
+(* Answers questions about the unwrapped cells without sending all of them:
+   the count, the cells within "radius" of "center" (the bot by default) and,
+   with "regions", the count per region of region_size x region_size cells. *)
+let print_unwrapped_cmd json game_state =
+  let center = match json |> member "center" with
+    | `Null -> (List.hd game_state.workers).position
+    | location -> location_from_json location
+  in
+  let cells = match json |> member "radius" |> to_int_option with
+    | None -> []
+    | Some radius -> [
+        "cells", `List ( List.map location_to_json (unwrapped_within game_state center radius) )
+      ]
+  in
+  let regions = match json |> member "regions" |> to_bool_option with
+    | Some true -> [
+        "region_size", `Int region_size;
+        "regions", `List ( List.map (fun ((rx, ry), n) -> `List [ `Int rx; `Int ry; `Int n ])
+          (World.bindings game_state.region_unwrapped) );
+      ]
+    | _ -> []
+  in
+  print_json (`Assoc (
+    ("unwrapped_count", `Int game_state.unwrapped_total) :: cells @ regions
+  ));
+  flush stdout
+
+(* Apply a whole move string in one go. We stop early on an error, on a WIN,
+   or (when asked) right after a booster was picked up so the caller can
+   react to it. The reply is always a delta covering every executed move. *)
+let run_moves game_state worker_num stop_on_pickup actions =
+  let state = ref game_state in
+  let executed = ref 0 in
+  let stopped = ref false in
+  List.iter (fun action ->
+    if not !stopped then
+      try
+        let next = perform_action_string action !state worker_num in
+        let picked_up = List.length next.inventory > List.length (!state).inventory in
+        state := next;
+        executed := !executed + 1;
+        if next.status = "WIN" || (stop_on_pickup && picked_up) then stopped := true
+      with Error(m) ->
+        state := { !state with status = ("error: " ^ m) };
+        stopped := true
+  ) actions;
+  let result_json = `Assoc (
+    ("executed", `Int !executed)
+    :: ("remaining", `Int (List.length actions - !executed))
+    :: (state_delta_fields game_state !state (newly_wrapped_cells game_state !state))
+  ) in
+  print_json result_json;
+  !state
+
+(* A move string that does not split (an unterminated "B(1,2") runs nothing.
+   The reply still has "executed" and carries the error status, but unlike a
+   failed action the state keeps its own status. *)
+let do_moves_cmd json game_state =
+  let stop_on_pickup = match json |> member "stop_on_pickup" |> to_bool_option with
+    | Some b -> b
+    | None -> false
+  in
+  let worker_num = worker_of_json json in
+  match json |> member "moves" |> to_string |> split_moves with
+  | actions -> run_moves game_state worker_num stop_on_pickup actions
+  | exception Error(m) ->
+    let failed = { game_state with status = ("error: " ^ m) } in
+    print_json (`Assoc (
+      ("executed", `Int 0)
+      :: ("remaining", `Int 0)
+      :: (state_delta_fields game_state failed [])
+    ));
+    game_state
+
+(* Named snapshots for lookahead search. Game states are persistent, so a
+   snapshot only keeps the state alive and costs nothing to take. *)
+let snapshots = Hashtbl.create 16
+let next_snapshot = ref 0
+
+let print_actions_cmd game_state =
+  print_json (`Assoc [
+    "status", `String game_state.status;
+    "action_string", `String (String.concat "#" (action_strings game_state));
+    "action_count", `Int game_state.action_count;
+  ])
+
+(* The map as text, only built on request. "viewport" [x0, y0, x1, y1]
+   crops it, or "radius" around "center" (default the worker's position). *)
+let print_state_string_cmd json game_state =
+  let viewport = match json |> member "viewport", json |> member "radius" |> to_int_option with
+    | `List [ `Int x0; `Int y0; `Int x1; `Int y1 ], _ -> (x0, y0, x1, y1)
+    | `Null, Some radius ->
+      let (cx, cy) = match json |> member "center" with
+        | `Null -> worker_position game_state (worker_of_json json)
+        | location -> location_from_json location
+      in
+      (cx - radius, cy - radius, cx + radius, cy + radius)
+    | `Null, None -> (0, 0, game_state.world_width - 1, game_state.world_height - 1)
+    | _ -> raise (Error "Invalid viewport")
+  in
+  let (x0, y0, x1, y1) = clip_viewport game_state viewport in
+  print_json (`Assoc [
+    "status", `String game_state.status;
+    "state_string", `String (render_state game_state viewport);
+    "viewport", `List [ `Int x0; `Int y0; `Int x1; `Int y1 ];
+  ])
+
+(* Checkpoints only keep what playing changed on top of the task, which has
+   to be loaded before one is read back:
+
+     "VAEACKPT" version width height bitmap_length state_length map_digest
+     bitmap  one bit per cell at x * height + y, lowest bit first, set when
+             the cell is Wrapped
+     state   JSON: status, workers, inventory, boosters, beacons and the
+             moves so far as action_string
+
+   The numbers are u32 big endian like in binary frames, map_digest is the
+   MD5 of the traversable grid. A checkpoint of another version, another
+   map or with the wrong lengths is an Error. *)
+let checkpoint_magic = "VAEACKPT"
+let checkpoint_version = 2
+let checkpoint_header = String.length checkpoint_magic + 5 * 4 + 16
+
+let input_u32 ic =
+  let b0 = input_byte ic in
+  let b1 = input_byte ic in
+  let b2 = input_byte ic in
+  let b3 = input_byte ic in
+  (b0 lsl 24) lor (b1 lsl 16) lor (b2 lsl 8) lor b3
+
+let bitmap_length width height = (width * height + 7) / 8
+
+let wrapped_bitmap state =
+  let width = state.world_width and height = state.world_height in
+  let bitmap = Bytes.make (bitmap_length width height) '\000' in
+  World.iter (fun (x, y) cell ->
+    if cell = Wrapped && x >= 0 && x < width && y >= 0 && y < height then begin
+      let i = x * height + y in
+      Bytes.set bitmap (i / 8) (Char.chr (Char.code (Bytes.get bitmap (i / 8)) lor (1 lsl (i mod 8))))
+    end
+  ) state.world;
+  bitmap
+
+let bitmap_is_set bitmap height (x, y) =
+  let i = x * height + y in
+  Char.code bitmap.[i / 8] land (1 lsl (i mod 8)) <> 0
+
+let checkpoint_to_json state = `Assoc [
+  "status", `String state.status;
+  "workers", `List ( List.map worker_to_json state.workers );
+  "inventory", inventory_to_json state.inventory;
+  "boosters", `List ( List.map booster_loc_to_json state.boosters );
+  "beacons", `List ( List.map location_to_json state.beacons );
+  "action_string", `String (String.concat "#" (action_strings state));
+]
+
+let save_checkpoint_cmd json game_state =
+  let path = json |> member "path" |> to_string in
+  let tmp = path ^ ".tmp" in
+  let bitmap = wrapped_bitmap game_state in
+  let fields = Yojson.Basic.to_string (checkpoint_to_json game_state) in
+  (try
+    let oc = open_out_bin tmp in
+    output_string oc checkpoint_magic;
+    List.iter (output_u32 oc) [
+      checkpoint_version; game_state.world_width; game_state.world_height;
+      Bytes.length bitmap; String.length fields;
+    ];
+    output_string oc (Digest.bytes game_state.traversable);
+    output_bytes oc bitmap;
+    output_string oc fields;
+    close_out oc;
+    Sys.rename tmp path
+  with Sys_error m -> raise (Error ("Cannot write checkpoint: " ^ m)));
+  print_json (`Assoc [
+    "status", `String game_state.status;
+    "action_count", `Int game_state.action_count;
+  ])
+
+(* The bitmap and the JSON of a checkpoint, after checking its header *)
+let read_checkpoint ic game_state =
+  let magic = really_input_string ic (String.length checkpoint_magic) in
+  let version = input_u32 ic in
+  let checkpoint_width = input_u32 ic in
+  let checkpoint_height = input_u32 ic in
+  let bitmap_size = input_u32 ic in
+  let fields_size = input_u32 ic in
+  let map_digest = really_input_string ic 16 in
+  if magic <> checkpoint_magic || version <> checkpoint_version
+    || bitmap_size <> bitmap_length checkpoint_width checkpoint_height
+    || in_channel_length ic <> checkpoint_header + bitmap_size + fields_size then
+    raise (Error "Invalid checkpoint");
+  if checkpoint_width <> game_state.world_width || checkpoint_height <> game_state.world_height
+    || map_digest <> Digest.bytes game_state.traversable then
+    raise (Error "Checkpoint of another map");
+  let bitmap = really_input_string ic bitmap_size in
+  let fields = really_input_string ic fields_size in
+  (bitmap, Yojson.Basic.from_string fields)
+
+let load_checkpoint_cmd json game_state =
+  let path = json |> member "path" |> to_string in
+  let width = game_state.world_width and height = game_state.world_height in
+  let ic =
+    try open_in_bin path
+    with Sys_error m -> raise (Error ("Cannot read checkpoint: " ^ m))
+  in
+  let (bitmap, fields) =
+    try
+      let checkpoint = read_checkpoint ic game_state in
+      close_in ic;
+      checkpoint
+    with
+    | Error _ as e -> close_in ic; raise e
+    | End_of_file | Yojson.Json_error _ -> close_in ic; raise (Error "Invalid checkpoint")
+  in
+  (* Walls and obstacles come from the loaded task, every other cell is
+     Wrapped or not as the bitmap says *)
+  let world = World.mapi (fun (x, y) cell ->
+    if (cell = Unwrapped || cell = Wrapped) && x >= 0 && x < width && y >= 0 && y < height then
+      (if bitmap_is_set bitmap height (x, y) then Wrapped else Unwrapped)
+    else cell
+  ) game_state.world in
+  let (unwrapped_total, region_unwrapped) = count_unwrapped world in
+  try
+    let workers = fields |> member "workers" |> workers_from_json in
+    if workers = [] then raise (Error "Invalid checkpoint");
+    let action_log =
+      fields |> member "action_string" |> to_string |> String.split_on_char '#' |> action_log_of_strings
+    in
+    {
+      game_state with
+      status = fields |> member "status" |> to_string;
+      world = world;
+      bot_position = (List.hd workers).position;
+      inventory = fields |> member "inventory" |> inventory_from_json;
+      boosters = fields |> member "boosters" |> boosters_from_json;
+      action_log = action_log;
+      action_count = List.length action_log;
+      workers = workers;
+      beacons = fields |> member "beacons" |> convert_each location_from_json;
+      wrapped_log = [];
+      wrapped_total = 0;
+      unwrapped_total = unwrapped_total;
+      region_unwrapped = region_unwrapped;
+    }
+  with Type_error _ -> raise (Error "Invalid checkpoint")
+
+let snapshot_cmd game_state =
+  let handle = !next_snapshot in
+  next_snapshot := handle + 1;
+  Hashtbl.replace snapshots handle game_state;
+  print_json (`Assoc [
+    "status", `String "OK";
+    "snapshot", `Int handle;
+  ])
+
+let find_snapshot json =
+  let handle = json |> member "snapshot" |> to_int in
+  try (handle, Hashtbl.find snapshots handle)
+  with Not_found -> raise (Error ("Unknown snapshot: " ^ (string_of_int handle)))
+
+(* In delta mode the reply also lists the cells that are unwrapped again and
+   the boosters that are back on the map, so a mirror can follow along *)
+let restore_cmd json game_state =
+  let (handle, target) = find_snapshot json in
+  (match !response_mode with
+    | Full -> print_game_state_json target
+    | Delta ->
+      let (reverted, wrapped) = wrapped_log_diff game_state target in
+      let added = List.filter (fun booster -> not (List.mem booster game_state.boosters)) target.boosters in
+      print_json (`Assoc (
+        ("snapshot", `Int handle)
+        :: ("reverted_cells", `List ( List.map location_to_json reverted ))
+        :: ("boosters_added", `List ( List.map booster_loc_to_json added ))
+        :: (state_delta_fields game_state target wrapped)
+      )));
+  target
+
+let drop_cmd json =
+  let (handle, _) = find_snapshot json in
+  Hashtbl.remove snapshots handle;
+  print_json (`Assoc [
+    "status", `String "OK";
+    "snapshot", `Int handle;
+  ])
+
 let main () =
 
   eprintf "started\n%!";
@@ -716,22 +1684,69 @@ let main () =
       let cmd_json = Stream.next command_stream in
       let cmd = cmd_json |> member "cmd" |> to_string in
       (* eprintf "Processing cmd: %s\n%!" cmd; *)
-      (match cmd with
+      with_stats cmd (fun () -> match cmd with
       | "get_state" ->
         print_game_state_json !game_state
+      | "load_task" ->
+          (* Start over on a new problem without restarting the engine *)
+          game_state := state_of_task (cmd_json |> member "task");
+          Hashtbl.reset snapshots;
+          game_state := update_wrapped_state !game_state;
+          reload_shared_grid !game_state;
+          print_json (`Assoc [ "status", `String "loaded" ])
       | "load_state" ->
           game_state := load_game_state (cmd_json |> member "state");
+          Hashtbl.reset snapshots;
+          reload_shared_grid !game_state;
           print_game_state_json !game_state
-      | "action" ->
-          game_state := perform_action cmd_json !game_state 0;
+      | "save_checkpoint" -> save_checkpoint_cmd cmd_json !game_state
+      | "load_checkpoint" ->
+          game_state := load_checkpoint_cmd cmd_json !game_state;
+          Hashtbl.reset snapshots;
+          reload_shared_grid !game_state;
           print_game_state_json !game_state
+      | "set_mode" ->
+          response_mode := cmd_json |> member "mode" |> to_string |> response_mode_of_string;
+          print_json (`Assoc [
+            "status", `String "OK";
+            "mode", `String (response_mode_to_string !response_mode);
+          ])
+      | "set_framing" ->
+          (* The reply already uses the new framing *)
+          framing := cmd_json |> member "framing" |> to_string |> framing_of_string;
+          print_json (`Assoc [
+            "status", `String "OK";
+            "framing", `String (framing_to_string !framing);
+          ])
+      | "action" ->
+          let before = !game_state in
+          game_state := perform_action cmd_json before;
+          print_action_result before !game_state
+      | "tick" ->
+          let before = !game_state in
+          game_state := perform_tick cmd_json before;
+          print_action_result before !game_state
+      | "do_moves" ->
+          game_state := do_moves_cmd cmd_json !game_state
+      | "snapshot" -> snapshot_cmd !game_state
+      | "restore" ->
+          game_state := restore_cmd cmd_json !game_state
+      | "drop" -> drop_cmd cmd_json
       | "get_path" -> print_path_cmd cmd_json !game_state
+      | "get_nearest" -> print_nearest_cmd cmd_json !game_state
+      | "get_unwrapped" -> print_unwrapped_cmd cmd_json !game_state
+      | "get_actions" -> print_actions_cmd !game_state
+      | "get_state_string" -> print_state_string_cmd cmd_json !game_state
+      | "stats" -> print_stats_cmd cmd_json
+      | "share_grid" -> share_grid_cmd cmd_json !game_state
       | "exit" -> exit 0
       | _ -> raise (Error ("Unknown command: " ^ cmd))
       );
+      sync_shared_grid !game_state
     with Error(m) ->
-      game_state := { !game_state with status = ("error: " ^ m) };
-      print_game_state_json !game_state
+      let before = !game_state in
+      game_state := { before with status = ("error: " ^ m) };
+      print_action_result before !game_state
   done
 
 let () = main ()
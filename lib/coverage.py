@@ -0,0 +1,127 @@
+# Coverage planning helpers: boustrophedon decomposition of the free space
+# and ordering of the resulting cells into a short tour.
+#
+# Grids are walkable masks indexed [x, y] (see task.walkable). The sweep
+# line moves along x, so a cell is a run of consecutive columns with one
+# free interval of y in each.
+
+import numpy as np
+
+def column_segments(column):
+    # (y0, y1) of every run of walkable cells in one column, inclusive
+    padded = np.concatenate(([False], column, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    return [(int(y0), int(y1) - 1) for y0, y1 in zip(changes[0::2], changes[1::2])]
+
+def overlap(a, b):
+    return min(a[1], b[1]) - max(a[0], b[0]) + 1
+
+def decompose(walk):
+    # Boustrophedon cells as lists of (x, y0, y1). At a split or merge of the
+    # free space the pair of segments that overlap the most carries the cell
+    # on, the others start new cells. This keeps the cells few and large on
+    # ragged maps, where a strict decomposition falls apart into slivers.
+    cells = []
+    previous = []
+    for x in range(walk.shape[0]):
+        segments = column_segments(walk[x])
+        best_current = {}
+        for i, segment in enumerate(segments):
+            for j, (other, cell) in enumerate(previous):
+                amount = overlap(segment, other)
+                if amount > 0 and amount > best_current.get(j, (0, None))[0]:
+                    best_current[j] = (amount, i)
+        current = []
+        for i, segment in enumerate(segments):
+            touching = [(overlap(segment, other), j) for j, (other, cell) in enumerate(previous)
+                        if overlap(segment, other) > 0]
+            if touching:
+                amount, j = max(touching)
+                if best_current[j][1] == i:
+                    cell = previous[j][1]
+                    cells[cell].append((x, segment[0], segment[1]))
+                    current.append((segment, cell))
+                    continue
+            cells.append([(x, segment[0], segment[1])])
+            current.append((segment, len(cells) - 1))
+        previous = current
+    return cells
+
+def fill_small_holes(walk, max_size):
+    # The walkable mask with every blocked component of at most max_size cells
+    # filled in, so small obstacles do not split the decomposition. Paths
+    # still have to go around them.
+    width, height = walk.shape
+    filled = walk.copy()
+    seen = walk.copy()
+    for x, y in np.argwhere(~walk):
+        if seen[x, y]:
+            continue
+        component = [(x, y)]
+        seen[x, y] = True
+        border = False
+        i = 0
+        while i < len(component):
+            cx, cy = component[i]
+            i += 1
+            for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                if not (0 <= nx < width and 0 <= ny < height):
+                    border = True
+                elif not seen[nx, ny]:
+                    seen[nx, ny] = True
+                    component.append((nx, ny))
+        if not border and len(component) <= max_size:
+            for cell in component:
+                filled[cell] = True
+    return filled
+
+def cell_center(cell):
+    xs = [x for x, y0, y1 in cell]
+    ys = [y for x, y0, y1 in cell for y in (y0, y1)]
+    return ((min(xs) + max(xs)) // 2, (min(ys) + max(ys)) // 2)
+
+def tour_length(points, order, start):
+    length = 0
+    position = start
+    for i in order:
+        length += abs(points[i][0] - position[0]) + abs(points[i][1] - position[1])
+        position = points[i]
+    return length
+
+def tour(points, start, max_two_opt=1000):
+    # Open tour over points from start: nearest neighbour, then 2-opt while
+    # it helps (skipped for very many points, it is quadratic per pass)
+    points = np.asarray(points)
+    if len(points) == 0:
+        return []
+    left = np.ones(len(points), dtype=bool)
+    order = []
+    position = np.asarray(start)
+    for step in range(len(points)):
+        distances = np.abs(points - position).sum(axis=1)
+        distances[~left] = np.iinfo(distances.dtype).max
+        i = int(distances.argmin())
+        order.append(i)
+        left[i] = False
+        position = points[i]
+    if len(points) > max_two_opt:
+        return order
+
+    route = np.vstack(([start], points[order]))
+    distance = np.abs(route[:, None, :] - route[None, :, :]).sum(axis=2)
+    path = list(range(len(route)))
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                # Reverse path[i..j]; the last stop has nothing after it
+                a, b = path[i - 1], path[i]
+                c = path[j]
+                d = path[j + 1] if j + 1 < len(path) else None
+                before = distance[a, b] + (distance[c, d] if d is not None else 0)
+                after = distance[a, c] + (distance[b, d] if d is not None else 0)
+                if after < before:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = True
+    return [order[i - 1] for i in path[1:]]
@@ -0,0 +1,60 @@
+# Shortest paths on static maps, for the optimizer's detours
+#
+# A* over the walkable mask with the Manhattan distance as its heuristic.
+# Detours are a handful of cells long on average, so the search only touches
+# the cells around them and needs no precomputed distance fields.
+#
+# Walls and obstacles never change while a map is played (drilled cells
+# aside), so a PathFinder only depends on the walkable mask. Grids are
+# indexed [x, y] like everywhere else, see task.walkable.
+
+import heapq
+
+import numpy as np
+
+class PathFinder:
+    def __init__(self, walk):
+        self.walk = np.asarray(walk, dtype=bool)
+        # A plain list is much faster than numpy for the one cell at a time
+        # lookups in the search loop
+        self.free = self.walk.ravel().tolist()
+
+    def path(self, start, goal):
+        # Shortest path from start to goal as a list of cells, or None
+        start, goal = tuple(start), tuple(goal)
+        if not self.walk[start] or not self.walk[goal]:
+            return None
+        width, height = self.walk.shape
+        free = self.free
+        target = goal[0] * height + goal[1]
+
+        def heuristic(cell):
+            x, y = divmod(cell, height)
+            return abs(x - goal[0]) + abs(y - goal[1])
+
+        first = start[0] * height + start[1]
+        parent = { first: None }
+        cost = { first: 0 }
+        heap = [(heuristic(first), 0, first)]
+        while heap:
+            f, g, cell = heapq.heappop(heap)
+            if cell == target:
+                path = []
+                while cell is not None:
+                    path.append(divmod(cell, height))
+                    cell = parent[cell]
+                return path[::-1]
+            if g > cost[cell]:
+                continue
+            x, y = divmod(cell, height)
+            for neighbour, ok in ((cell + height, x + 1 < width), (cell - height, x > 0),
+                                  (cell + 1, y + 1 < height), (cell - 1, y > 0)):
+                if ok and free[neighbour] and g + 1 < cost.get(neighbour, g + 2):
+                    cost[neighbour] = g + 1
+                    parent[neighbour] = cell
+                    heapq.heappush(heap, (g + 1 + heuristic(neighbour), g + 1, neighbour))
+        return None
+
+    def distance(self, start, goal):
+        path = self.path(start, goal)
+        return None if path is None else len(path) - 1
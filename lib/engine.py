@@ -0,0 +1,621 @@
+# Client for game_engine/engine.native
+#
+# Wraps the JSON line protocol in methods, keeps a local mirror of the state
+# (the engine runs in delta mode so responses stay small) and lets one engine
+# process be reused for many problems through load().
+#
+# backend="sim" (or VAEA_BACKEND=sim in the environment) swaps the engine
+# process for the in-process simulator from simulator.py.
+#
+# VAEA_BUDGET_FILE names a file holding the length of the best known
+# solution. A bot whose solution gets that long can no longer win, so the
+# process exits with BUDGET_EXIT_CODE. The file is re-read as the bot runs,
+# the portfolio runner lowers it when another strategy finds something better.
+#
+# VAEA_SOLUTION_FILE names the .sol file of the (one) problem the process
+# plays. Every committed action is streamed to a journal next to it (see
+# solution.SolutionWriter) and the .sol file is written when the map is won.
+# Every CHECKPOINT_MOVES moves or CHECKPOINT_SECONDS seconds the engine also
+# saves a checkpoint next to it. With VAEA_RESUME set, load() restarts
+# from the latest checkpoint and only replays the part of the journal after
+# it, so a bot that derives its plans from the engine state carries on where
+# an interrupted run stopped.
+#
+# framing="binary" (or VAEA_FRAMING=binary) asks the engine for binary
+# responses, see "set_framing" in engine.ml. Full states then come with a
+# "grid" NumPy array of the cell codes from task.py instead of the "map" and
+# "unwrapped_cells" fields.
+#
+# share_grid() maps the engine's cell grid into the bot's memory, see
+# shared_grid.py.
+#
+# VAEA_STATS_FILE turns on profiling, see metrics.py. Bots can time their own
+# work with engine.phase(name), which does nothing when profiling is off.
+
+import json
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+from metrics import Metrics, write_summary
+from shared_grid import SharedGrid, default_path
+from simulator import Simulator, SimulatorFatalError
+from solution import SolutionWriter, checkpoint_path, read_journal, split_moves
+from target_index import TargetIndex
+from task import FREE, ROOT
+
+ENGINE_PATH = os.path.join(ROOT, 'game_engine', 'engine.native')
+
+BUDGET_EXIT_CODE = 3
+BUDGET_CHECK_INTERVAL = 500
+
+CHECKPOINT_MOVES = 5000
+CHECKPOINT_SECONDS = 60
+
+FRAMINGS = ("json", "binary")
+
+class EngineError(Exception):
+    pass
+
+class BudgetExceeded(SystemExit):
+    # Exits quietly with BUDGET_EXIT_CODE unless a bot catches it
+    def __init__(self, steps, budget):
+        super().__init__(BUDGET_EXIT_CODE)
+        self.steps = steps
+        self.budget = budget
+
+def read_budget(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EngineError("engine exited")
+    return data
+
+def read_frame(stream):
+    # (header, grid) of one binary response, see output_frame in engine.ml
+    header = read_exact(stream, struct.unpack('>I', read_exact(stream, 4))[0])
+    grid = read_exact(stream, struct.unpack('>I', read_exact(stream, 4))[0])
+    return header, grid
+
+def decode_frame(header, grid):
+    data = json.loads(header.decode())
+    if grid:
+        data["grid"] = np.frombuffer(grid, dtype=np.uint8).reshape((data["map_width"], data["map_height"]))
+    return data
+
+class Engine:
+    def __init__(self, path=ENGINE_PATH, delta=True, backend=None, framing=None):
+        self.path = path
+        self.delta = delta
+        self.backend = backend or os.environ.get('VAEA_BACKEND', 'native')
+        self.framing = framing or os.environ.get('VAEA_FRAMING', 'json')
+        if self.framing not in FRAMINGS:
+            raise ValueError(f"unknown framing: {self.framing}")
+        self.process = None
+        self.mode = "full"
+        # Framing the engine process currently answers in
+        self.wire = "json"
+        self.shared_grid = None
+        # Removed on close when we picked the path
+        self.shared_grid_owned = False
+        self.budget_file = os.environ.get('VAEA_BUDGET_FILE')
+        self.budget = None
+        self.solution_file = os.environ.get('VAEA_SOLUTION_FILE')
+        self.resume = bool(os.environ.get('VAEA_RESUME'))
+        self.writer = None
+        self.last_checkpoint = (0, 0)
+        self.stats_file = os.environ.get('VAEA_STATS_FILE')
+        self.metrics = Metrics() if self.stats_file else None
+        self.reset()
+
+    def reset(self):
+        self.status = None
+        self.unwrapped = set()
+        # TargetIndex over self.unwrapped, built on the first nearest_unwrapped
+        self.unwrapped_index = None
+        self.boosters = []
+        self.inventory = []
+        self.workers = []
+        # Moves as a persistent ((worker, action), previous) chain so
+        # snapshots can hold on to a prefix without copying it
+        self.history = None
+        self.move_count = 0
+        self.steps = [0]
+        self.snapshots = {}
+
+    def start(self):
+        if self.backend == 'sim':
+            self.process = Simulator()
+            return
+        self.process = subprocess.Popen(
+            [self.path],
+            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE)
+
+    def alive(self):
+        if self.backend == 'sim':
+            return self.process is not None
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, data):
+        start = time.perf_counter()
+        if self.backend == 'sim':
+            try:
+                result = self.process.command(data)
+            except SimulatorFatalError as e:
+                # The real engine would have died
+                self.process = None
+                raise EngineError(f"engine exited: {e}")
+            if self.metrics is not None:
+                self.metrics.record(data.get("cmd", "task"), time.perf_counter() - start)
+            return result
+        request = json.dumps(data).encode()
+        encoded = time.perf_counter()
+        self.process.stdin.write(request)
+        self.process.stdin.write(b'\n')
+        self.process.stdin.flush()
+        if self.wire == "binary":
+            header, grid = read_frame(self.process.stdout)
+            received = time.perf_counter()
+            result = decode_frame(header, grid)
+            size = 8 + len(header) + len(grid)
+        else:
+            line = self.process.stdout.readline()
+            received = time.perf_counter()
+            if not line:
+                raise EngineError("engine exited")
+            result = json.loads(line.decode())
+            size = len(line)
+        if self.metrics is not None:
+            done = time.perf_counter()
+            self.metrics.record(data.get("cmd", "task"), done - start, encoded - start, done - received, size)
+        return result
+
+    def command(self, data):
+        return self.send(data)
+
+    def load(self, task):
+        self.start_task(task)
+        if self.solution_file:
+            self.open_journal(task)
+        return self
+
+    def start_task(self, task):
+        # The first message to a fresh engine is the task itself, after that
+        # the same process can be handed new tasks
+        started = not self.alive()
+        if started:
+            self.start()
+            self.mode = "full"
+            self.wire = "json"
+            data = self.send(task)
+        else:
+            data = self.command({ "cmd": "load_task", "task": task })
+        if data.get("status") != "loaded":
+            raise EngineError(f"could not load task: {data}")
+        if started and self.metrics is not None:
+            self.command({ "cmd": "stats", "enable": True })
+        if started and self.framing != "json":
+            self.set_framing(self.framing)
+        if self.shared_grid is not None:
+            # A new map may have a different size, a new process does not
+            # share anything yet
+            self.share_grid(self.shared_grid.path)
+        self.reset()
+        if self.budget_file:
+            self.budget = read_budget(self.budget_file)
+        self.get_state()
+        if self.delta and self.mode != "delta":
+            self.set_mode("delta")
+
+    def open_journal(self, task):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+        actions = []
+        if self.resume:
+            actions = read_journal(self.solution_file)
+            actions = actions[self.resume_checkpoint(task, actions):]
+        elif os.path.exists(checkpoint_path(self.solution_file)):
+            os.remove(checkpoint_path(self.solution_file))
+        self.replay(actions)
+        self.writer = SolutionWriter(self.solution_file, append=self.resume)
+        self.last_checkpoint = (self.move_count, time.monotonic())
+
+    def resume_checkpoint(self, task, actions):
+        # How many of the journal's actions the checkpoint already played, 0
+        # when there is no checkpoint or it does not match the journal (a
+        # later restore went back past it)
+        path = checkpoint_path(self.solution_file)
+        if not os.path.exists(path):
+            return 0
+        data = self.load_checkpoint(path)
+        if not data["status"].startswith("error") and len(actions) >= self.move_count:
+            expected = [[] for worker in range(max(len(self.workers), 1))]
+            for worker, action in actions[0:self.move_count]:
+                if worker < len(expected):
+                    expected[worker].append(action)
+            if expected == self.worker_moves():
+                return self.move_count
+        self.start_task(task)
+        return 0
+
+    def replay(self, actions):
+        # Replay (worker, action) pairs, consecutive actions of the same
+        # worker in one do_moves
+        i = 0
+        while i < len(actions) and self.status == "OK":
+            worker = actions[i][0]
+            j = i
+            while j < len(actions) and actions[j][0] == worker:
+                j += 1
+            moves = [action for w, action in actions[i:j]]
+            data = self.do_moves(moves, worker=worker)
+            if data["status"].startswith("error"):
+                raise EngineError(f"could not replay journal: {data['status']}")
+            i = j
+
+    def set_framing(self, framing):
+        # The engine answers this one in the new framing already
+        if framing not in FRAMINGS:
+            raise ValueError(f"unknown framing: {framing}")
+        self.wire = framing
+        return self.command({ "cmd": "set_framing", "framing": framing })
+
+    def share_grid(self, path=None):
+        # The engine's grid as a SharedGrid, kept up to date by the engine
+        # before each response and across load()
+        if path is None:
+            path = default_path()
+            self.shared_grid_owned = True
+        data = self.command({ "cmd": "share_grid", "path": path })
+        if data["status"] != "OK":
+            raise EngineError(f"could not share grid: {data['status']}")
+        if self.shared_grid is not None:
+            self.shared_grid.close()
+        self.shared_grid = SharedGrid(path)
+        return self.shared_grid
+
+    def set_mode(self, mode):
+        data = self.command({ "cmd": "set_mode", "mode": mode })
+        self.mode = data["mode"]
+        return data
+
+    def update(self, data):
+        if "wrapped_cells" in data:
+            for cell in data["wrapped_cells"]:
+                self.unwrapped.discard(tuple(cell))
+                if self.unwrapped_index is not None:
+                    self.unwrapped_index.discard(cell)
+            for booster in data["boosters_removed"]:
+                if booster in self.boosters:
+                    self.boosters.remove(booster)
+            for cell in data.get("reverted_cells", []):
+                self.unwrapped.add(tuple(cell))
+                if self.unwrapped_index is not None:
+                    self.unwrapped_index.add(cell)
+            self.boosters.extend(data.get("boosters_added", []))
+        elif "unwrapped_cells" in data:
+            self.unwrapped = set(tuple(cell) for cell in data["unwrapped_cells"])
+            self.unwrapped_index = None
+            self.boosters = data["boosters"]
+        elif "grid" in data:
+            self.unwrapped = set(tuple(cell) for cell in np.argwhere(data["grid"] == FREE).tolist())
+            self.unwrapped_index = None
+            self.boosters = data["boosters"]
+        if "workers" in data:
+            self.workers = data["workers"]
+            self.inventory = data["inventory"]
+        self.status = data.get("status", self.status)
+        return data
+
+    def record(self, actions, worker=0):
+        if self.writer is not None and actions:
+            self.writer.write(worker, actions)
+        for action in actions:
+            self.history = ((worker, action), self.history)
+            self.move_count += 1
+            while len(self.steps) <= worker:
+                self.steps.append(0)
+            self.steps[worker] += 1
+            if self.budget_file and self.move_count % BUDGET_CHECK_INTERVAL == 0:
+                self.budget = read_budget(self.budget_file)
+        if self.budget is not None and max(self.steps) >= self.budget:
+            raise BudgetExceeded(max(self.steps), self.budget)
+
+    def committed(self):
+        # Called once all the actions of a command are recorded
+        if self.writer is None:
+            return
+        if self.status == "WIN":
+            self.writer.finish(self.solution())
+            self.writer = None
+            if os.path.exists(checkpoint_path(self.solution_file)):
+                os.remove(checkpoint_path(self.solution_file))
+            return
+        moves, seconds = self.last_checkpoint
+        if self.move_count - moves >= CHECKPOINT_MOVES or time.monotonic() - seconds >= CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # The journal has to hold at least everything the checkpoint does
+        self.writer.checkpoint()
+        self.save_checkpoint(checkpoint_path(self.solution_file))
+        self.last_checkpoint = (self.move_count, time.monotonic())
+
+    def worker_moves(self):
+        moves = [[] for worker in range(max(len(self.workers), 1))]
+        history = self.history
+        while history is not None:
+            worker, action = history[0]
+            moves[worker].append(action)
+            history = history[1]
+        return [actions[::-1] for actions in moves]
+
+    @property
+    def moves(self):
+        return self.worker_moves()[0]
+
+    @property
+    def position(self):
+        return self.workers[0]["position"]
+
+    @property
+    def orientation(self):
+        return self.workers[0]["orientation"]
+
+    def get_state(self):
+        return self.update(self.command({ "cmd": "get_state" }))
+
+    def load_state(self, state, action_string=None):
+        # get_state leaves out the moves, a state that has any needs them as
+        # action_string (from get_actions) or the engine refuses it
+        if action_string is not None:
+            state = dict(state, action_string=action_string)
+        data = self.update(self.command({ "cmd": "load_state", "state": state }))
+        if not data["status"].startswith("error"):
+            self.reset_history(state.get("action_string", ""))
+        return data
+
+    def action(self, action, worker=0):
+        data = self.update(self.command({ "cmd": "action", "action": action, "worker": worker }))
+        if not data["status"].startswith("error"):
+            self.record([action], worker)
+            self.committed()
+        return data
+
+    def tick(self, actions):
+        # One action per worker (None waits), applied as a single time step
+        workers = len(self.workers)
+        data = self.update(self.command({ "cmd": "tick", "actions": list(actions) }))
+        if not data["status"].startswith("error"):
+            for worker in range(workers):
+                action = actions[worker] if worker < len(actions) else None
+                self.record([action or "Z"], worker)
+            self.committed()
+        return data
+
+    def do_moves(self, moves, stop_on_pickup=False, worker=0):
+        actions = split_moves(moves) if isinstance(moves, str) else list(moves)
+        data = self.update(self.command({
+            "cmd": "do_moves",
+            "moves": ''.join(actions),
+            "stop_on_pickup": stop_on_pickup,
+            "worker": worker,
+        }))
+        self.record(actions[0:data["executed"]], worker)
+        self.committed()
+        return data
+
+    def get_path(self, target, worker=0):
+        return self.command({ "cmd": "get_path", "target": list(target), "worker": worker })["path_commands"]
+
+    def get_nearest(self, unwrapped=False, boosters=None, targets=None, worker=0):
+        data = { "cmd": "get_nearest", "unwrapped": unwrapped, "worker": worker }
+        if boosters is not None:
+            data["boosters"] = boosters
+        if targets is not None:
+            data["targets"] = [list(target) for target in targets]
+        return self.command(data)
+
+    def nearest_unwrapped(self, k=1, worker=0):
+        # The k unwrapped cells closest to a worker by Manhattan distance, as
+        # (distance, cell) pairs. Kept up to date from the deltas, so this
+        # does not talk to the engine at all.
+        if self.unwrapped_index is None:
+            self.unwrapped_index = TargetIndex(self.unwrapped)
+        return self.unwrapped_index.nearest(self.workers[worker]["position"], k)
+
+    def get_unwrapped(self, radius=None, center=None, regions=False):
+        data = { "cmd": "get_unwrapped", "regions": regions }
+        if radius is not None:
+            data["radius"] = radius
+        if center is not None:
+            data["center"] = list(center)
+        return self.command(data)
+
+    def snapshot(self):
+        handle = self.command({ "cmd": "snapshot" })["snapshot"]
+        self.snapshots[handle] = (self.history, self.move_count, list(self.steps))
+        return handle
+
+    def restore(self, handle):
+        data = self.update(self.command({ "cmd": "restore", "snapshot": handle }))
+        if not data["status"].startswith("error"):
+            self.history, self.move_count, steps = self.snapshots[handle]
+            self.steps = list(steps)
+            if self.writer is not None:
+                self.writer.truncate(self.move_count)
+        return data
+
+    def drop(self, handle):
+        self.snapshots.pop(handle, None)
+        return self.command({ "cmd": "drop", "snapshot": handle })
+
+    def save_checkpoint(self, path):
+        return self.command({ "cmd": "save_checkpoint", "path": path })
+
+    def load_checkpoint(self, path):
+        data = self.update(self.command({ "cmd": "load_checkpoint", "path": path }))
+        if not data["status"].startswith("error"):
+            self.reset_history(self.get_actions()["action_string"])
+        return data
+
+    def reset_history(self, action_string):
+        # Only per worker moves come back, that is all a solution needs
+        self.history = None
+        self.steps = []
+        for worker, moves in enumerate(action_string.split('#')):
+            actions = split_moves(moves)
+            for action in actions:
+                self.history = ((worker, action), self.history)
+            self.steps.append(len(actions))
+        self.move_count = sum(self.steps)
+        self.snapshots = {}
+
+    def get_state_string(self, viewport=None, radius=None, center=None, worker=0):
+        # The map as text, all of it or cropped to viewport [x0, y0, x1, y1]
+        # or to radius around center (default the worker's position)
+        data = { "cmd": "get_state_string", "worker": worker }
+        if viewport is not None:
+            data["viewport"] = list(viewport)
+        if radius is not None:
+            data["radius"] = radius
+        if center is not None:
+            data["center"] = list(center)
+        return self.command(data)
+
+    def get_actions(self):
+        # The engine's own record of the solution so far
+        return self.command({ "cmd": "get_actions" })
+
+    def phase(self, name):
+        # Times the enclosed block when profiling is on
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.phase(name)
+
+    def engine_stats(self):
+        # Per command count, CPU seconds, serialization seconds and bytes
+        # written, as measured by the engine itself
+        return self.command({ "cmd": "stats" }).get("commands", {})
+
+    def write_stats(self):
+        engine_stats = None
+        if self.alive():
+            try:
+                engine_stats = self.engine_stats()
+            except EngineError:
+                pass
+        write_summary(self.stats_file, self.metrics.summary(engine_stats))
+
+    def solution(self):
+        return '#'.join(''.join(actions) for actions in self.worker_moves())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.metrics is not None and self.process is not None:
+            # Once per engine process, closing again does not overwrite it
+            self.write_stats()
+        if self.shared_grid is not None:
+            self.shared_grid.close()
+            if self.shared_grid_owned and os.path.exists(self.shared_grid.path):
+                os.remove(self.shared_grid.path)
+            self.shared_grid = None
+        if self.backend == 'sim':
+            self.process = None
+        elif self.alive():
+            try:
+                self.process.stdin.write(b'{ "cmd": "exit" }\n')
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class EnginePool:
+    # Hands out warm engine processes, so running many problems only pays the
+    # process start up once per concurrent worker
+    def __init__(self, size=None, path=ENGINE_PATH, delta=True, backend=None):
+        self.size = size or os.cpu_count()
+        self.path = path
+        self.delta = delta
+        self.backend = backend
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.engines = []
+
+    def acquire(self, task):
+        try:
+            engine = self.idle.get_nowait()
+        except queue.Empty:
+            engine = Engine(self.path, delta=self.delta, backend=self.backend)
+            with self.lock:
+                self.engines.append(engine)
+        try:
+            return engine.load(task)
+        except (EngineError, OSError):
+            # A dead engine never goes back in the pool
+            self.discard(engine)
+            raise
+
+    def release(self, engine):
+        if engine.alive() and self.idle.qsize() < self.size:
+            self.idle.put(engine)
+        else:
+            self.discard(engine)
+
+    def discard(self, engine):
+        engine.close()
+        with self.lock:
+            if engine in self.engines:
+                self.engines.remove(engine)
+
+    @contextmanager
+    def engine(self, task):
+        engine = self.acquire(task)
+        try:
+            yield engine
+        finally:
+            self.release(engine)
+
+    def close(self):
+        with self.lock:
+            for engine in self.engines:
+                engine.close()
+            self.engines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# One engine per process, for use from process pool workers
+_process_pool = None
+
+def process_engine_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = EnginePool(size=1)
+    return _process_pool
@@ -0,0 +1,136 @@
+# Opt-in profiling of the engine protocol
+#
+# With VAEA_STATS_FILE set the engine client (engine.py) times every command
+# it sends: the round trip, the json.dumps of the request and the json.loads
+# of the response, plus a latency histogram per command. Bots mark their own
+# work with engine.phase(name). When the engine is closed the summary is
+# written to the file together with the engine's own numbers from its "stats"
+# command (CPU time, serialization time and bytes written per command).
+#
+# The runner gives every problem its own file (run_solutions.py --stats) and
+# aggregate() adds them up to find the hot spots over the whole problem set.
+#
+# Histogram bucket k counts calls that took less than 2**k microseconds and
+# at least 2**(k-1), bucket 0 everything under a microsecond.
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+def latency_bucket(seconds):
+    return max(0, int(seconds * 1e6)).bit_length()
+
+def bucket_limit(bucket):
+    # Upper end of a histogram bucket in seconds
+    return 2 ** bucket / 1e6
+
+def new_entry():
+    return { "count": 0, "seconds": 0.0, "encode_seconds": 0.0, "decode_seconds": 0.0,
+             "bytes": 0, "histogram": {} }
+
+class Metrics:
+    def __init__(self):
+        self.commands = {}
+        self.phases = {}
+        self.started = time.perf_counter()
+
+    def record(self, cmd, seconds, encode_seconds=0.0, decode_seconds=0.0, size=0):
+        entry = self.commands.setdefault(cmd, new_entry())
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["encode_seconds"] += encode_seconds
+        entry["decode_seconds"] += decode_seconds
+        entry["bytes"] += size
+        bucket = str(latency_bucket(seconds))
+        entry["histogram"][bucket] = entry["histogram"].get(bucket, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        # Phases may nest, each one counts its own wall time
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, { "count": 0, "seconds": 0.0 })
+            entry["count"] += 1
+            entry["seconds"] += time.perf_counter() - start
+
+    def summary(self, engine_stats=None):
+        return {
+            "seconds": time.perf_counter() - self.started,
+            "commands": self.commands,
+            "phases": self.phases,
+            "engine": engine_stats or {},
+        }
+
+def merge_entries(total, entry):
+    for key, value in entry.items():
+        if key == "histogram":
+            histogram = total.setdefault("histogram", {})
+            for bucket, count in value.items():
+                histogram[bucket] = histogram.get(bucket, 0) + count
+        else:
+            total[key] = total.get(key, 0) + value
+
+def aggregate(summaries):
+    # Sum of several summaries, e.g. one per problem
+    total = { "seconds": 0.0, "commands": {}, "phases": {}, "engine": {}, "runs": 0 }
+    for summary in summaries:
+        total["seconds"] += summary.get("seconds", 0.0)
+        total["runs"] += summary.get("runs", 1)
+        for section in ("commands", "phases", "engine"):
+            for name, entry in summary.get(section, {}).items():
+                merge_entries(total[section].setdefault(name, {}), entry)
+    return total
+
+def write_summary(path, summary):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f)
+    os.replace(tmp_path, path)
+
+def read_summaries(paths):
+    summaries = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return summaries
+
+def percentile(histogram, fraction):
+    # Upper end of the bucket holding the given fraction of the calls
+    total = sum(histogram.values())
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            return bucket_limit(int(bucket))
+    return 0.0
+
+def hot_spots(summary, top=10):
+    # Report lines, the most expensive commands and phases first
+    lines = [f"{summary.get('runs', 1)} runs, {summary['seconds']:.1f}s"]
+    commands = sorted(summary["commands"].items(), key=lambda item: -item[1]["seconds"])
+    if commands:
+        lines.append("client      count   seconds    encode    decode        bytes      p50      p99")
+    for cmd, entry in commands[:top]:
+        lines.append(f"{cmd:<10} {entry['count']:>6} {entry['seconds']:>9.2f} {entry['encode_seconds']:>9.2f}"
+                     f" {entry['decode_seconds']:>9.2f} {entry['bytes']:>12}"
+                     f" {percentile(entry['histogram'], 0.5) * 1e3:>7.2f}ms"
+                     f" {percentile(entry['histogram'], 0.99) * 1e3:>7.2f}ms")
+    engine = sorted(summary["engine"].items(), key=lambda item: -item[1]["seconds"])
+    if engine:
+        lines.append("engine      count   seconds serialize        bytes")
+    for cmd, entry in engine[:top]:
+        lines.append(f"{cmd:<10} {entry['count']:>6} {entry['seconds']:>9.2f}"
+                     f" {entry['serialize_seconds']:>9.2f} {entry['bytes']:>12}")
+    phases = sorted(summary["phases"].items(), key=lambda item: -item[1]["seconds"])
+    if phases:
+        lines.append("phase       count   seconds")
+    for name, entry in phases[:top]:
+        lines.append(f"{name:<10} {entry['count']:>6} {entry['seconds']:>9.2f}")
+    return lines
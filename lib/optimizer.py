@@ -0,0 +1,150 @@
+# Shorten existing solutions by replaying them
+#
+# A replay records which steps did something: wrapped a cell, picked up a
+# booster, or any action other than a move or a turn. Everything between two
+# such steps is a detour, it only has to get the bot from where it was to
+# where the next useful step starts, facing the same way. The detour is
+# replaced by a shortest path plus the fewest turns, and the steps after the
+# last useful one are dropped. The result is replayed again and only kept
+# when it still wins and is strictly shorter.
+#
+# Solutions with several workers ('#') are left alone, their workers depend
+# on each other's timing.
+
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from engine import EngineError, process_engine_pool
+from distance import PathFinder
+from solution import (Result, join_moves, path_to_actions, read_solution_length, solution_length, solution_path,
+                      split_moves, write_atomic)
+from task import SOLUTIONS_DIR, load_grid, load_task, problem_name, walkable
+
+PLAIN_ACTIONS = set('WASDEQZ')
+ORIENTATIONS = ['^', '>', 'v', '<']
+
+Step = namedtuple('Step', ['action', 'useful', 'position', 'orientation'])
+
+def replay(engine, task, actions):
+    # Run actions one at a time, returns the steps and the final status
+    engine.load(task)
+    steps = []
+    for action in actions:
+        data = engine.action(action)
+        if data["status"].startswith("error"):
+            return steps, data["status"]
+        useful = action not in PLAIN_ACTIONS or len(data["wrapped_cells"]) > 0 \
+            or len(data["boosters_removed"]) > 0
+        steps.append(Step(action, useful, tuple(engine.position), engine.orientation))
+        if data["status"] == 'WIN':
+            break
+    return steps, engine.status
+
+def turns(before, after):
+    clockwise = (ORIENTATIONS.index(after) - ORIENTATIONS.index(before)) % 4
+    return [[], ['E'], ['E', 'E'], ['Q']][clockwise]
+
+def shorten(steps, start, paths):
+    # Keep the useful steps, replace each detour in between by a shortest one
+    actions = []
+    position, orientation = start
+    detour = []
+    for step in steps:
+        if not step.useful:
+            detour.append(step)
+            continue
+        if detour:
+            actions += shortest_detour(detour, position, orientation, paths)
+            detour = []
+        actions.append(step.action)
+        position, orientation = step.position, step.orientation
+    # Whatever comes after the last useful step is dropped
+    return actions
+
+def shortest_detour(detour, position, orientation, paths):
+    goal, goal_orientation = detour[-1].position, detour[-1].orientation
+    path = paths.path(position, goal)
+    if path is None:
+        return [step.action for step in detour]
+    replacement = turns(orientation, goal_orientation) + path_to_actions(path)
+    if len(replacement) < len(detour):
+        return replacement
+    return [step.action for step in detour]
+
+def optimize(engine, task, grid, moves, passes=5):
+    # Returns the shortest winning version of moves found, or None when moves
+    # does not win in the first place
+    if '#' in moves:
+        return None
+    actions = split_moves(moves.strip())
+    steps, status = replay(engine, task, actions)
+    if status != 'WIN':
+        return None
+    paths = PathFinder(walkable(np.asarray(grid)))
+    start = (tuple(task["initial_loc"]), '>')
+    best = [step.action for step in steps]
+    for i in range(passes):
+        candidate = shorten(steps, start, paths)
+        if len(candidate) >= len(best):
+            break
+        candidate_steps, status = replay(engine, task, candidate)
+        if status != 'WIN':
+            break
+        best = [step.action for step in candidate_steps]
+        steps = candidate_steps
+    return join_moves(best)
+
+def read_moves(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+def optimize_problem(problem, solutions_dir=SOLUTIONS_DIR):
+    # Optimize the best and the latest (tmp/) solution of a problem, the
+    # shortest result replaces the best one when it is strictly shorter
+    start = time.time()
+    task = load_task(problem)
+    grid = load_grid(problem)
+    best_path = solution_path(problem, solutions_dir)
+    best = read_solution_length(best_path)
+    candidates = [solution_path(problem, solutions_dir), solution_path(problem, os.path.join(solutions_dir, 'tmp'))]
+    pool = process_engine_pool()
+    shortest = None
+    for path in candidates:
+        moves = read_moves(path)
+        if not moves:
+            continue
+        engine = pool.acquire(task)
+        try:
+            moves = optimize(engine, task, grid, moves)
+        except EngineError:
+            moves = None
+        finally:
+            pool.release(engine)
+        if moves is not None and (shortest is None or solution_length(moves) < solution_length(shortest)):
+            shortest = moves
+    if shortest is None:
+        return Result(problem, '', None, 'Failed', time.time() - start, False)
+    steps = solution_length(shortest)
+    improved = best is None or steps < best
+    if improved:
+        write_atomic(best_path, shortest + '\n')
+    return Result(problem, shortest, steps, 'Ok', time.time() - start, improved)
+
+def optimize_all(problems, jobs=None, solutions_dir=SOLUTIONS_DIR, log=sys.stderr):
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(optimize_problem, problem, solutions_dir) for problem in problems]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{problem_name(result.problem)}: {result.status} {result.steps} steps"
+                  f" in {result.seconds:.1f}s{' (better)' if result.improved else ''}", file=log)
+            results.append(result)
+    return sorted(results, key=lambda result: result.problem)
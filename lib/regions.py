@@ -0,0 +1,91 @@
+# Splitting the free area of a map into connected regions of about the same
+# size, so several workers can each cover their own part of it.
+#
+# Grids are the [x, y] cell code arrays from task.py. Regions come back as an
+# owner array of the same shape holding the region number of every walkable
+# cell (-1 elsewhere).
+
+import heapq
+from collections import deque
+
+import numpy as np
+
+from solution import MOVES
+
+def neighbours(walk, x, y):
+    width, height = walk.shape
+    for dx, dy in MOVES:
+        i, j = x + dx, y + dy
+        if 0 <= i < width and 0 <= j < height and walk[i, j]:
+            yield (i, j)
+
+def bfs_path(walk, start, is_target):
+    # Shortest path from start to the closest cell is_target accepts, or None
+    start = tuple(start)
+    parent = { start: None }
+    queue = deque([start])
+    while queue:
+        location = queue.popleft()
+        if is_target(location):
+            path = []
+            while location is not None:
+                path.append(location)
+                location = parent[location]
+            return path[::-1]
+        for next_location in neighbours(walk, *location):
+            if next_location not in parent:
+                parent[next_location] = location
+                queue.append(next_location)
+    return None
+
+def kmeans_seeds(cells, k, iterations=10):
+    # Plain k-means on the cell coordinates, each centroid is then snapped to
+    # the closest cell so it can start a flood fill
+    cells = np.asarray(cells)
+    centroids = cells[np.linspace(0, len(cells) - 1, k).astype(int)].astype(float)
+    for iteration in range(iterations):
+        distances = ((cells[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        for i in range(k):
+            if (labels == i).any():
+                centroids[i] = cells[labels == i].mean(axis=0)
+    return [tuple(int(c) for c in cells[((cells - centroid) ** 2).sum(axis=1).argmin()])
+            for centroid in centroids]
+
+def balanced_flood(walk, targets, seeds):
+    # Grow one region from every seed, always extending the region that holds
+    # the fewest target cells so far. Regions stay connected and end up with
+    # about the same number of targets each.
+    owner = np.full(walk.shape, -1, dtype=np.int32)
+    frontiers = [deque() for seed in seeds]
+    sizes = [0] * len(seeds)
+    for i, (x, y) in enumerate(seeds):
+        if owner[x, y] == -1:
+            owner[x, y] = i
+            sizes[i] += int(targets[x, y])
+            frontiers[i].append((x, y))
+    heap = [(size, i) for i, size in enumerate(sizes)]
+    heapq.heapify(heap)
+    while heap:
+        size, i = heapq.heappop(heap)
+        frontier = frontiers[i]
+        while frontier:
+            x, y = frontier[0]
+            cell = next((c for c in neighbours(walk, x, y) if owner[c] == -1), None)
+            if cell is None:
+                frontier.popleft()
+                continue
+            owner[cell] = i
+            sizes[i] += int(targets[cell])
+            frontier.append(cell)
+            break
+        if frontier:
+            heapq.heappush(heap, (sizes[i], i))
+    return owner
+
+def partition(walk, targets, k):
+    # Split the target cells of a walkable mask into k connected regions
+    cells = np.argwhere(targets)
+    if len(cells) == 0:
+        return np.full(walk.shape, -1, dtype=np.int32)
+    return balanced_flood(walk, targets, kmeans_seeds(cells, min(k, len(cells))))
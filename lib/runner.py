@@ -0,0 +1,207 @@
+# Run a bot over many problems in parallel and keep the best solutions
+#
+# Every problem runs the bot script as its own process, at most `jobs` at a
+# time. The biggest maps go first since they dominate the wall time.
+#
+# In portfolio mode every problem runs several strategies (bots, or one bot
+# with different seeds) side by side. Each problem gets a budget file holding
+# the length of the best solution so far; the engine client stops a bot as
+# soon as its solution gets that long (see BUDGET_EXIT_CODE in engine.py), and
+# every new best lowers the budget for the strategies still running.
+#
+# With a stats_dir every run writes its profile there (see metrics.py), one
+# file per problem and strategy, for aggregate_stats to add up.
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from engine import BUDGET_EXIT_CODE
+from metrics import aggregate, read_summaries
+from scorer import score_moves
+from solution import Result, is_moves, read_solution_length, solution_length, solution_path, write_atomic
+from task import DATA_DIR, ROOT, SOLUTIONS_DIR, load_task, problem_name
+
+Strategy = namedtuple('Strategy', ['name', 'script', 'env'])
+
+def list_problems(data_dir=DATA_DIR):
+    return sorted(name[:-len('.desc')] for name in os.listdir(data_dir)
+                  if name.startswith('prob-') and name.endswith('.desc') and len(name) == len('prob-000.desc'))
+
+def problem_size(problem):
+    task = load_task(problem)
+    xs = [x for x, y in task["contour"]]
+    ys = [y for x, y in task["contour"]]
+    return (max(xs) - min(xs)) * (max(ys) - min(ys))
+
+def largest_first(problems):
+    return sorted(problems, key=problem_size, reverse=True)
+
+def last_line(output):
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    return lines[-1] if lines else ''
+
+def run_problem(script, problem, timeout=None, args=(), env=None):
+    start = time.time()
+    try:
+        completed = subprocess.run(
+            [script, problem_name(problem) + '.desc', *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=ROOT,
+            env=env,
+            timeout=timeout,
+            universal_newlines=True)
+    except subprocess.TimeoutExpired:
+        return Result(problem, '', None, 'Timeout', time.time() - start, False)
+    moves = last_line(completed.stdout)
+    if completed.returncode == BUDGET_EXIT_CODE:
+        return Result(problem, '', None, 'Over budget', time.time() - start, False)
+    if completed.returncode != 0 or not is_moves(moves):
+        return Result(problem, moves, None, 'Failed', time.time() - start, False)
+    return Result(problem, moves, solution_length(moves), 'Ok', time.time() - start, False)
+
+def validate(result, solutions_dir=SOLUTIONS_DIR):
+    # Replay a result that would beat the best solution, it is 'Invalid'
+    # when it does not win. The best only ever gets shorter, so a result
+    # that is not shorter now never needs the replay.
+    if result.status != 'Ok':
+        return result
+    best = read_solution_length(solution_path(result.problem, solutions_dir))
+    if best is not None and result.steps >= best:
+        return result
+    score = score_moves(result.problem, result.moves, result.strategy or '')
+    if not score.valid:
+        return result._replace(status='Invalid', score=score)
+    return result._replace(score=score)
+
+def promote(result, solutions_dir=SOLUTIONS_DIR, validated=False):
+    # Keep the new solution in tmp/ and move it in place when it is shorter
+    # and wins, see validate
+    if not validated:
+        result = validate(result, solutions_dir)
+    if result.status != 'Ok':
+        return result
+    tmp_dir = os.path.join(solutions_dir, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = solution_path(result.problem, tmp_dir)
+    write_atomic(tmp_path, result.moves + '\n')
+
+    best_path = solution_path(result.problem, solutions_dir)
+    best = read_solution_length(best_path)
+    if best is None or result.steps < best:
+        os.replace(tmp_path, best_path)
+        return result._replace(improved=True)
+    return result
+
+def journal_env(problem, solutions_dir, resume):
+    # Bots stream their moves to tmp/, with resume they carry on from there
+    tmp_dir = os.path.join(solutions_dir, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    env = dict(os.environ, VAEA_SOLUTION_FILE=solution_path(problem, tmp_dir))
+    if resume:
+        env['VAEA_RESUME'] = '1'
+    return env
+
+def stats_path(stats_dir, problem, strategy=None):
+    return os.path.join(stats_dir, problem_name(problem) + (f'-{strategy}' if strategy else '') + '.json')
+
+def stats_env(env, stats_dir, problem, strategy=None):
+    if stats_dir is None:
+        return env
+    return dict(env, VAEA_STATS_FILE=stats_path(stats_dir, problem, strategy))
+
+def aggregate_stats(stats_dir):
+    # The profiles of all runs in stats_dir added up
+    paths = [os.path.join(stats_dir, name) for name in sorted(os.listdir(stats_dir)) if name.endswith('.json')]
+    return aggregate(read_summaries(paths))
+
+def run_all(script, problems, jobs=None, timeout=None, solutions_dir=SOLUTIONS_DIR, log=sys.stderr, resume=False,
+            stats_dir=None):
+    jobs = jobs or os.cpu_count()
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_problem, script, problem, timeout,
+                               env=stats_env(journal_env(problem, solutions_dir, resume), stats_dir, problem))
+                   for problem in largest_first(problems)]
+        for future in as_completed(futures):
+            result = promote(future.result(), solutions_dir)
+            print(f"{problem_name(result.problem)}: {result.status} {result.steps} steps"
+                  f" in {result.seconds:.1f}s{' (better)' if result.improved else ''}", file=log)
+            results.append(result)
+    return sorted(results, key=lambda result: result.problem)
+
+def default_portfolio(seeds=3):
+    portfolio = [Strategy(name, f'./bots/{name}.py', {})
+                 for name in ['nearest_space', 'nearest_with_manips', 'eager_manips', 'sweep', 'region_planner']]
+    # vaea.py cuts every path at a random length, different seeds give
+    # noticeably different solutions
+    portfolio += [Strategy(f'vaea-{seed}', './bots/vaea.py', { 'VAEA_SEED': str(seed) })
+                  for seed in range(seeds)]
+    return portfolio
+
+def pick_best(problem, results, previous):
+    # The strategy that found the new best solution, or what we had before
+    # when none of them beat it
+    improved = [result for result in results if result.improved]
+    if improved:
+        return min(improved, key=lambda result: result.steps)
+    if previous is not None:
+        return Result(problem, '', previous, 'Kept', max(result.seconds for result in results), False)
+    statuses = [result.status for result in results]
+    status = 'Timeout' if 'Timeout' in statuses else 'Failed'
+    return Result(problem, '', None, status, max(result.seconds for result in results), False)
+
+def run_portfolio(strategies, problems, jobs=None, timeout=None, solutions_dir=SOLUTIONS_DIR, log=sys.stderr,
+                  stats_dir=None):
+    jobs = jobs or os.cpu_count()
+    lock = threading.Lock()
+    results = []
+    with tempfile.TemporaryDirectory() as budget_dir, ThreadPoolExecutor(max_workers=jobs) as pool:
+        budget_files = {}
+        previous = {}
+        for problem in problems:
+            previous[problem] = read_solution_length(solution_path(problem, solutions_dir))
+            budget_files[problem] = os.path.join(budget_dir, problem_name(problem) + '.budget')
+            if previous[problem] is not None:
+                write_atomic(budget_files[problem], f"{previous[problem]}\n")
+
+        def run(strategy, problem):
+            env = dict(os.environ, VAEA_BUDGET_FILE=budget_files[problem], **strategy.env)
+            env = stats_env(env, stats_dir, problem, strategy.name)
+            result = run_problem(strategy.script, problem, timeout, env=env)._replace(strategy=strategy.name)
+            # Replay outside the lock, only the compare and rename are shared
+            result = validate(result, solutions_dir)
+            with lock:
+                result = promote(result, solutions_dir, validated=True)
+                if result.improved:
+                    write_atomic(budget_files[problem], f"{result.steps}\n")
+            return result
+
+        futures = [pool.submit(run, strategy, problem)
+                   for problem in largest_first(problems) for strategy in strategies]
+        finished = { problem: [] for problem in problems }
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{problem_name(result.problem)} [{result.strategy}]: {result.status} {result.steps} steps"
+                  f" in {result.seconds:.1f}s{' (better)' if result.improved else ''}", file=log)
+            finished[result.problem].append(result)
+            if len(finished[result.problem]) == len(strategies):
+                results.append(pick_best(result.problem, finished[result.problem], previous[result.problem]))
+    return sorted(results, key=lambda result: result.problem)
+
+def problem_number(problem):
+    return int(problem_name(problem).split('-')[1])
+
+def write_scores(results, path):
+    # Same layout as the score files from the server: problem, steps, status,
+    # plus the winning strategy for portfolio runs
+    lines = [f"{problem_number(result.problem)}, {result.steps or 0}, {result.status}"
+             f"{', ' + result.strategy if result.strategy else ''}\n"
+             for result in results]
+    write_atomic(path, ''.join(lines))
@@ -0,0 +1,176 @@
+# Local scoring of .sol files
+#
+# A score is the number of time steps, not the file size. Every solution is
+# replayed on the engine (or the simulator with VAEA_BACKEND=sim) to check
+# that it actually wins, and the score is the number of ticks that replay took.
+#
+# Results go to an SQLite database keyed by problem, solution hash and bot.
+# The files table remembers the size and mtime of every scored file so
+# unchanged files are skipped, and a solution that was already replayed
+# under another name is not replayed again.
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import EngineError, process_engine_pool
+from solution import solution_length, split_moves
+from task import SOLUTIONS_DIR, load_task
+
+DB_PATH = os.path.join(SOLUTIONS_DIR, 'scores.sqlite')
+
+PROBLEM_RE = re.compile(r'((?:example|prob)-\d+)')
+
+# Version 0 databases scored clones as if they acted from tick 0
+SCHEMA_VERSION = 1
+
+Score = namedtuple('Score', ['problem', 'hash', 'bot', 'steps', 'status', 'valid'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    problem TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    bot TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    valid INTEGER NOT NULL,
+    scored_at REAL NOT NULL,
+    PRIMARY KEY (problem, hash, bot)
+);
+CREATE INDEX IF NOT EXISTS scores_best ON scores (problem, valid, steps);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    problem TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+'''
+
+def solution_hash(moves):
+    return hashlib.sha1(moves.strip().encode()).hexdigest()
+
+def problem_of(path):
+    match = PROBLEM_RE.search(os.path.basename(path))
+    return match.group(1) if match else None
+
+def replay_workers(engine, workers):
+    # Worker i plays workers[i] one action per tick, starting on the tick
+    # after it was cloned. Returns the final status and the ticks played.
+    cursors = []
+    ticks = 0
+    while engine.status == 'OK':
+        cursors += [0] * (len(engine.workers) - len(cursors))
+        actions = [workers[i][cursors[i]] if i < len(workers) and cursors[i] < len(workers[i]) else None
+                   for i in range(len(cursors))]
+        if all(action is None for action in actions):
+            break
+        data = engine.tick(actions)
+        if data["status"].startswith("error"):
+            return data["status"], ticks
+        ticks += 1
+        cursors = [cursor + (action is not None) for cursor, action in zip(cursors, actions)]
+    if len(workers) > len(engine.workers):
+        return "error: Moves for a worker that was never cloned", ticks
+    return engine.status, ticks
+
+def validate(engine, task, moves):
+    # The final status of playing moves from the start ('WIN' when valid)
+    # and the number of ticks played
+    workers = [split_moves(worker_moves) for worker_moves in moves.strip().split('#')]
+    engine.load(task)
+    if len(workers) == 1:
+        data = engine.do_moves(workers[0])
+        return data["status"], data["executed"]
+    return replay_workers(engine, workers)
+
+def score_moves(problem, moves, bot):
+    task = load_task(problem)
+    pool = process_engine_pool()
+    try:
+        with pool.engine(task) as engine:
+            status, steps = validate(engine, task, moves)
+    except (EngineError, OSError) as error:
+        status, steps = f"error: {error}", solution_length(moves)
+    return Score(problem, solution_hash(moves), bot, steps, status, status == 'WIN')
+
+def open_db(path=DB_PATH):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    if db.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        # Older scores can not be trusted, every file is scored again
+        db.executescript(f'DELETE FROM scores; DELETE FROM files; PRAGMA user_version = {SCHEMA_VERSION};')
+    return db
+
+def save_score(db, score):
+    db.execute('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)',
+               (*score[0:5], int(score.valid), time.time()))
+
+def save_scores(scores, db_path=DB_PATH):
+    db = open_db(db_path)
+    for score in scores:
+        save_score(db, score)
+    db.commit()
+    db.close()
+
+def known_score(db, problem, hash):
+    return db.execute('SELECT steps, status, valid FROM scores WHERE problem = ? AND hash = ? LIMIT 1',
+                      (problem, hash)).fetchone()
+
+def save_file(db, path, stat, score):
+    db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+               (path, stat.st_size, stat.st_mtime, score.problem, score.hash))
+
+def score_files(entries, db_path=DB_PATH, jobs=None, log=sys.stderr):
+    # entries are (path, bot) pairs, returns the scores that were (re)computed.
+    # A file is only marked as scored together with its score, and every
+    # replay is committed as it finishes, so a pool that breaks halfway only
+    # loses the replays still running.
+    db = open_db(db_path)
+    scores = []
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            for path, bot in entries:
+                problem = problem_of(path)
+                stat = os.stat(path)
+                row = db.execute('SELECT size, mtime FROM files WHERE path = ?', (path,)).fetchone()
+                if problem is None or row == (stat.st_size, stat.st_mtime):
+                    continue
+                with open(path) as f:
+                    moves = f.read().strip()
+                if not moves:
+                    continue
+                hash = solution_hash(moves)
+                known = known_score(db, problem, hash)
+                if known is not None:
+                    score = Score(problem, hash, bot, known[0], known[1], bool(known[2]))
+                    save_score(db, score)
+                    save_file(db, path, stat, score)
+                    scores.append(score)
+                else:
+                    pending[pool.submit(score_moves, problem, moves, bot)] = (path, stat)
+            db.commit()
+            for future in as_completed(pending):
+                path, stat = pending[future]
+                score = future.result()
+                save_score(db, score)
+                save_file(db, path, stat, score)
+                db.commit()
+                scores.append(score)
+                print(f"{os.path.relpath(path)}: {score.steps} steps, {score.status}", file=log)
+    finally:
+        db.close()
+    return scores
+
+def best_scores(db_path=DB_PATH):
+    # problem -> (steps, bot) of the shortest valid solution
+    db = open_db(db_path)
+    rows = db.execute('SELECT problem, MIN(steps), bot FROM scores WHERE valid GROUP BY problem').fetchall()
+    db.close()
+    return { problem: (steps, bot) for problem, steps, bot in rows }
@@ -0,0 +1,101 @@
+# Zero copy view of the engine's cell grid
+#
+# After Engine.share_grid() the engine keeps its grid in a memory mapped
+# file, updated before every response, and the bot maps the same file as a
+# NumPy array. Reading the map then costs nothing on the protocol. The
+# layout (see share_grid in engine.ml), integers are little endian u32:
+#
+#   0   b"VAEAGRID"
+#   8   width
+#   12  height
+#   16  generation, odd while the engine is writing
+#   20  action_count
+#   32  one byte per cell at x * height + y, cell codes from task.py
+#
+# Between commands the engine does not write, so grid can be used as is.
+# read() also copes with a grid that is being written, e.g. from another
+# process watching a running bot.
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from task import FREE
+
+MAGIC = b'VAEAGRID'
+HEADER_SIZE = 32
+# Writing a whole 400x400 grid takes well under a millisecond, a generation
+# that stays odd this long belongs to a writer that died halfway
+READ_TIMEOUT = 1.0
+READ_RETRY_DELAY = 0.0001
+
+def default_path():
+    # POSIX shared memory lives in /dev/shm on Linux, plain files elsewhere
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    fd, path = tempfile.mkstemp(prefix='vaea-grid-', dir=directory)
+    os.close(fd)
+    return path
+
+class SharedGrid:
+    def __init__(self, path):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if self.buffer[0:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"not a shared grid: {path}")
+        self.header = self.buffer[8:HEADER_SIZE].view('<u4')
+        width, height = int(self.header[0]), int(self.header[1])
+        # Read only view, indexed [x, y] like everywhere else
+        self.grid = self.buffer[HEADER_SIZE:HEADER_SIZE + width * height].reshape((width, height))
+
+    @property
+    def generation(self):
+        return int(self.header[2])
+
+    @property
+    def action_count(self):
+        return int(self.header[3])
+
+    def read(self, timeout=READ_TIMEOUT):
+        # A copy of the grid that the engine was not halfway through writing
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = self.generation
+            if generation % 2 == 0:
+                grid = np.array(self.grid)
+                if self.generation == generation:
+                    return grid
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"shared grid {self.path} was still being written after {timeout}s")
+            time.sleep(READ_RETRY_DELAY)
+
+    def unwrapped_count(self):
+        return int(np.count_nonzero(self.grid == FREE))
+
+    def close(self):
+        self.grid = self.header = self.buffer = None
+
+class SharedGridWriter:
+    # The engine's side, for the simulator
+    def __init__(self, path, grid):
+        width, height = grid.shape
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='w+', shape=(HEADER_SIZE + width * height,))
+        self.buffer[0:len(MAGIC)] = np.frombuffer(MAGIC, dtype=np.uint8)
+        self.header = self.buffer[8:HEADER_SIZE].view('<u4')
+        self.header[0:2] = [width, height]
+        self.grid = self.buffer[HEADER_SIZE:].reshape((width, height))
+        self.generation = 0
+
+    def write(self, grid, action_count, cells=None):
+        # Copies grid over, or only the (x, y) cells of it that changed
+        self.header[2] = self.generation + 1
+        if cells is None:
+            self.grid[...] = grid
+        elif cells:
+            xs, ys = np.array(cells).T
+            self.grid[xs, ys] = grid[xs, ys]
+        self.generation += 2
+        self.header[3] = action_count
+        self.header[2] = self.generation
@@ -0,0 +1,844 @@
+# In-process simulator with the same command API as game_engine/engine.native
+#
+# The rules follow perform_action in engine.ml (including its quirks) so the
+# two backends can be swapped freely, see Engine(backend="sim"). The map is a
+# NumPy grid of the cell codes from task.py, indexed [x, y].
+#
+# Actions change that grid in place. Every state has a Changes node with the
+# cells its action wrapped, chained back to the loaded map like the action
+# log, so going back to a snapshot only touches the cells wrapped since the
+# two states parted (see checkout). Everything else in a state is replaced,
+# never modified, and states share what they did not change.
+
+import copy
+import hashlib
+import json
+import os
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from shared_grid import HEADER_SIZE, SharedGridWriter
+from solution import split_moves
+from task import CELL_CHARS, FREE, OBSTACLE, WALL, WRAPPED, map_size, rasterize
+
+CELL_CODES = { "W": WALL, "O": OBSTACLE, "-": FREE, "+": WRAPPED }
+CELL_STRINGS = np.array(['W', 'O', '-', '+'])
+
+ROTATE_CLOCKWISE = { "^": ">", ">": "v", "v": "<", "<": "^" }
+ROTATE_COUNTERCLOCKWISE = { "^": "<", "<": "v", "v": ">", ">": "^" }
+
+# Checkpoint files, the layout is described above checkpoint_magic in engine.ml
+CHECKPOINT_MAGIC = b'VAEACKPT'
+CHECKPOINT_VERSION = 2
+
+# Side of the square regions unwrapped cells are counted in, as in engine.ml
+REGION_SIZE = 8
+
+MOVES = {
+    "W": (0, 1),
+    "S": (0, -1),
+    "A": (-1, 0),
+    "D": (1, 0),
+}
+
+class SimulatorError(Exception):
+    # Same as the engine's Error, reported back in the status
+    pass
+
+class SimulatorFatalError(Exception):
+    # Same as the engine's FatalError, the engine process dies on these
+    pass
+
+def covered_cells(x1, y1, x2, y2):
+    # Port of covered_cells in engine.ml, the cells a manipulator ray crosses
+    points = [(x1, y1)]
+    x, y = x1, y1
+    dx, dy = x2 - x1, y2 - y1
+    ystep = -1 if dy < 0 else 1
+    xstep = -1 if dx < 0 else 1
+    dx, dy = abs(dx), abs(dy)
+    ddx, ddy = 2 * dx, 2 * dy
+    if ddx >= ddy:
+        error = errorprev = dx
+        for i in range(dx):
+            x += xstep
+            error += ddy
+            if error > ddx:
+                y += ystep
+                error -= ddx
+                if error + errorprev < ddx:
+                    points.append((x, y - ystep))
+                elif error + errorprev > ddx:
+                    points.append((x - xstep, y))
+            points.append((x, y))
+            errorprev = error
+    else:
+        error = errorprev = dy
+        for i in range(dy):
+            y += ystep
+            error += ddx
+            if error > ddy:
+                x += xstep
+                error -= ddy
+                if error + errorprev < ddy:
+                    points.append((x - xstep, y))
+                elif error + errorprev > ddy:
+                    points.append((x, y - ystep))
+            points.append((x, y))
+            errorprev = error
+    return points
+
+_ray_cache = {}
+
+def ray_offsets(dx, dy):
+    # Rays only depend on the manipulator offset, not on where the worker is
+    key = (dx, dy)
+    if key not in _ray_cache:
+        _ray_cache[key] = covered_cells(0, 0, dx, dy)
+    return _ray_cache[key]
+
+_arm_cache = {}
+
+def arm_masks(manipulators):
+    # Same as arm_of_manipulators in engine.ml: the cells all rays of an arm
+    # cross, and one bitmask per manipulator of the cells its ray needs
+    key = tuple(map(tuple, manipulators))
+    if key not in _arm_cache:
+        index = {}
+        masks = []
+        for dx, dy in key:
+            mask = 0
+            for cell in ray_offsets(dx, dy):
+                mask |= 1 << index.setdefault(cell, len(index))
+            masks.append(mask)
+        _arm_cache[key] = (list(index), list(zip(key, masks)))
+    return _arm_cache[key]
+
+def action_strings(state):
+    # The action log is a chain of ((worker, action), previous) pairs, most
+    # recent first like engine.ml's action_log, so states can share it
+    strings = [[] for worker in state["workers"]]
+    log = state["action_log"]
+    while log is not None:
+        (worker_num, action), log = log
+        if worker_num < len(strings):
+            strings[worker_num].append(action)
+    return [''.join(reversed(actions)) for actions in strings]
+
+def action_log_of_strings(strings):
+    log = None
+    for worker_num, moves in enumerate(strings):
+        for action in split_moves(moves):
+            log = ((worker_num, action), log)
+    return log
+
+class Changes:
+    # Cells one action wrapped, depth counts the actions since the map was loaded
+    __slots__ = ("depth", "cells", "previous")
+
+    def __init__(self, previous=None):
+        self.depth = 0 if previous is None else previous.depth + 1
+        self.cells = []
+        self.previous = previous
+
+def changed_cells(node, goal):
+    # Cells of the Changes nodes from either node or goal back to where they
+    # parted, every cell that can differ between the two states
+    cells = set()
+    while node is not goal:
+        if node.depth >= goal.depth:
+            cells.update(node.cells)
+            node = node.previous
+        else:
+            cells.update(goal.cells)
+            goal = goal.previous
+    return list(cells)
+
+def map_digest(grid):
+    # MD5 of engine.ml's traversable grid, one byte per cell that is not a
+    # wall or an obstacle
+    return hashlib.md5(((grid == FREE) | (grid == WRAPPED)).astype(np.uint8).tobytes()).digest()
+
+def initial_worker(position):
+    return {
+        "position": list(position),
+        "active_boosters": [],
+        "manipulators": [[0,0], [1,0], [1,1], [1,-1]],
+        "orientation": ">",
+    }
+
+def extract_manipulator_action(action):
+    # B(x,y) attaches a manipulator, T(x,y) teleports
+    if action[0:2] in ('B(', 'T(') and action.endswith(')'):
+        x, y = action[2:-1].split(',')
+        return (action[0], int(x), int(y))
+    return (action, 0, 0)
+
+def unterminated_action(moves):
+    # The tail split_moves in engine.ml fails on, like "B(1,2" with no ")"
+    start = moves.rfind('(')
+    if start > 0 and moves.find(')', start) < 0:
+        return moves[start - 1:]
+    return None
+
+def use_booster(state, booster):
+    if booster not in state["inventory"]:
+        raise SimulatorError("Invalid state")
+    inventory = list(state["inventory"])
+    inventory.remove(booster)
+    state["inventory"] = inventory
+
+class Simulator:
+    def __init__(self, task=None):
+        self.mode = "full"
+        self.framing = "json"
+        self.state = None
+        self.snapshots = {}
+        self.next_snapshot = 0
+        self.stats_enabled = False
+        self.stats = {}
+        # SharedGridWriter and the (grid, Changes node) it last wrote
+        self.shared = None
+        self.shared_synced = None
+        if task is not None:
+            self.load_task(task)
+
+    # -- state -------------------------------------------------------------
+
+    def load_task(self, task):
+        width, height = map_size(task)
+        if "grid" in task:
+            codes = np.frombuffer(task["grid"].encode(), dtype=np.uint8)
+            lookup = np.zeros(256, dtype=np.uint8)
+            for char, code in CELL_CODES.items():
+                lookup[ord(char)] = code
+            grid = lookup[codes].reshape((width, height))
+        else:
+            grid = rasterize(task)
+        self.state = {
+            "status": "OK",
+            "grid": grid.copy(),
+            "width": width,
+            "height": height,
+            "inventory": [],
+            "boosters": [list(booster) for booster in task["boosters"]],
+            "action_log": None,
+            "action_count": 0,
+            "workers": [initial_worker(task["initial_loc"])],
+            "beacons": [],
+            "changes": Changes(),
+        }
+        self.state["unwrapped_total"] = self.count_unwrapped(self.state)
+        self.snapshots = {}
+        self.update_wrapped_state(self.state)
+        return { "status": "loaded" }
+
+    def next_state(self, state, worker_num):
+        # The state an action starts from: the acting worker is copied, the
+        # rest is shared with state until it is replaced
+        new_state = dict(state, changes=Changes(state["changes"]))
+        new_state["workers"] = list(state["workers"])
+        new_state["workers"][worker_num] = dict(state["workers"][worker_num])
+        return new_state
+
+    def wrap(self, state, x, y):
+        state["grid"][x, y] = WRAPPED
+        state["changes"].cells.append((x, y))
+        state["unwrapped_total"] -= 1
+
+    def checkout(self, current, target):
+        # Turn the grid of current into the grid of target, two states of the
+        # same map. Undoes the actions back to where they parted and redoes
+        # target's, returns the cells that became unwrapped and wrapped.
+        grid = current["grid"]
+        node, goal = current["changes"], target["changes"]
+        reverted = set()
+        redo = []
+        while node is not goal:
+            if node.depth >= goal.depth:
+                for x, y in node.cells:
+                    grid[x, y] = FREE
+                reverted.update(node.cells)
+                node = node.previous
+            else:
+                redo.append(goal)
+                goal = goal.previous
+        wrapped = set()
+        for node in redo:
+            for x, y in node.cells:
+                grid[x, y] = WRAPPED
+            wrapped.update(node.cells)
+        return ([list(cell) for cell in sorted(reverted - wrapped)],
+                [list(cell) for cell in sorted(wrapped - reverted)])
+
+    def wrapped_since(self, before, after):
+        # Cells wrapped from before to after, a later state of it
+        cells = []
+        node = after["changes"]
+        while node is not before["changes"]:
+            cells += node.cells
+            node = node.previous
+        return [list(cell) for cell in sorted(cells)]
+
+    def cell(self, state, x, y):
+        if 0 <= x < state["width"] and 0 <= y < state["height"]:
+            return state["grid"][x, y]
+        return None
+
+    def count_unwrapped(self, state):
+        return int(np.count_nonzero(state["grid"] == FREE))
+
+    def unwrapped_cells(self, state):
+        return np.argwhere(state["grid"] == FREE).tolist()
+
+    def region_counts(self, state):
+        width, height = state["width"], state["height"]
+        padded = np.zeros((-(-width // REGION_SIZE) * REGION_SIZE,
+                           -(-height // REGION_SIZE) * REGION_SIZE), dtype=np.int64)
+        padded[0:width, 0:height] = state["grid"] == FREE
+        regions = padded.reshape((padded.shape[0] // REGION_SIZE, REGION_SIZE,
+                                  padded.shape[1] // REGION_SIZE, REGION_SIZE)).sum(axis=(1, 3))
+        return [[int(rx), int(ry), int(regions[rx, ry])] for rx, ry in np.argwhere(regions > 0)]
+
+    def clip_viewport(self, state, viewport):
+        x0, y0, x1, y1 = viewport
+        return [max(x0, 0), max(y0, 0), min(x1, state["width"] - 1), min(y1, state["height"] - 1)]
+
+    def state_string(self, state, viewport=None):
+        x0, y0, x1, y1 = self.clip_viewport(state, viewport or [0, 0, state["width"] - 1, state["height"] - 1])
+        chars = CELL_CHARS[state["grid"][x0:x1 + 1, y0:y1 + 1]].copy()
+        for x, y, booster in reversed(state["boosters"]):
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                chars[x - x0, y - y0] = ord(booster)
+        for worker in reversed(state["workers"]):
+            x, y = worker["position"]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                chars[x - x0, y - y0] = ord(worker["orientation"])
+        rows = chars.T[::-1]
+        return ''.join(row.tobytes().decode() + "\n" for row in rows)
+
+    def get_state_string(self, data):
+        state = self.state
+        if data.get("viewport") is not None:
+            if len(data["viewport"]) != 4:
+                raise SimulatorError("Invalid viewport")
+            viewport = list(data["viewport"])
+        elif data.get("radius") is not None:
+            radius = data["radius"]
+            cx, cy = data.get("center") or self.worker_position(data)
+            viewport = [cx - radius, cy - radius, cx + radius, cy + radius]
+        else:
+            viewport = [0, 0, state["width"] - 1, state["height"] - 1]
+        return {
+            "status": state["status"],
+            "state_string": self.state_string(state, viewport),
+            "viewport": self.clip_viewport(state, viewport),
+        }
+
+    def state_to_json(self, state):
+        if self.framing == "binary":
+            # What the engine's binary frame decodes to, see engine.decode_frame
+            return {
+                "status": state["status"],
+                "bot_position": list(state["workers"][0]["position"]),
+                "grid": state["grid"].copy(),
+                "map_width": state["width"],
+                "map_height": state["height"],
+                "inventory": list(state["inventory"]),
+                "boosters": copy.deepcopy(state["boosters"]),
+                "action_count": state["action_count"],
+                "workers": copy.deepcopy(state["workers"]),
+                "beacons": copy.deepcopy(state["beacons"]),
+            }
+        return {
+            "status": state["status"],
+            "bot_position": list(state["workers"][0]["position"]),
+            "map": CELL_STRINGS[state["grid"]].tolist(),
+            "map_width": state["width"],
+            "map_height": state["height"],
+            "inventory": list(state["inventory"]),
+            "boosters": copy.deepcopy(state["boosters"]),
+            "action_count": state["action_count"],
+            "workers": copy.deepcopy(state["workers"]),
+            "beacons": copy.deepcopy(state["beacons"]),
+            "unwrapped_cells": self.unwrapped_cells(state),
+        }
+
+    def load_state(self, data):
+        width, height = data["map_width"], data["map_height"]
+        strings = data.get("action_string", "").split('#')
+        # Same checks as load_game_state in engine.ml, get_state has no moves
+        action_count = sum(len(split_moves(moves)) for moves in strings)
+        if data.get("action_count", 0) > 0 and action_count == 0:
+            raise SimulatorError("Missing action_string")
+        if data.get("action_count", action_count) != action_count:
+            raise SimulatorError("action_string does not match action_count")
+        lookup = np.vectorize(lambda char: CELL_CODES.get(char, WALL), otypes=[np.uint8])
+        state = {
+            "status": data["status"],
+            "grid": lookup(np.array(data["map"])).reshape((width, height)),
+            "width": width,
+            "height": height,
+            "inventory": list(data["inventory"]),
+            "boosters": copy.deepcopy(data["boosters"]),
+            "action_log": action_log_of_strings(strings),
+            "workers": copy.deepcopy(data["workers"]),
+            "beacons": copy.deepcopy(data.get("beacons", [])),
+            "changes": Changes(),
+        }
+        state["action_count"] = action_count
+        state["unwrapped_total"] = self.count_unwrapped(state)
+        return state
+
+    def save_checkpoint(self, data):
+        # Same file as engine.ml's checkpoints, byte for byte, see CHECKPOINT_MAGIC
+        state = self.state
+        bitmap = np.packbits(state["grid"].ravel() == WRAPPED, bitorder='little').tobytes()
+        fields = json.dumps({
+            "status": state["status"],
+            "workers": state["workers"],
+            "inventory": state["inventory"],
+            "boosters": state["boosters"],
+            "beacons": state["beacons"],
+            "action_string": '#'.join(action_strings(state)),
+        }, separators=(',', ':')).encode()
+        tmp_path = data["path"] + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(CHECKPOINT_MAGIC)
+                f.write(struct.pack('>5I', CHECKPOINT_VERSION, state["width"], state["height"],
+                                    len(bitmap), len(fields)))
+                f.write(map_digest(state["grid"]))
+                f.write(bitmap)
+                f.write(fields)
+            os.replace(tmp_path, data["path"])
+        except OSError as e:
+            raise SimulatorError("Cannot write checkpoint: " + str(e))
+        return { "status": state["status"], "action_count": state["action_count"] }
+
+    def load_checkpoint(self, data):
+        # On top of the loaded task, like engine.ml
+        width, height = self.state["width"], self.state["height"]
+        try:
+            with open(data["path"], 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            raise SimulatorError("Cannot read checkpoint: " + str(e))
+        header_size = len(CHECKPOINT_MAGIC) + 5 * 4 + 16
+        if len(content) < header_size or content[0:len(CHECKPOINT_MAGIC)] != CHECKPOINT_MAGIC:
+            raise SimulatorError("Invalid checkpoint")
+        version, checkpoint_width, checkpoint_height, bitmap_size, fields_size = \
+            struct.unpack('>5I', content[len(CHECKPOINT_MAGIC):header_size - 16])
+        if version != CHECKPOINT_VERSION or bitmap_size != (checkpoint_width * checkpoint_height + 7) // 8 \
+                or len(content) != header_size + bitmap_size + fields_size:
+            raise SimulatorError("Invalid checkpoint")
+        if (checkpoint_width, checkpoint_height) != (width, height) \
+                or content[header_size - 16:header_size] != map_digest(self.state["grid"]):
+            raise SimulatorError("Checkpoint of another map")
+        bitmap = np.frombuffer(content, dtype=np.uint8, count=bitmap_size, offset=header_size)
+        wrapped = np.unpackbits(bitmap, count=width * height, bitorder='little').reshape((width, height))
+        try:
+            fields = json.loads(content[header_size + bitmap_size:].decode())
+            strings = fields["action_string"].split('#')
+            state = {
+                "status": fields["status"],
+                "width": width,
+                "height": height,
+                "inventory": list(fields["inventory"]),
+                "boosters": [list(booster) for booster in fields["boosters"]],
+                "action_log": action_log_of_strings(strings),
+                "action_count": sum(len(split_moves(moves)) for moves in strings),
+                "workers": fields["workers"],
+                "beacons": [list(beacon) for beacon in fields["beacons"]],
+                "changes": Changes(),
+            }
+        except (ValueError, KeyError, TypeError):
+            raise SimulatorError("Invalid checkpoint")
+        if not state["workers"]:
+            raise SimulatorError("Invalid checkpoint")
+        # Walls and obstacles come from the task
+        grid = self.state["grid"].copy()
+        open_cells = (grid == FREE) | (grid == WRAPPED)
+        grid[open_cells] = np.where(wrapped[open_cells] == 1, WRAPPED, FREE)
+        state["grid"] = grid
+        state["unwrapped_total"] = self.count_unwrapped(state)
+        return state
+
+    # -- rules -------------------------------------------------------------
+
+    def update_wrapped_state(self, state):
+        for worker in state["workers"]:
+            x, y = worker["position"]
+            cells, offsets = arm_masks(worker["manipulators"])
+            opaque = 0
+            for bit, (i, j) in enumerate(cells):
+                if self.cell(state, x + i, y + j) in (WALL, OBSTACLE):
+                    opaque |= 1 << bit
+            for (dx, dy), mask in offsets:
+                if mask & opaque == 0 and self.cell(state, x + dx, y + dy) == FREE:
+                    self.wrap(state, x + dx, y + dy)
+
+    def pick_up_boosters(self, state, worker_num):
+        x, y = state["workers"][worker_num]["position"]
+        found = [b for b in state["boosters"] if b[0] == x and b[1] == y and b[2] != "X"]
+        if found:
+            state["boosters"] = [b for b in state["boosters"] if b not in found]
+            if self.cell(state, x, y) == FREE:
+                self.wrap(state, x, y)
+            state["inventory"] = state["inventory"] + [b[2] for b in found]
+
+    def validate_location(self, state, worker_num):
+        x, y = state["workers"][worker_num]["position"]
+        if self.cell(state, x, y) in (None, WALL, OBSTACLE):
+            raise SimulatorError("Invalid state")
+
+    def perform_action(self, action, state, worker_num=0):
+        if not 0 <= worker_num < len(state["workers"]):
+            raise SimulatorError("Invalid worker")
+        name, x, y = extract_manipulator_action(action)
+        previous = state
+        state = self.next_state(state, worker_num)
+        try:
+            self.apply_action(state, worker_num, name, x, y)
+        except SimulatorError:
+            self.checkout(state, previous)
+            raise
+        state["action_log"] = ((worker_num, action), state["action_log"])
+        state["action_count"] += 1
+        state["status"] = "OK" if state["unwrapped_total"] > 0 else "WIN"
+        return state
+
+    def apply_action(self, state, worker_num, name, x, y):
+        worker = state["workers"][worker_num]
+        if name in MOVES:
+            dx, dy = MOVES[name]
+            worker["position"] = [worker["position"][0] + dx, worker["position"][1] + dy]
+        elif name == "Z":
+            pass
+        elif name == "E":
+            worker["manipulators"] = [[j, -i] for i, j in worker["manipulators"]]
+            worker["orientation"] = ROTATE_CLOCKWISE[worker["orientation"]]
+        elif name == "Q":
+            worker["manipulators"] = [[-j, i] for i, j in worker["manipulators"]]
+            worker["orientation"] = ROTATE_COUNTERCLOCKWISE[worker["orientation"]]
+        elif name == "B":
+            if "B" not in state["inventory"]:
+                raise SimulatorError("Invalid state")
+            manipulators = [b for b in state["inventory"] if b == "B"]
+            others = [b for b in state["inventory"] if b != "B"]
+            state["inventory"] = manipulators[1:] + others
+            worker["manipulators"] = [[x, y]] + worker["manipulators"]
+        elif name == "F":
+            worker["active_boosters"] = [{ "booster": "F", "time_left": 50 }] + \
+                [b for b in worker["active_boosters"] if b["booster"] != "F"]
+        elif name == "C":
+            if [worker["position"][0], worker["position"][1], "X"] not in state["boosters"]:
+                raise SimulatorError("Invalid state")
+            use_booster(state, "C")
+            state["workers"] = state["workers"] + [initial_worker(worker["position"])]
+        elif name == "R":
+            if worker["position"] in state["beacons"]:
+                raise SimulatorError("Invalid state")
+            use_booster(state, "R")
+            state["beacons"] = [list(worker["position"])] + state["beacons"]
+        elif name == "T":
+            if [x, y] not in state["beacons"]:
+                raise SimulatorError("Invalid state")
+            worker["position"] = [x, y]
+        else:
+            raise SimulatorFatalError("Unknown or unimplemented action: " + name)
+        self.update_wrapped_state(state)
+        self.pick_up_boosters(state, worker_num)
+        self.validate_location(state, worker_num)
+
+    # -- responses ---------------------------------------------------------
+
+    def state_delta_fields(self, before, after, wrapped_cells):
+        return {
+            "status": after["status"],
+            "bot_position": list(after["workers"][0]["position"]),
+            "wrapped_cells": wrapped_cells,
+            "workers": copy.deepcopy(after["workers"]),
+            "inventory": list(after["inventory"]),
+            "boosters_removed": [b for b in before["boosters"] if b not in after["boosters"]],
+        }
+
+    def action_result(self, before, after):
+        if self.mode == "full":
+            return self.state_to_json(after)
+        return self.state_delta_fields(before, after, self.wrapped_since(before, after))
+
+    def tick(self, data):
+        # Workers cloned during the tick only act from the next one
+        actions = data["actions"]
+        if len(actions) > len(self.state["workers"]):
+            raise SimulatorError("Too many actions")
+        state = self.state
+        try:
+            for worker_num in range(len(self.state["workers"])):
+                action = actions[worker_num] if worker_num < len(actions) else None
+                state = self.perform_action(action or "Z", state, worker_num)
+        except SimulatorError:
+            self.checkout(state, self.state)
+            raise
+        return state
+
+    def do_moves(self, data):
+        state = self.state
+        executed = 0
+        unterminated = unterminated_action(data["moves"])
+        if unterminated is not None:
+            # Like the engine: nothing runs and the state keeps its status
+            result = { "executed": 0, "remaining": 0 }
+            result.update(self.state_delta_fields(
+                state, dict(state, status="error: Unterminated action: " + unterminated), []))
+            return result
+        actions = split_moves(data["moves"])
+        for action in actions:
+            try:
+                next_state = self.perform_action(action, state, data.get("worker", 0))
+            except SimulatorError as e:
+                state = dict(state, status="error: " + str(e))
+                break
+            picked_up = len(next_state["inventory"]) > len(state["inventory"])
+            state = next_state
+            executed += 1
+            if state["status"] == "WIN" or (data.get("stop_on_pickup") and picked_up):
+                break
+        result = { "executed": executed, "remaining": len(actions) - executed }
+        result.update(self.state_delta_fields(self.state, state, self.wrapped_since(self.state, state)))
+        self.state = state
+        return result
+
+    def restore(self, data):
+        handle = data["snapshot"]
+        if handle not in self.snapshots:
+            raise SimulatorError(f"Unknown snapshot: {handle}")
+        target = self.snapshots[handle]
+        reverted, wrapped = self.checkout(self.state, target)
+        if self.mode == "full":
+            result = self.state_to_json(target)
+        else:
+            result = {
+                "snapshot": handle,
+                "reverted_cells": reverted,
+                "boosters_added": [b for b in target["boosters"] if b not in self.state["boosters"]],
+            }
+            result.update(self.state_delta_fields(self.state, target, wrapped))
+        self.state = target
+        return result
+
+    def neighbours(self, state, x, y):
+        for i, j in ((x-1, y), (x+1, y), (x, y-1), (x, y+1)):
+            if self.cell(state, i, j) in (FREE, WRAPPED):
+                yield (i, j)
+
+    def nearest_path(self, state, start, is_target):
+        start = tuple(start)
+        parent = { start: None }
+        queue = deque([start])
+        while queue:
+            location = queue.popleft()
+            if is_target(location):
+                path = []
+                while location is not None:
+                    path.append(list(location))
+                    location = parent[location]
+                return path[::-1]
+            for next_location in self.neighbours(state, *location):
+                if next_location not in parent:
+                    parent[next_location] = location
+                    queue.append(next_location)
+        return None
+
+    def path_to_actions(self, path):
+        actions = []
+        for (x1, y1), (x2, y2) in zip(path, path[1:]):
+            for action, (dx, dy) in MOVES.items():
+                if (x2 - x1, y2 - y1) == (dx, dy):
+                    actions.append(action)
+                    break
+            else:
+                actions.append("Z")
+        return actions
+
+    def worker_position(self, data):
+        worker_num = data.get("worker", 0)
+        if not 0 <= worker_num < len(self.state["workers"]):
+            raise SimulatorError("Invalid worker")
+        return self.state["workers"][worker_num]["position"]
+
+    def get_path(self, data):
+        target = tuple(data["target"])
+        path = self.nearest_path(self.state, self.worker_position(data),
+                                 lambda location: location == target)
+        if path is None:
+            # The engine dies with Not_found here
+            raise SimulatorFatalError("No path to " + str(target))
+        return { "path_commands": self.path_to_actions(path), "path": path }
+
+    def get_nearest(self, data):
+        targets = set(tuple(target) for target in data.get("targets") or [])
+        if data.get("boosters") is not None:
+            types = data["boosters"]
+            for x, y, booster in self.state["boosters"]:
+                if (not types and booster != "X") or booster in types:
+                    targets.add((x, y))
+        want_unwrapped = data.get("unwrapped")
+        grid = self.state["grid"]
+        def is_target(location):
+            return location in targets or (want_unwrapped and grid[location] == FREE)
+        path = self.nearest_path(self.state, self.worker_position(data), is_target)
+        if path is None:
+            return { "target": None, "path_commands": [], "path": [] }
+        return { "target": path[-1], "path_commands": self.path_to_actions(path), "path": path }
+
+    def get_unwrapped(self, data):
+        result = { "unwrapped_count": self.state["unwrapped_total"] }
+        if data.get("radius") is not None:
+            cx, cy = data.get("center") or self.state["workers"][0]["position"]
+            cells = np.argwhere(self.state["grid"] == FREE)
+            distances = np.abs(cells[:, 0] - cx) + np.abs(cells[:, 1] - cy)
+            result["cells"] = cells[distances <= data["radius"]].tolist()
+        if data.get("regions"):
+            result["region_size"] = REGION_SIZE
+            result["regions"] = self.region_counts(self.state)
+        return result
+
+    def stats_command(self, data):
+        # Same as the engine's "stats", nothing is serialized in process so
+        # serialize_seconds and bytes stay 0
+        if "enable" in data:
+            self.stats_enabled = bool(data["enable"])
+        commands = { cmd: dict(entry) for cmd, entry in sorted(self.stats.items()) }
+        if data.get("reset"):
+            self.stats = {}
+        return { "status": "OK", "enabled": self.stats_enabled, "commands": commands }
+
+    def share_grid(self, data):
+        if data.get("path") is None:
+            self.shared = None
+        else:
+            self.shared = SharedGridWriter(data["path"], self.state["grid"])
+            self.shared_synced = None
+            self.sync_shared_grid()
+        return {
+            "status": "OK",
+            "path": self.shared.path if self.shared is not None else None,
+            "offset": HEADER_SIZE,
+            "map_width": self.state["width"],
+            "map_height": self.state["height"],
+        }
+
+    def sync_shared_grid(self):
+        # The same grid and Changes node is the same map. On the same grid
+        # only the cells of the Changes nodes between the two can differ,
+        # like sync_shared_grid in engine.ml. A new grid is copied whole.
+        state = self.state
+        if self.shared is None or state is None:
+            return
+        if self.shared_synced is not None and self.shared_synced[0] is state["grid"]:
+            if self.shared_synced[1] is not state["changes"]:
+                self.shared.write(state["grid"], state["action_count"],
+                                  changed_cells(self.shared_synced[1], state["changes"]))
+        else:
+            if self.shared.grid.shape != state["grid"].shape:
+                self.shared = SharedGridWriter(self.shared.path, state["grid"])
+            self.shared.write(state["grid"], state["action_count"])
+        self.shared_synced = (state["grid"], state["changes"])
+
+    def command(self, data):
+        try:
+            if self.state is None or not self.stats_enabled:
+                return self.run_command(data)
+            start = time.process_time()
+            try:
+                return self.run_command(data)
+            finally:
+                entry = self.stats.setdefault(str(data.get("cmd")), {
+                    "count": 0, "seconds": 0.0, "serialize_seconds": 0.0, "bytes": 0,
+                })
+                entry["count"] += 1
+                entry["seconds"] += time.process_time() - start
+        finally:
+            self.sync_shared_grid()
+
+    def run_command(self, data):
+        if self.state is None:
+            # Like the engine, the first message is the task
+            return self.load_task(data)
+        cmd = data.get("cmd")
+        before = self.state
+        try:
+            if cmd == "get_state":
+                return self.state_to_json(self.state)
+            elif cmd == "load_task":
+                return self.load_task(data["task"])
+            elif cmd == "load_state":
+                self.state = self.load_state(data["state"])
+                self.snapshots = {}
+                return self.state_to_json(self.state)
+            elif cmd == "save_checkpoint":
+                return self.save_checkpoint(data)
+            elif cmd == "load_checkpoint":
+                self.state = self.load_checkpoint(data)
+                self.snapshots = {}
+                return self.state_to_json(self.state)
+            elif cmd == "set_mode":
+                if data["mode"] not in ("full", "delta"):
+                    raise SimulatorError("Invalid mode: " + data["mode"])
+                self.mode = data["mode"]
+                return { "status": "OK", "mode": self.mode }
+            elif cmd == "set_framing":
+                if data["framing"] not in ("json", "binary"):
+                    raise SimulatorError("Invalid framing: " + data["framing"])
+                self.framing = data["framing"]
+                return { "status": "OK", "framing": self.framing }
+            elif cmd == "action":
+                self.state = self.perform_action(data["action"], self.state, data.get("worker", 0))
+                return self.action_result(before, self.state)
+            elif cmd == "tick":
+                self.state = self.tick(data)
+                return self.action_result(before, self.state)
+            elif cmd == "do_moves":
+                return self.do_moves(data)
+            elif cmd == "snapshot":
+                # A reference is enough, restore checks the grid out again
+                handle = self.next_snapshot
+                self.next_snapshot += 1
+                self.snapshots[handle] = self.state
+                return { "status": "OK", "snapshot": handle }
+            elif cmd == "restore":
+                return self.restore(data)
+            elif cmd == "drop":
+                if data["snapshot"] not in self.snapshots:
+                    raise SimulatorError(f"Unknown snapshot: {data['snapshot']}")
+                del self.snapshots[data["snapshot"]]
+                return { "status": "OK", "snapshot": data["snapshot"] }
+            elif cmd == "get_path":
+                return self.get_path(data)
+            elif cmd == "get_nearest":
+                return self.get_nearest(data)
+            elif cmd == "get_unwrapped":
+                return self.get_unwrapped(data)
+            elif cmd == "get_actions":
+                return {
+                    "status": self.state["status"],
+                    "action_string": '#'.join(action_strings(self.state)),
+                    "action_count": self.state["action_count"],
+                }
+            elif cmd == "get_state_string":
+                return self.get_state_string(data)
+            elif cmd == "stats":
+                return self.stats_command(data)
+            elif cmd == "share_grid":
+                return self.share_grid(data)
+            elif cmd == "exit":
+                return None
+            raise SimulatorError("Unknown command: " + str(cmd))
+        except SimulatorError as e:
+            self.state = dict(before, status="error: " + str(e))
+            return self.action_result(before, self.state)
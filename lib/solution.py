@@ -0,0 +1,155 @@
+# Helpers for solution move strings like "WDB(1,2)QF#CDDS"
+
+import heapq
+import os
+import re
+import tempfile
+from collections import namedtuple
+
+from task import SOLUTIONS_DIR, problem_name
+
+ACTION_RE = re.compile(r'[A-Z](?:\(-?\d+,-?\d+\))?')
+# A whole solution: the actions of every worker, separated by '#'
+MOVES_RE = re.compile(r'(?:[WASDZQEFLRC]|[BT]\(-?\d+,-?\d+\))*'
+                      r'(?:#(?:[WASDZQEFLRC]|[BT]\(-?\d+,-?\d+\))*)*$')
+JOURNAL_RE = re.compile(r'(\d+) ((?:[A-Z](?:\(-?\d+,-?\d+\))?)*)$|@ (\d+)$')
+
+# Actions between two fsyncs of a journal, a crash loses at most this many
+CHECKPOINT_INTERVAL = 1000
+
+MOVES = {
+    (0, 1): 'W',
+    (0, -1): 'S',
+    (-1, 0): 'A',
+    (1, 0): 'D',
+}
+
+# One solution for one problem, from a bot run or the optimizer. score is the
+# scorer's replay from runner.validate, when there was one
+Result = namedtuple('Result', ['problem', 'moves', 'steps', 'status', 'seconds', 'improved', 'strategy', 'score'],
+                    defaults=[None, None])
+
+def split_moves(moves):
+    return ACTION_RE.findall(moves)
+
+def is_moves(text):
+    # False for anything a bot might print last that is not a solution
+    text = text.strip()
+    return MOVES_RE.match(text) is not None and len(split_moves(text)) > 0
+
+def join_moves(actions):
+    return ''.join(actions)
+
+def worker_starts(workers):
+    # The tick each worker's first action follows: a clone starts acting on
+    # the tick after the C that made it, clones get their numbers in the
+    # order their C actions run (by tick, then by the worker that cloned)
+    starts = [0] * len(workers)
+    clones = []
+    def push(worker):
+        for i, action in enumerate(workers[worker]):
+            if action == 'C':
+                heapq.heappush(clones, (starts[worker] + i + 1, worker))
+    push(0)
+    for worker in range(1, len(workers)):
+        if not clones:
+            break
+        starts[worker] = heapq.heappop(clones)[0]
+        push(worker)
+    return starts
+
+def solution_length(moves):
+    # Time steps, not bytes: "B(1,2)" is a single step and workers separated
+    # by "#" act in parallel, each from the tick it was cloned on
+    workers = [split_moves(worker_moves) for worker_moves in moves.strip().split('#')]
+    return max(start + len(actions) for start, actions in zip(worker_starts(workers), workers))
+
+def path_to_actions(path):
+    # The moves that walk a path of neighbouring cells
+    return [MOVES[(x2 - x1, y2 - y1)] for (x1, y1), (x2, y2) in zip(path, path[1:])]
+
+def solution_path(problem, solutions_dir=SOLUTIONS_DIR):
+    return os.path.join(solutions_dir, problem_name(problem) + '.sol')
+
+def read_solution_length(path):
+    try:
+        with open(path) as f:
+            moves = f.read()
+    except OSError:
+        return None
+    try:
+        return solution_length(moves) if moves.strip() else None
+    except ValueError:
+        return None
+
+def write_atomic(path, text):
+    # Write next to the destination then rename, readers never see half a
+    # file and a crash right after leaves either the old or the new one
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def journal_path(path):
+    return path + '.log'
+
+def checkpoint_path(path):
+    return path + '.ckpt'
+
+class SolutionWriter:
+    # Streams the actions a bot commits to a journal next to the .sol file
+    # they end up in, so an interrupted run can be resumed. Every line is
+    # "worker actions"; "@ n" after a restore keeps only the first n actions
+    # written before it. The .sol file itself is written once the map is won.
+    def __init__(self, path, append=False, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.file = open(journal_path(path), 'a' if append else 'w')
+        self.pending = 0
+
+    def write(self, worker, actions):
+        self.file.write(f"{worker} {join_moves(actions)}\n")
+        self.pending += len(actions)
+        if self.pending >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def truncate(self, count):
+        self.file.write(f"@ {count}\n")
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def finish(self, moves):
+        write_atomic(self.path, moves + '\n')
+        self.file.close()
+        os.remove(journal_path(self.path))
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+def read_journal(path):
+    # The (worker, action) pairs a journal holds, in the order they were
+    # played. A line cut short by a crash ends the journal.
+    actions = []
+    try:
+        with open(journal_path(path)) as f:
+            lines = f.read().split('\n')
+    except OSError:
+        return actions
+    # Only complete lines count, the last one has no newline yet if it was cut
+    for line in lines[:-1]:
+        match = JOURNAL_RE.match(line)
+        if match is None:
+            break
+        if match.group(3) is not None:
+            del actions[int(match.group(3)):]
+        else:
+            worker = int(match.group(1))
+            actions += [(worker, action) for action in split_moves(match.group(2))]
+    return actions
@@ -0,0 +1,114 @@
+# Nearest target queries by Manhattan distance over a changing set of cells
+#
+# Cells go into square buckets of BUCKET_SIZE. A query visits the buckets in
+# rings around the query point and skips every bucket whose closest possible
+# cell is already farther than the k-th best found, so a query only looks at
+# the few buckets near the answer instead of every target. Deleting a cell as
+# it gets wrapped is a set removal.
+#
+# Distances are Manhattan distances on the grid, not path lengths: walls are
+# ignored. Use the engine's get_nearest when the real path length matters.
+
+import heapq
+
+BUCKET_SIZE = 16
+
+class TargetIndex:
+    def __init__(self, cells=(), bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.count = 0
+        # Bucket coordinates seen so far, rings past them are always empty
+        self.extent = None
+        for cell in cells:
+            self.add(cell)
+
+    def bucket_of(self, cell):
+        return (cell[0] // self.bucket_size, cell[1] // self.bucket_size)
+
+    def add(self, cell):
+        cell = (int(cell[0]), int(cell[1]))
+        key = self.bucket_of(cell)
+        bucket = self.buckets.setdefault(key, set())
+        if cell in bucket:
+            return
+        bucket.add(cell)
+        self.count += 1
+        if self.extent is None:
+            self.extent = [key[0], key[1], key[0], key[1]]
+        else:
+            self.extent = [min(self.extent[0], key[0]), min(self.extent[1], key[1]),
+                           max(self.extent[2], key[0]), max(self.extent[3], key[1])]
+
+    def discard(self, cell):
+        cell = (int(cell[0]), int(cell[1]))
+        key = self.bucket_of(cell)
+        bucket = self.buckets.get(key)
+        if bucket is None or cell not in bucket:
+            return
+        bucket.remove(cell)
+        self.count -= 1
+        if not bucket:
+            del self.buckets[key]
+
+    def __contains__(self, cell):
+        bucket = self.buckets.get(self.bucket_of(cell))
+        return bucket is not None and (int(cell[0]), int(cell[1])) in bucket
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            yield from bucket
+
+    def bucket_bound(self, point, key):
+        # Smallest distance from point to any cell of a bucket
+        size = self.bucket_size
+        dx = max(0, key[0] * size - point[0], point[0] - (key[0] * size + size - 1))
+        dy = max(0, key[1] * size - point[1], point[1] - (key[1] * size + size - 1))
+        return dx + dy
+
+    def ring(self, center, r):
+        # Bucket keys at Chebyshev distance r from center, inside the extent
+        cx, cy = center
+        x0, y0, x1, y1 = self.extent
+        if r == 0:
+            keys = [(cx, cy)]
+        else:
+            keys = [(x, y) for x in range(cx - r, cx + r + 1) for y in (cy - r, cy + r)]
+            keys += [(x, y) for x in (cx - r, cx + r) for y in range(cy - r + 1, cy + r)]
+        return [key for key in keys if x0 <= key[0] <= x1 and y0 <= key[1] <= y1]
+
+    def nearest(self, point, k=1):
+        # Up to k (distance, cell) pairs, closest first, ties broken by cell
+        if self.count == 0 or k <= 0:
+            return []
+        point = (int(point[0]), int(point[1]))
+        center = self.bucket_of(point)
+        x0, y0, x1, y1 = self.extent
+        last_ring = max(center[0] - x0, x1 - center[0], center[1] - y0, y1 - center[1])
+        # Max heap of the k best so far as (-distance, -x, -y)
+        best = []
+        for r in range(last_ring + 1):
+            # Every bucket in ring r is at least this far away
+            if len(best) == k and r > 0 and (r - 1) * self.bucket_size + 1 > -best[0][0]:
+                break
+            for key in self.ring(center, r):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    continue
+                if len(best) == k and self.bucket_bound(point, key) > -best[0][0]:
+                    continue
+                for cell in bucket:
+                    entry = (-(abs(cell[0] - point[0]) + abs(cell[1] - point[1])), -cell[0], -cell[1])
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+        return sorted((-d, (-x, -y)) for d, x, y in best)
+
+    def nearest_one(self, point):
+        # The closest cell, or None when there is none
+        found = self.nearest(point, 1)
+        return found[0][1] if found else None
@@ -0,0 +1,111 @@
+# Reading of .desc problem files into the task JSON the engine expects.
+#
+# This is the same format bin/parse-task produces, without having to start a
+# perl interpreter for every problem. The map is also rasterized here, once
+# per .desc file, and cached on disk so the engine does not have to test
+# every cell against every polygon on each run.
+
+import hashlib
+import os
+import re
+
+import numpy as np
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DATA_DIR = os.path.join(ROOT, 'data')
+SOLUTIONS_DIR = os.path.join(ROOT, 'solutions')
+CACHE_DIR = os.path.join(ROOT, 'cache', 'tasks')
+
+# Cell codes of a rasterized grid, indexed [x, y] like the engine's "map"
+WALL = 0
+OBSTACLE = 1
+FREE = 2
+WRAPPED = 3
+CELL_CHARS = np.frombuffer(b'WO-+', dtype=np.uint8)
+
+POINT_RE = re.compile(r'\((\d+),(\d+)\)')
+BOOSTER_RE = re.compile(r'(\w)\((\d+),(\d+)\)')
+
+def parse_points(text):
+    return [[int(x), int(y)] for x, y in POINT_RE.findall(text)]
+
+def parse_desc(text):
+    # contour # initial location # obstacles (;) # boosters (;)
+    contour, initial_loc, obstacles, boosters = (text.strip().split('#') + [''] * 4)[0:4]
+    return {
+        "contour": parse_points(contour),
+        "initial_loc": parse_points(initial_loc)[0],
+        "obstacles": [parse_points(obstacle) for obstacle in obstacles.split(';') if obstacle],
+        "boosters": [[int(x), int(y), kind] for kind, x, y in BOOSTER_RE.findall(boosters)],
+    }
+
+def problem_path(problem):
+    # Accept "prob-001", "prob-001.desc" or a path to a .desc file
+    if os.path.exists(problem):
+        return problem
+    if not problem.endswith('.desc'):
+        problem += '.desc'
+    return os.path.join(DATA_DIR, problem)
+
+def problem_name(problem):
+    return os.path.basename(problem_path(problem))[:-len('.desc')]
+
+def map_size(task):
+    # The engine's map spans 0..max x by 0..max y of the contour
+    return (max(x for x, y in task["contour"]), max(y for x, y in task["contour"]))
+
+def polygon_parity(polygons, width, height):
+    # Scanline fill of rectilinear polygons. A cell is inside when an odd
+    # number of vertical edges lie at or left of it on its row, same as the
+    # ray test in the engine's inside_polygon.
+    toggles = np.zeros((height, width + 1), dtype=np.uint8)
+    for polygon in polygons:
+        for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[0:1]):
+            if y1 == y2:
+                continue
+            if x1 != x2:
+                raise ValueError(f"Not a rectilinear edge: ({x1},{y1}) ({x2},{y2})")
+            if x1 <= width:
+                toggles[max(min(y1, y2), 0):min(max(y1, y2), height), x1] ^= 1
+    return (np.cumsum(toggles[:, 0:width], axis=1, dtype=np.int32) % 2).T.astype(bool)
+
+def rasterize(task):
+    width, height = map_size(task)
+    grid = np.full((width, height), WALL, dtype=np.uint8)
+    grid[polygon_parity([task["contour"]], width, height)] = FREE
+    if task["obstacles"]:
+        grid[polygon_parity(task["obstacles"], width, height)] = OBSTACLE
+    return grid
+
+def load_grid(problem, text=None, cache_dir=CACHE_DIR):
+    # Rasterized grid for a problem, cached by the hash of the .desc contents
+    if text is None:
+        with open(problem_path(problem)) as f:
+            text = f.read()
+    cache_path = os.path.join(cache_dir, hashlib.sha1(text.encode()).hexdigest() + '.npy')
+    try:
+        return np.load(cache_path, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+    grid = rasterize(parse_desc(text))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, grid)
+    os.replace(tmp_path, cache_path)
+    return grid
+
+def walkable(grid):
+    # Cells a worker can stand on, wrapped or not
+    return (grid == FREE) | (grid == WRAPPED)
+
+def grid_to_string(grid):
+    # The engine's "grid" task field: one cell character per cell at x * height + y
+    return CELL_CHARS[np.asarray(grid)].tobytes().decode()
+
+def load_task(problem, grid=True):
+    with open(problem_path(problem)) as f:
+        text = f.read()
+    task = parse_desc(text)
+    if grid:
+        task["grid"] = grid_to_string(load_grid(problem, text))
+    return task
@@ -0,0 +1,26 @@
+import sys
+sys.path.append('lib/')
+import numpy as np
+from coverage import column_segments, decompose, fill_small_holes, tour, tour_length
+from task import parse_desc, rasterize, walkable
+
+def test_column_segments():
+    assert column_segments(np.array([True, True, False, True, False])) == [(0, 1), (3, 3)]
+    assert column_segments(np.array([False, False])) == []
+
+def test_decompose_around_obstacle():
+    # One side of the obstacle carries on the cell, the other gets its own
+    grid = rasterize(parse_desc("(0,0),(9,0),(9,9),(0,9)#(0,0)#(3,3),(6,3),(6,6),(3,6)#"))
+    cells = decompose(walkable(grid))
+    assert len(cells) == 2
+    assert sum(y1 - y0 + 1 for cell in cells for x, y0, y1 in cell) == 81 - 9
+    assert all(x == cell[0][0] + i for cell in cells for i, (x, y0, y1) in enumerate(cell))
+    assert len(decompose(fill_small_holes(walkable(grid), 9))) == 1
+    assert len(decompose(fill_small_holes(walkable(grid), 8))) == 2
+
+def test_tour():
+    points = [(10, 0), (0, 10), (5, 0), (0, 5), (10, 10)]
+    order = tour(points, (0, 0))
+    assert sorted(order) == list(range(5))
+    assert tour_length(points, order, (0, 0)) == 35
+    assert tour([], (0, 0)) == []
@@ -0,0 +1,27 @@
+import random
+import sys
+sys.path.append('lib/')
+import numpy as np
+from distance import PathFinder
+from regions import bfs_path
+from task import load_grid, walkable
+
+def test_path_around_walls():
+    walk = np.ones((3, 3), dtype=bool)
+    walk[1, 0:2] = False
+    paths = PathFinder(walk)
+    assert paths.path((0, 0), (2, 0)) == [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0)]
+    assert paths.distance((0, 0), (0, 0)) == 0
+    assert paths.path((0, 0), (1, 0)) is None
+    walk[2, 1] = False
+    assert PathFinder(walk).distance((0, 0), (2, 0)) is None
+
+def test_paths_match_bfs():
+    walk = walkable(np.asarray(load_grid('prob-150')))
+    paths = PathFinder(walk)
+    cells = [tuple(int(c) for c in cell) for cell in np.argwhere(walk)]
+    rng = random.Random(1)
+    for i in range(10):
+        start, goal = rng.choice(cells), rng.choice(cells)
+        path = bfs_path(walk, start, lambda cell: cell == goal)
+        assert paths.distance(start, goal) == len(path) - 1
@@ -0,0 +1,48 @@
+import json
+import sys
+sys.path.append('lib/')
+from engine import Engine
+from metrics import Metrics, aggregate, hot_spots, latency_bucket, percentile
+from task import load_task
+
+def test_latency_histogram():
+    assert latency_bucket(0) == 0
+    assert latency_bucket(3e-6) == 2
+    metrics = Metrics()
+    for seconds in [1e-5, 1e-5, 1e-5, 1e-2]:
+        metrics.record('action', seconds, size=10)
+    entry = metrics.commands['action']
+    assert entry['count'] == 4
+    assert entry['bytes'] == 40
+    assert sum(entry['histogram'].values()) == 4
+    assert percentile(entry['histogram'], 0.5) < 1e-4
+    assert percentile(entry['histogram'], 0.99) >= 1e-2
+
+def test_aggregate():
+    first = Metrics()
+    first.record('get_path', 0.5)
+    with first.phase('target'):
+        pass
+    second = Metrics()
+    second.record('get_path', 0.25)
+    second.record('action', 0.1)
+    total = aggregate([first.summary(), second.summary({ 'get_path': { 'count': 1, 'seconds': 0.2 } })])
+    assert total['runs'] == 2
+    assert total['commands']['get_path']['count'] == 2
+    assert total['commands']['get_path']['seconds'] == 0.75
+    assert total['phases']['target']['count'] == 1
+    assert total['engine']['get_path']['seconds'] == 0.2
+
+def test_engine_writes_stats(tmp_path, monkeypatch):
+    path = tmp_path / 'example-01.json'
+    monkeypatch.setenv('VAEA_STATS_FILE', str(path))
+    with Engine(backend='sim') as engine:
+        engine.load(load_task('example-01'))
+        with engine.phase('target'):
+            path_commands = engine.get_nearest(unwrapped=True)["path_commands"]
+        engine.do_moves(path_commands)
+    summary = json.loads(path.read_text())
+    assert summary['commands']['get_nearest']['count'] == 1
+    assert summary['phases']['target']['count'] == 1
+    assert summary['engine']['do_moves']['count'] == 1
+    assert 'get_nearest' in '\n'.join(hot_spots(aggregate([summary])))
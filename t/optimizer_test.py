@@ -0,0 +1,33 @@
+import sys
+sys.path.append('lib/')
+from engine import Engine
+from optimizer import optimize, turns
+from solution import split_moves
+from task import load_grid, load_task
+
+def read_moves(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def test_turns():
+    assert turns('>', '>') == []
+    assert turns('>', 'v') == ['E']
+    assert turns('^', 'v') == ['E', 'E']
+    assert turns('^', '<') == ['Q']
+
+def test_optimize_removes_detours():
+    engine = Engine(backend='sim')
+    task = load_task('example-01')
+    moves = read_moves('data/example-01-1.sol')
+    actions = split_moves(moves)
+    # A pointless turn and a detour over wrapped cells, then junk at the end
+    wasteful = ''.join(actions[0:3]) + 'EQ' + 'SW' + ''.join(actions[3:]) + 'WWSS'
+    optimized = optimize(engine, task, load_grid('example-01'), wasteful)
+    assert len(split_moves(optimized)) <= len(actions)
+    engine.load(task)
+    assert engine.do_moves(optimized)["status"] == 'WIN'
+
+def test_optimize_rejects_losing_solutions():
+    engine = Engine(backend='sim')
+    assert optimize(engine, load_task('example-01'), load_grid('example-01'), 'WWW') is None
+    assert optimize(engine, load_task('example-01'), load_grid('example-01'), 'W#W') is None
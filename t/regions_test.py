@@ -0,0 +1,43 @@
+import sys
+sys.path.append('lib/')
+import numpy as np
+from regions import bfs_path, partition
+from solution import path_to_actions
+from task import FREE, load_grid, parse_desc, rasterize, walkable
+
+def connected(owner, region):
+    cells = set(map(tuple, np.argwhere(owner == region)))
+    start = next(iter(cells))
+    seen = { start }
+    stack = [start]
+    while stack:
+        x, y = stack.pop()
+        for cell in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+            if cell in cells and cell not in seen:
+                seen.add(cell)
+                stack.append(cell)
+    return seen == cells
+
+def test_partition_open_map():
+    grid = rasterize(parse_desc("(0,0),(20,0),(20,20),(0,20)#(0,0)##"))
+    owner = partition(walkable(grid), grid == FREE, 4)
+    sizes = [int((owner == region).sum()) for region in range(4)]
+    assert sum(sizes) == 400
+    assert max(sizes) - min(sizes) <= 4
+    assert all(connected(owner, region) for region in range(4))
+
+def test_partition_with_obstacles():
+    grid = load_grid('prob-221')
+    targets = grid == FREE
+    owner = partition(walkable(grid), targets, 3)
+    assert (owner[targets] >= 0).all()
+    sizes = [int((owner[targets] == region).sum()) for region in range(3)]
+    assert max(sizes) < 1.2 * min(sizes)
+    assert all(connected(owner, region) for region in range(3))
+
+def test_bfs_path():
+    grid = rasterize(parse_desc("(0,0),(4,0),(4,3),(0,3)#(0,0)#(1,0),(2,0),(2,2),(1,2)#"))
+    path = bfs_path(walkable(grid), (0, 0), lambda cell: cell == (3, 0))
+    assert path[0] == (0, 0) and path[-1] == (3, 0)
+    assert len(path_to_actions(path)) == 7
+    assert bfs_path(walkable(grid), (0, 0), lambda cell: cell == (1, 1)) is None
@@ -0,0 +1,113 @@
+import os
+import sys
+sys.path.append('lib/')
+import pytest
+from engine import BudgetExceeded, Engine
+from runner import Strategy, largest_first, promote, run_portfolio, run_problem, write_scores
+from task import load_task
+from solution import Result, solution_length
+
+def read_moves(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def test_solution_length():
+    assert solution_length("WDB(1,2)QF\n") == 5
+    # Worker 1 is cloned on tick 4, the unspawned worker 2 counts from 0
+    assert solution_length("WWWC#DD#DDDD") == 6
+    # Clones of clones, the example replays in 28 ticks
+    assert solution_length(read_moves('data/example-03-1.sol')) == 28
+    assert solution_length("CC#WWW#W") == 4
+
+def test_largest_first():
+    assert largest_first(['prob-001', 'prob-300', 'prob-150']) == ['prob-300', 'prob-150', 'prob-001']
+
+def test_promote_keeps_shorter(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    moves = read_moves('data/example-01-1.sol')
+    best = tmp_path / 'example-01.sol'
+    best.write_text(moves + "\n")
+
+    longer = 'Z' + moves
+    result = promote(Result('example-01', longer, solution_length(longer), 'Ok', 0.1, False), str(tmp_path))
+    assert not result.improved
+    assert best.read_text() == moves + "\n"
+    assert (tmp_path / 'tmp' / 'example-01.sol').read_text() == longer + "\n"
+
+    # Shorter but it does not win
+    result = promote(Result('example-01', 'WWWW', 4, 'Ok', 0.1, False), str(tmp_path))
+    assert (result.status, result.improved) == ('Invalid', False)
+    assert not result.score.valid
+    assert best.read_text() == moves + "\n"
+
+    best.write_text(longer + "\n")
+    result = promote(Result('example-01', moves, solution_length(moves), 'Ok', 0.1, False), str(tmp_path))
+    assert result.improved
+    assert (result.score.steps, result.score.valid) == (result.steps, True)
+    assert best.read_text() == moves + "\n"
+
+def test_run_problem_rejects_other_output(tmp_path):
+    script = fake_bot(tmp_path, 'error', '####### ERROR: invalid state ######').script
+    assert run_problem(script, 'example-01').status == 'Failed'
+    script = fake_bot(tmp_path, 'moves', 'WDB(1,2)#QF').script
+    assert run_problem(script, 'example-01').status == 'Ok'
+
+def test_write_scores(tmp_path):
+    path = str(tmp_path / 'score.csv')
+    write_scores([Result('prob-001', 'WW', 2, 'Ok', 0.1, False),
+                  Result('prob-002', '', None, 'Timeout', 9.0, False)], path)
+    assert open(path).read() == "1, 2, Ok\n2, 0, Timeout\n"
+
+def test_write_scores_with_strategy(tmp_path):
+    path = str(tmp_path / 'score.csv')
+    write_scores([Result('prob-001', 'WW', 2, 'Ok', 0.1, True, 'vaea-1'),
+                  Result('prob-002', '', 7, 'Kept', 9.0, False)], path)
+    assert open(path).read() == "1, 2, Ok, vaea-1\n2, 7, Kept\n"
+
+def test_budget_stops_engine(tmp_path, monkeypatch):
+    budget = tmp_path / 'budget'
+    budget.write_text("3\n")
+    monkeypatch.setenv('VAEA_BUDGET_FILE', str(budget))
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    engine.do_moves('WW')
+    with pytest.raises(BudgetExceeded) as error:
+        engine.action('W')
+    assert error.value.code == 3
+
+def test_promote_compares_ticks(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    best = tmp_path / 'example-03.sol'
+    best.write_text('W' * 25 + "\n")
+    # 23 moves for the busiest worker, 28 ticks in all
+    moves = read_moves('data/example-03-1.sol')
+    result = promote(Result('example-03', moves, solution_length(moves), 'Ok', 0.1, False), str(tmp_path))
+    assert (result.steps, result.improved) == (28, False)
+    assert best.read_text() == 'W' * 25 + "\n"
+
+def fake_bot(tmp_path, name, moves, delay=0):
+    script = tmp_path / name
+    script.write_text(f"#!{sys.executable}\nimport time\ntime.sleep({delay})\nprint('{moves}')\n")
+    script.chmod(0o755)
+    return Strategy(name, str(script), {})
+
+def test_run_portfolio_keeps_best(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    moves = read_moves('data/example-01-1.sol')
+    solutions = tmp_path / 'solutions'
+    solutions.mkdir()
+    strategies = [fake_bot(tmp_path, 'long', 'Z' + moves), fake_bot(tmp_path, 'short', moves, 0.2),
+                  fake_bot(tmp_path, 'broken', ''), fake_bot(tmp_path, 'cheat', 'WWW')]
+    results = run_portfolio(strategies, ['example-01'], jobs=4, solutions_dir=str(solutions),
+                            log=open(os.devnull, 'w'))
+    assert [(result.steps, result.status, result.strategy) for result in results] == [(48, 'Ok', 'short')]
+    assert (solutions / 'example-01.sol').read_text() == moves + "\n"
+
+    # The shortest output does not win, it must not become the best either
+    results = run_portfolio(strategies[3:], ['example-01'], solutions_dir=str(tmp_path / 'empty'),
+                            log=open(os.devnull, 'w'))
+    assert [(result.steps, result.status) for result in results] == [(None, 'Failed')]
+    assert not (tmp_path / 'empty' / 'example-01.sol').exists()
+
+    # Nothing beats the stored solution now
+    results = run_portfolio(strategies[:1], ['example-01'], solutions_dir=str(solutions), log=open(os.devnull, 'w'))
+    assert [(result.steps, result.status, result.strategy) for result in results] == [(48, 'Kept', None)]
@@ -0,0 +1,90 @@
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+sys.path.append('lib/')
+import pytest
+import scorer
+from engine import Engine
+from scorer import best_scores, open_db, save_scores, score_files, score_moves, validate
+from task import load_task
+
+def read_moves(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def test_validate():
+    engine = Engine(backend='sim')
+    task = load_task('example-01')
+    assert validate(engine, task, read_moves('data/example-01-1.sol')) == ('WIN', 48)
+    assert validate(engine, task, 'WWW') == ('OK', 3)
+    assert validate(engine, task, 'B(1,2)') == ('error: Invalid state', 0)
+
+def test_validate_clones():
+    engine = Engine(backend='sim')
+    task = load_task('example-01')
+    assert validate(engine, load_task('example-03'), read_moves('data/example-03-1.sol')) == ('WIN', 28)
+    # Moves for a second worker without a clone booster to make it
+    assert validate(engine, task, 'WW#DD')[0].startswith('error')
+
+def test_score_moves_counts_ticks(monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    # The longest worker has 23 actions, clones start late
+    score = score_moves('example-03', read_moves('data/example-03-1.sol'), 'manual')
+    assert (score.steps, score.valid) == (28, True)
+
+def test_score_files(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    good = tmp_path / 'example-01.sol'
+    good.write_text(read_moves('data/example-01-1.sol') + '\n')
+    bad = tmp_path / 'tmp-example-01.sol'
+    bad.write_text('WWW\n')
+    db_path = str(tmp_path / 'scores.sqlite')
+    entries = [(str(good), 'manual'), (str(bad), 'manual')]
+
+    scores = score_files(entries, db_path, jobs=1, log=open(os.devnull, 'w'))
+    assert sorted((score.steps, score.valid) for score in scores) == [(3, False), (48, True)]
+    # Nothing changed, nothing to do
+    assert score_files(entries, db_path, jobs=1) == []
+    assert best_scores(db_path) == { 'example-01': (48, 'manual') }
+
+def crash_on_www(problem, moves, bot):
+    if moves == 'WWW':
+        os._exit(1)
+    return score_moves(problem, moves, bot)
+
+def test_score_files_keeps_finished_scores(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    good = tmp_path / 'example-01.sol'
+    good.write_text(read_moves('data/example-01-1.sol') + '\n')
+    bad = tmp_path / 'tmp-example-01.sol'
+    bad.write_text('WWW\n')
+    db_path = str(tmp_path / 'scores.sqlite')
+    entries = [(str(good), 'manual'), (str(bad), 'manual')]
+
+    # The replay of bad takes its worker down and breaks the pool
+    monkeypatch.setattr(scorer, 'score_moves', crash_on_www)
+    with pytest.raises(BrokenProcessPool):
+        score_files(entries, db_path, jobs=1, log=open(os.devnull, 'w'))
+    monkeypatch.undo()
+    assert best_scores(db_path) == { 'example-01': (48, 'manual') }
+    # Only bad is replayed again
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    scores = score_files(entries, db_path, jobs=1, log=open(os.devnull, 'w'))
+    assert [(score.steps, score.valid) for score in scores] == [(3, False)]
+
+def test_save_scores(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    db_path = str(tmp_path / 'scores.sqlite')
+    moves = read_moves('data/example-01-1.sol')
+    save_scores([score_moves('example-01', moves, 'vaea-0'), score_moves('example-01', 'WWW', 'sweep')], db_path)
+    assert best_scores(db_path) == { 'example-01': (48, 'vaea-0') }
+
+def test_open_db_drops_old_scores(tmp_path, monkeypatch):
+    monkeypatch.setenv('VAEA_BACKEND', 'sim')
+    db_path = str(tmp_path / 'scores.sqlite')
+    save_scores([score_moves('example-01', read_moves('data/example-01-1.sol'), 'vaea-0')], db_path)
+    assert best_scores(db_path) == { 'example-01': (48, 'vaea-0') }
+    db = open_db(db_path)
+    db.execute('PRAGMA user_version = 0')
+    db.close()
+    assert best_scores(db_path) == {}
@@ -0,0 +1,377 @@
+# Differential tests between the simulator and game_engine/engine.native
+#
+# The engine comparisons are skipped when engine.native has not been built.
+# Only the smaller problems are replayed by default, set VAEA_DIFF_ALL=1 to
+# replay every file under solutions/.
+
+import glob
+import io
+import os
+import re
+import struct
+import sys
+sys.path.append('lib/')
+import numpy as np
+import pytest
+from engine import ENGINE_PATH, Engine, EngineError, EnginePool, decode_frame, read_frame
+from solution import split_moves
+from task import FREE, load_task
+
+needs_engine = pytest.mark.skipif(not os.path.exists(ENGINE_PATH), reason="engine.native not built")
+
+def example_solutions():
+    return sorted(glob.glob('data/example-*.sol'))
+
+def archived_solutions():
+    paths = sorted(glob.glob('solutions/prob-*.sol') + glob.glob('solutions/tmp/prob-*.sol'))
+    if not os.environ.get('VAEA_DIFF_ALL'):
+        paths = [path for path in paths if int(re.search(r'prob-(\d+)', path).group(1)) <= 50]
+    return paths
+
+def problem_for(path):
+    return re.search(r'((?:example|prob)-\d+)', os.path.basename(path)).group(1)
+
+def read_moves(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def engines(problem, delta=True):
+    task = load_task(problem)
+    return Engine(backend='native', delta=delta).load(task), Engine(backend='sim', delta=delta).load(task)
+
+def test_example_wins_in_simulator():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    data = engine.do_moves(read_moves('data/example-01-1.sol'))
+    assert data["status"] == "WIN"
+    assert data["remaining"] == 0
+    assert len(engine.unwrapped) == 0
+
+def test_simulator_errors_like_engine():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    data = engine.action("B(1,2)")
+    assert data["status"] == "error: Invalid state"
+    data = engine.action("A")
+    assert data["status"] == "error: Invalid state"
+    assert engine.position == [0, 0]
+    with pytest.raises(EngineError):
+        engine.action("L")
+
+def test_simulator_restores_branches():
+    # Actions change the grid in place, restore has to undo one branch and
+    # redo the other
+    moves = split_moves(read_moves('data/example-01-1.sol'))
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    start = engine.snapshot()
+    engine.do_moves(''.join(moves[:20]))
+    first = engine.snapshot()
+    unwrapped = set(engine.unwrapped)
+    engine.restore(start)
+    engine.do_moves('WWWWEE')
+    engine.restore(first)
+    assert engine.unwrapped == unwrapped
+    data = engine.do_moves(''.join(moves[20:]))
+    assert data["status"] == "WIN"
+    # A move into a wall leaves the grid as it was
+    engine.restore(start)
+    assert engine.action('A')["status"] == "error: Invalid state"
+    assert engine.get_unwrapped()["unwrapped_count"] == len(engine.unwrapped)
+
+@needs_engine
+@pytest.mark.parametrize('path', example_solutions())
+def test_example_step_by_step(path):
+    native, sim = engines(problem_for(path), delta=False)
+    for action in split_moves(read_moves(path).split('#')[0]):
+        try:
+            expected = native.action(action)
+        except EngineError:
+            with pytest.raises(EngineError):
+                sim.action(action)
+            return
+        assert sim.action(action) == expected
+
+@needs_engine
+@pytest.mark.parametrize('path', archived_solutions())
+def test_archived_solution(path):
+    native, sim = engines(problem_for(path))
+    moves = read_moves(path)
+    assert sim.do_moves(moves) == native.do_moves(moves)
+    expected = native.get_state()
+    actual = sim.get_state()
+    native.close()
+    assert actual == expected
+
+@needs_engine
+def test_malformed_moves_match_engine():
+    native, sim = engines('example-01')
+    for engine in (native, sim):
+        engine.do_moves('WW')
+    request = { "cmd": "do_moves", "moves": "DDB(1,2" }
+    expected = native.command(request)
+    assert expected["executed"] == 0
+    assert expected["status"] == "error: Unterminated action: B(1,2"
+    assert sim.command(request) == expected
+    assert sim.get_state() == native.get_state()
+    assert native.get_state()["status"] == "OK"
+    native.close()
+
+def test_snapshot_restore():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    unwrapped = set(engine.unwrapped)
+    handle = engine.snapshot()
+    engine.do_moves("WWDDSQE")
+    assert engine.unwrapped != unwrapped
+    data = engine.restore(handle)
+    assert data["reverted_cells"]
+    assert engine.unwrapped == unwrapped
+    assert engine.position == [0, 0]
+    assert engine.solution() == ""
+    assert engine.restore(handle)["wrapped_cells"] == []
+    engine.drop(handle)
+    assert engine.restore(handle)["status"] == "error: Unknown snapshot: 0"
+
+@needs_engine
+def test_snapshot_restore_matches_engine():
+    native, sim = engines('example-01')
+    moves = read_moves('data/example-01-1.sol')
+    for engine in (native, sim):
+        engine.do_moves(moves[0:20])
+        engine.snapshot()
+        engine.do_moves(moves[20:])
+    assert sim.restore(0) == native.restore(0)
+    assert sim.unwrapped == native.unwrapped
+    native.close()
+
+@needs_engine
+def test_checkpoints_shared_between_backends(tmp_path):
+    native, sim = engines('example-01')
+    moves = read_moves('data/example-01-1.sol')
+    native.do_moves(moves[0:20])
+    native.save_checkpoint(str(tmp_path / 'native.ckpt'))
+    sim.do_moves(moves[0:30])
+    sim.save_checkpoint(str(tmp_path / 'sim.ckpt'))
+    native.load_checkpoint(str(tmp_path / 'sim.ckpt'))
+    sim.load_checkpoint(str(tmp_path / 'native.ckpt'))
+    assert native.solution() == moves[0:30]
+    assert sim.solution() == moves[0:20]
+    sim.load_checkpoint(str(tmp_path / 'sim.ckpt'))
+    assert sim.get_state() == native.get_state()
+    # The same state makes the same file
+    sim.save_checkpoint(str(tmp_path / 'sim.ckpt'))
+    native.save_checkpoint(str(tmp_path / 'native.ckpt'))
+    assert (tmp_path / 'sim.ckpt').read_bytes() == (tmp_path / 'native.ckpt').read_bytes()
+    native.close()
+
+def test_load_state_keeps_moves():
+    moves = read_moves('data/example-01-1.sol')
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    engine.do_moves(moves[0:20])
+    state = engine.get_state()
+    other = Engine(backend='sim').load(load_task('example-01'))
+    assert other.load_state(state)["status"] == "error: Missing action_string"
+    data = other.load_state(state, engine.get_actions()["action_string"])
+    assert data["action_count"] == state["action_count"]
+    assert other.solution() == moves[0:20]
+    assert other.do_moves(moves[20:])["status"] == "WIN"
+    assert other.solution() == moves
+
+@needs_engine
+def test_load_state_matches_engine():
+    native, sim = engines('example-01')
+    moves = read_moves('data/example-01-1.sol')
+    sim.do_moves(moves[0:20])
+    state = sim.get_state()
+    assert native.load_state(state)["status"] == "error: Missing action_string"
+    native.load_state(state, sim.get_actions()["action_string"])
+    assert native.get_state() == sim.get_state()
+    assert native.solution() == sim.solution()
+    native.close()
+
+def test_get_unwrapped():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    engine.do_moves("WWDDSQE")
+    data = engine.get_unwrapped(radius=3, regions=True)
+    assert data["unwrapped_count"] == len(engine.unwrapped)
+    x, y = engine.position
+    assert set(map(tuple, data["cells"])) == \
+        set(cell for cell in engine.unwrapped if abs(cell[0] - x) + abs(cell[1] - y) <= 3)
+    assert sum(n for rx, ry, n in data["regions"]) == len(engine.unwrapped)
+    assert "cells" not in engine.get_unwrapped()
+
+@needs_engine
+def test_get_unwrapped_matches_engine():
+    native, sim = engines('example-01')
+    for engine in (native, sim):
+        engine.do_moves("WWDDSQE")
+    for query in ({}, { "radius": 4 }, { "radius": 2, "center": [5, 5], "regions": True }):
+        assert sim.get_unwrapped(**query) == native.get_unwrapped(**query)
+    native.close()
+
+def clone_task():
+    return {
+        "contour": [[0, 0], [6, 0], [6, 6], [0, 6]],
+        "initial_loc": [0, 0],
+        "obstacles": [],
+        "boosters": [[1, 0, "C"], [2, 0, "X"], [3, 0, "R"]],
+    }
+
+def test_clone_and_teleport():
+    engine = Engine(backend='sim').load(clone_task())
+    engine.do_moves("DD")
+    assert engine.inventory == ["C"]
+    engine.action("C")
+    assert len(engine.workers) == 2
+    data = engine.tick(["D", "W"])
+    assert data["workers"][1]["position"] == [2, 1]
+    engine.action("R")
+    engine.tick(["A", "W"])
+    engine.action("T(3,0)", worker=1)
+    assert engine.workers[1]["position"] == [3, 0]
+    assert engine.tick(["A", "A", "A"])["status"] == "error: Too many actions"
+    assert engine.tick([None, "E"])["status"] == "OK"
+    assert engine.solution() == "DDCDRAZ#WWT(3,0)E"
+    assert engine.get_actions()["action_string"] == engine.solution()
+    assert engine.get_state()["action_count"] == 11
+
+@needs_engine
+def test_clone_and_teleport_match_engine():
+    task = clone_task()
+    native = Engine(backend='native').load(task)
+    sim = Engine(backend='sim').load(task)
+    for engine in (native, sim):
+        engine.do_moves("DDC")
+        engine.tick(["D", "W"])
+        engine.action("R")
+        engine.tick(["A", "W"])
+        engine.action("T(3,0)", worker=1)
+        engine.tick([None, "E"])
+    assert sim.get_state() == native.get_state()
+    native.close()
+
+def test_binary_framing():
+    engine = Engine(backend='sim', framing='binary').load(load_task('example-01'))
+    engine.do_moves("WWDD")
+    unwrapped = set(engine.unwrapped)
+    data = engine.get_state()
+    assert "map" not in data and "unwrapped_cells" not in data
+    assert data["grid"].shape == (data["map_width"], data["map_height"])
+    engine.update(data)
+    assert engine.unwrapped == unwrapped
+
+def test_decode_frame():
+    header = b'{"status": "OK", "map_width": 2, "map_height": 3}'
+    frame = struct.pack('>I', len(header)) + header + struct.pack('>I', 6) + bytes([0, 1, 2, 3, 2, 2])
+    data = decode_frame(*read_frame(io.BytesIO(frame)))
+    assert data["status"] == "OK"
+    assert data["grid"].tolist() == [[0, 1, 2], [3, 2, 2]]
+    with pytest.raises(EngineError):
+        read_frame(io.BytesIO(frame[:-1]))
+
+@needs_engine
+def test_binary_framing_matches_engine():
+    task = load_task('example-01')
+    native = Engine(backend='native', framing='binary').load(task)
+    sim = Engine(backend='sim', framing='binary').load(task)
+    for engine in (native, sim):
+        engine.do_moves("WWDDSQE")
+    native_state, sim_state = native.get_state(), sim.get_state()
+    assert (native_state.pop("grid") == sim_state.pop("grid")).all()
+    assert native_state == sim_state
+    assert native.unwrapped == sim.unwrapped
+    native.close()
+
+def test_shared_grid(tmp_path):
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    shared = engine.share_grid(str(tmp_path / 'grid'))
+    assert shared.unwrapped_count() == len(engine.unwrapped)
+    generation = shared.generation
+    engine.do_moves("WWDD")
+    assert shared.generation > generation
+    assert shared.action_count == 4
+    assert set(map(tuple, np.argwhere(shared.read() == FREE).tolist())) == engine.unwrapped
+    handle = engine.snapshot()
+    engine.do_moves("DDDD")
+    engine.restore(handle)
+    assert set(map(tuple, np.argwhere(shared.read() == FREE).tolist())) == engine.unwrapped
+
+    # Only the cells an action changed are written, not the whole grid
+    writable = np.memmap(shared.path, dtype=np.uint8, mode='r+')
+    writable[-1] = 0xff
+    engine.do_moves("W")
+    assert shared.grid[-1, -1] == 0xff
+    del writable
+
+    # A new map of another size is shared again at the same path
+    engine.load(clone_task())
+    assert engine.shared_grid.grid.shape == (6, 6)
+    assert engine.shared_grid.unwrapped_count() == len(engine.unwrapped)
+    engine.close()
+
+def test_shared_grid_read_gives_up_on_a_dead_writer(tmp_path):
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    shared = engine.share_grid(str(tmp_path / 'grid'))
+    # A writer that stopped halfway leaves the generation odd
+    header = np.memmap(shared.path, dtype='<u4', mode='r+', shape=(8,))
+    header[4] += 1
+    with pytest.raises(TimeoutError):
+        shared.read(timeout=0.05)
+    header[4] += 1
+    assert set(map(tuple, np.argwhere(shared.read() == FREE).tolist())) == engine.unwrapped
+    del header
+    engine.close()
+
+def test_shared_grid_removed_on_close():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    path = engine.share_grid().path
+    assert os.path.exists(path)
+    engine.close()
+    assert not os.path.exists(path)
+
+@needs_engine
+def test_shared_grid_matches_engine(tmp_path):
+    native, sim = engines('example-01')
+    grids = [engine.share_grid(str(tmp_path / name)) for engine, name in ((native, 'native'), (sim, 'sim'))]
+    for engine in (native, sim):
+        engine.do_moves("WWDDSQE")
+    assert (grids[0].read() == grids[1].read()).all()
+    assert grids[0].action_count == grids[1].action_count
+    for engine in (native, sim):
+        handle = engine.snapshot()
+        engine.do_moves("WWWW")
+        engine.restore(handle)
+    assert (grids[0].read() == grids[1].read()).all()
+    assert grids[0].generation == grids[1].generation
+    native.close()
+
+def test_state_string_viewport():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    engine.do_moves("WWDD")
+    assert "state_string" not in engine.get_state()
+    full = engine.get_state_string()["state_string"].splitlines()
+    x, y = engine.position
+    assert full[len(full) - 1 - y][x] == '>'
+    data = engine.get_state_string(radius=1)
+    assert data["viewport"] == [x - 1, y - 1, x + 1, y + 1]
+    assert data["state_string"].splitlines() == [row[x - 1:x + 2] for row in full[len(full) - 2 - y:len(full) + 1 - y]]
+    # Clipped to the map
+    data = engine.get_state_string(viewport=[-5, -5, 1, 0])
+    assert data["viewport"] == [0, 0, 1, 0]
+    assert data["state_string"] == full[-1][0:2] + "\n"
+
+@needs_engine
+def test_state_string_matches_engine():
+    native, sim = engines('example-01')
+    for engine in (native, sim):
+        engine.do_moves("WWDDSQE")
+    for query in ({}, { "radius": 2 }, { "viewport": [3, -2, 20, 4] }, { "radius": 1, "center": [0, 0] }):
+        assert sim.get_state_string(**query) == native.get_state_string(**query)
+    native.close()
+
+def test_pool_forgets_released_engines():
+    task = load_task('example-01')
+    with EnginePool(size=1, backend='sim') as pool:
+        first, second = pool.acquire(task), pool.acquire(task)
+        pool.release(first)
+        # The pool is full, this one is closed and forgotten
+        pool.release(second)
+        assert pool.engines == [first]
+        assert not second.alive()
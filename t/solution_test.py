@@ -0,0 +1,102 @@
+import sys
+sys.path.append('lib/')
+import engine as engine_module
+from engine import Engine
+from solution import SolutionWriter, journal_path, read_journal, split_moves
+from task import load_task
+
+def read_moves(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def test_journal(tmp_path):
+    path = str(tmp_path / 'prob-001.sol')
+    writer = SolutionWriter(path, checkpoint_interval=2)
+    writer.write(0, ['W', 'B(1,2)'])
+    writer.write(1, ['D'])
+    writer.truncate(2)
+    writer.write(0, ['Q'])
+    writer.close()
+    assert read_journal(path) == [(0, 'W'), (0, 'B(1,2)'), (0, 'Q')]
+
+    # A line cut short by a crash is ignored
+    with open(journal_path(path), 'a') as f:
+        f.write("0 WWS")
+    assert read_journal(path) == [(0, 'W'), (0, 'B(1,2)'), (0, 'Q')]
+
+def test_engine_streams_and_resumes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'example-01.sol')
+    monkeypatch.setenv('VAEA_SOLUTION_FILE', path)
+    task = load_task('example-01')
+    moves = read_moves('data/example-01-1.sol')
+
+    engine = Engine(backend='sim').load(task)
+    engine.do_moves(moves[0:10])
+    handle = engine.snapshot()
+    engine.do_moves('WWWW')
+    engine.restore(handle)
+    engine.close()
+    assert ''.join(action for worker, action in read_journal(path)) == moves[0:10]
+
+    monkeypatch.setenv('VAEA_RESUME', '1')
+    engine = Engine(backend='sim').load(task)
+    assert engine.solution() == moves[0:10]
+    engine.do_moves(moves[10:])
+    assert engine.status == 'WIN'
+    assert read_moves(path) == moves
+    assert read_journal(path) == []
+
+def test_engine_resumes_from_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / 'example-01.sol')
+    monkeypatch.setenv('VAEA_SOLUTION_FILE', path)
+    monkeypatch.setattr(engine_module, 'CHECKPOINT_MOVES', 8)
+    task = load_task('example-01')
+    actions = split_moves(read_moves('data/example-01-1.sol'))
+
+    engine = Engine(backend='sim').load(task)
+    engine.do_moves(actions[0:10])
+    engine.do_moves(actions[10:12])
+    engine.close()
+
+    monkeypatch.setenv('VAEA_RESUME', '1')
+    replayed = []
+    monkeypatch.setattr(Engine, 'replay', lambda self, actions: replayed.extend(actions))
+    engine = Engine(backend='sim').load(task)
+    # The checkpoint was taken after the first 10 moves, only 2 are replayed
+    assert engine.solution() == ''.join(actions[0:10])
+    assert [action for worker, action in replayed] == actions[10:12]
+    engine.close()
+
+    # A restore back past the checkpoint makes it useless
+    with open(path + '.log', 'a') as f:
+        f.write("@ 4\n")
+    replayed.clear()
+    engine = Engine(backend='sim').load(task)
+    assert engine.solution() == ''
+    assert [action for worker, action in replayed] == actions[0:4]
+
+def test_checkpoint_file(tmp_path):
+    path = str(tmp_path / 'example-01.ckpt')
+    actions = split_moves(read_moves('data/example-01-1.sol'))
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    engine.do_moves(actions[0:20])
+    state = engine.get_state()
+    engine.save_checkpoint(path)
+    with open(path, 'rb') as f:
+        assert f.read(8) == b'VAEACKPT'
+
+    engine.load(load_task('example-01'))
+    data = engine.load_checkpoint(path)
+    assert data["status"] == "OK"
+    assert engine.get_state() == state
+    assert engine.solution() == ''.join(actions[0:20])
+
+    engine.load(load_task('prob-002'))
+    assert engine.load_checkpoint(path)["status"] == "error: Checkpoint of another map"
+    with open(path, 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        f.write(content[:-1])
+    engine.load(load_task('example-01'))
+    assert engine.load_checkpoint(path)["status"] == "error: Invalid checkpoint"
+    engine.close()
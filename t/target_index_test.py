@@ -0,0 +1,50 @@
+import random
+import sys
+sys.path.append('lib/')
+from engine import Engine
+from target_index import TargetIndex
+from task import load_task
+
+def brute_force(cells, point, k):
+    return sorted((abs(x - point[0]) + abs(y - point[1]), (x, y)) for x, y in cells)[:k]
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(1)
+    cells = set((rng.randrange(200), rng.randrange(150)) for i in range(3000))
+    index = TargetIndex(cells, bucket_size=8)
+    for i in range(200):
+        point = (rng.randrange(-10, 210), rng.randrange(-10, 160))
+        k = rng.choice([1, 3, 20])
+        assert index.nearest(point, k) == brute_force(cells, point, k)
+        # Wrap a few cells as we go
+        for cell in rng.sample(sorted(cells), 10):
+            index.discard(cell)
+            cells.discard(cell)
+    assert len(index) == len(cells)
+    assert set(index) == cells
+
+def test_empty_and_readd():
+    index = TargetIndex()
+    assert index.nearest((0, 0)) == []
+    assert index.nearest_one((0, 0)) is None
+    index.add([3, 4])
+    index.add((3, 4))
+    assert len(index) == 1
+    assert [3, 4] in index
+    index.discard((3, 4))
+    index.discard((3, 4))
+    assert len(index) == 0
+    assert index.nearest_one((0, 0)) is None
+    index.add((40, 1))
+    assert index.nearest_one((0, 0)) == (40, 1)
+
+def test_engine_nearest_unwrapped():
+    engine = Engine(backend='sim').load(load_task('example-01'))
+    for i in range(5):
+        distance, cell = engine.nearest_unwrapped()[0]
+        assert brute_force(engine.unwrapped, engine.position, 1) == [(distance, cell)]
+        engine.do_moves(engine.get_path(cell))
+    handle = engine.snapshot()
+    engine.do_moves('WWDD')
+    engine.restore(handle)
+    assert set(engine.unwrapped_index) == engine.unwrapped
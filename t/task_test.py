@@ -0,0 +1,48 @@
+import sys
+sys.path.append('lib/')
+from task import FREE, OBSTACLE, WALL, grid_to_string, load_grid, load_task, parse_desc, rasterize
+from solution import split_moves
+
+def test_parse_desc():
+    task = parse_desc("(0,0),(10,0),(10,10),(0,10)#(0,0)#(4,2),(6,2),(6,7),(4,7);(5,8),(6,8),(6,9),(5,9)#B(0,1);F(0,2);X(0,9)\n")
+    assert task["contour"] == [[0,0], [10,0], [10,10], [0,10]]
+    assert task["initial_loc"] == [0,0]
+    assert task["obstacles"] == [[[4,2], [6,2], [6,7], [4,7]], [[5,8], [6,8], [6,9], [5,9]]]
+    assert task["boosters"] == [[0,1,"B"], [0,2,"F"], [0,9,"X"]]
+
+def test_parse_desc_empty_sections():
+    task = parse_desc("(0,0),(3,0),(3,3),(0,3)#(1,1)##")
+    assert task["obstacles"] == []
+    assert task["boosters"] == []
+
+def test_load_task():
+    task = load_task('t/check_manips.desc')
+    assert task["initial_loc"] == [0,0]
+    assert len(task["boosters"]) == 10
+    assert load_task('prob-001') == load_task('prob-001.desc')
+
+def test_split_moves():
+    assert split_moves("WDB(1,-2)QF") == ["W", "D", "B(1,-2)", "Q", "F"]
+
+def test_rasterize():
+    task = parse_desc("(0,0),(4,0),(4,2),(2,2),(2,3),(0,3)#(0,0)#(1,0),(2,0),(2,1),(1,1)#")
+    grid = rasterize(task)
+    assert grid.shape == (4, 3)
+    assert grid[1,0] == OBSTACLE
+    assert grid[0,0] == FREE and grid[3,1] == FREE and grid[1,2] == FREE
+    assert grid[2,2] == WALL and grid[3,2] == WALL
+    assert grid_to_string(grid) == "---" "O--" "--W" "--W"
+
+def test_load_grid_cache(tmp_path):
+    text = "(0,0),(3,0),(3,3),(0,3)#(1,1)##"
+    grid = load_grid(None, text, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    assert (load_grid(None, text, cache_dir=str(tmp_path)) == grid).all()
+    assert (grid == FREE).all()
+
+def test_load_task_grid():
+    task = load_task('example-01')
+    assert len(task["grid"]) == 10 * 10
+    # (4,2) is the corner of an obstacle, (0,0) is free
+    assert task["grid"][4 * 10 + 2] == "O"
+    assert task["grid"][0] == "-"